@@ -0,0 +1,190 @@
+"""ANCP asyncio Client
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.client import Client, AdjacencyState, MessageType, TechTypes
+from ancp.protocol import monotonic
+import asyncio
+import socket
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class AsyncClient(Client):
+    """ANCP asyncio Client
+
+    The asyncio client shares the adjacency state machine and message
+    encoding with :class:`ancp.client.Client` but uses asyncio streams
+    instead of a dedicated thread per session. This allows to run thousands
+    of sessions from a single event loop.
+
+    :param address: ANCP server address (IPv4)
+    :type address: str
+    :param port: ANCP port (default: 6086)
+    :type port: int
+    :param tech_type: tech type (default=DSL)
+    :type tech_type: ancp.client.TechTypes
+    :param timer: adjacency timer (default=25.0)
+    :type timer: int
+    :param source_address: optional source address
+    :type source_address: str
+    """
+    def __init__(self, address, port=6068, tech_type=TechTypes.DSL, timer=25.0, source_address=None):
+        super(AsyncClient, self).__init__(address, port=port, tech_type=tech_type,
+                                          timer=timer, source_address=source_address)
+        if not self.source_address:
+            # socket is created by asyncio in connect method
+            self.socket.close()
+        self.socket = None
+        self._reader = None
+        self._writer = None
+        self._tasks = []
+        self._window_event = None
+        self._loop = None
+
+    def __repr__(self):
+        if self.source_address:
+            return "AsyncClient(%s:%s, %s)" % (self.address, self.port, self.source_address)
+        else:
+            return "AsyncClient(%s:%s)" % (self.address, self.port)
+
+    async def connect(self, timeout=6.0):
+        """connect
+
+        :param timeout: time to wait for adjacency (default=6.0)
+        :type timeout: float
+        :return: True if adjacency is established
+        :rtype: bool
+        """
+        self.established = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        local_addr = (self.source_address, 0) if self.source_address else None
+        self._reader, self._writer = await asyncio.open_connection(self.address, self.port, local_addr=local_addr)
+        sock = self._writer.get_extra_info("socket")
+        self.chunk_size = max(sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF), 4096)
+        self.initiate()
+        await self._writer.drain()
+        self._tasks = [asyncio.ensure_future(self._handle()),
+                       asyncio.ensure_future(self._keepalive())]
+        try:
+            await asyncio.wait_for(self.established.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.established.is_set()
+
+    async def disconnect(self, send_ack=False):
+        """disconnect"""
+        if send_ack:
+            self._send_ack()
+        else:
+            self._send_rstack()
+        await self._writer.drain()
+        # wait up to 1 second for response
+        await asyncio.wait(self._tasks[:1], timeout=1.0)
+        self._close()
+
+    async def port_up(self, subscribers):
+        """send port-up message
+
+        :param subscriber: collection of ANCP subscribers
+        :type subscriber: [ancp.subscriber.Subscriber]
+        """
+        for buffers in self._port_updown(MessageType.PORT_UP, subscribers):
+            self._writer.writelines(buffers)
+            await self._writer.drain()
+            await self._wait_window_async()
+
+    async def port_down(self, subscribers):
+        """send port-down message
+
+        :param subscriber: collection of ANCP subscribers
+        :type subscriber: [ancp.subscriber.Subscriber]
+        """
+        for buffers in self._port_updown(MessageType.PORT_DOWN, subscribers):
+            self._writer.writelines(buffers)
+            await self._writer.drain()
+            await self._wait_window_async()
+
+    async def keepalive(self):
+        """send keep-alive (SYN) message"""
+        self._send_syn()
+        await self._writer.drain()
+
+    # internal methods --------------------------------------------------------
+
+    async def _handle(self):
+        """RX Task"""
+        while True:
+            try:
+                b = await self._reader.read(65536)
+            except ConnectionError:
+                b = b''
+            try:
+                self.receive_data(b)
+            except ValueError:
+                break
+            if self.closed or self._writer.is_closing():
+                break
+            await self._writer.drain()
+        self.established.clear()
+
+    async def _keepalive(self):
+        """Adjacency Timer Task"""
+        while not self._writer.is_closing():
+            deadline = self.next_deadline()
+            if deadline is None:
+                await asyncio.sleep(self.timeout)
+            else:
+                await asyncio.sleep(max(deadline - monotonic(), 0))
+            if self._writer.is_closing():
+                break
+            self.handle_timer()
+            await self._writer.drain()
+
+    async def _wait_window_async(self):
+        if self.window is None:
+            return
+        while len(self.transactions) >= self.window and not self._writer.is_closing():
+            self._window_event = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._window_event.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _window_open(self):
+        # called from RX and timer task of the same event loop
+        if self._window_event is not None:
+            self._window_event.set()
+
+    def _sendall(self, b, priority=False):
+        self._writer.write(b)
+
+    def _sendall_threadsafe(self, b):
+        # called from OAM workers, streams are only written by the event loop
+        try:
+            self._loop.call_soon_threadsafe(self._write_open, b)
+        except RuntimeError:
+            log.warning("event loop closed: message dropped")
+
+    def _write_open(self, b):
+        if not self._writer.is_closing():
+            self._writer.write(b)
+
+    def _sendmsg(self, buffers):
+        # buffers of frame templates are patched in place and must be copied
+        self._writer.writelines(bytes(b) if isinstance(b, memoryview) else b for b in buffers)
+
+    def _handle_rstack(self):
+        log.debug("RSTACK received with current state %d", self.state)
+        if self.state != AdjacencyState.SYNSENT:
+            self._send_ack()
+            self._close()
+
+    def _close(self):
+        for task in self._tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+        self._writer.close()
+        self.established.clear()
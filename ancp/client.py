@@ -7,84 +7,54 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from builtins import bytes
 from ancp.subscriber import Subscriber
-from datetime import datetime
-from threading import Thread, Event, Lock
-import struct
+from ancp.protocol import (VERSION_RFC, MessageType, AdjacencyState, MessageCode,
+                           TechTypes, ResultFields, ResultCodes, Capabilities,
+                           Protocol, ReceiveBuffer, IOV_MAX, tomac, tosender, clock, monotonic)
+from ancp.pcap import PcapWriter
+from ancp.state import StateStore, Frame
+from ancp.timer import shared_wheel
+from ancp.transmit import TransmitQueue, MSG_DONTWAIT
+from threading import Thread, Event, Lock, RLock, current_thread
 import socket
+import random
 import logging
 
 try:
-    from collections.abc import Iterable
+    from collections.abc import Sized
 except ImportError:
-    from collections import Iterable
+    from collections import Sized
 
 log = logging.getLogger(__name__)
 
 
-VERSION_RFC = 50
-
-
-class MessageType(object):
-    ADJACENCY = 10
-    PORT_MANAGEMENT = 32
-    PORT_UP = 80
-    PORT_DOWN = 81
-    ADJACENCY_UPDATE = 85
-
-
-class AdjacencyState(object):
-    IDLE = 1
-    SYNSENT = 2
-    SYNRCVD = 3
-    ESTAB = 4
-
-
-class MessageCode(object):
-    SYN = 1
-    SYNACK = 2
-    ACK = 3
-    RSTACK = 4
-
-
-class TechTypes(object):
-    ANY = 0
-    PON = 1
-    DSL = 5
-
-
-class ResultFields(object):
-    Ignore = 0x00
-    Nack = 0x01
-    AckAll = 0x02
-    Success = 0x03
-    Failure = 0x04
-
-
-class ResultCodes(object):
-    NoResult = 0x000
-
-
-class Capabilities(object):
-    TOPO = 1
-    OAM = 4
-
-
 # HELPER FUNCTIONS AND CALSSES ------------------------------------------------
 
-def tomac(v):
-    """Tuple to MAC Address
+def sendmsgall(sock, buffers):
+    """Send all buffers using scatter-gather IO (sendmsg)
+
+    Buffers are sent without copying them into a single buffer.
+    Partially sent buffers are continued using memoryview slices.
 
-    :param v: MAC address
-    :type v: tuple
-    :return: MAC address
-    :rtype: str
+    :param sock: connected socket
+    :type sock: socket.socket
+    :param buffers: buffers to be sent
+    :type buffers: [bytes]
     """
-    return "%02x:%02x:%02x:%02x:%02x:%02x" % v
+    buffers = list(buffers)
+    while buffers:
+        sent = sock.sendmsg(buffers[:IOV_MAX])
+        i = 0
+        while i < len(buffers) and sent >= len(buffers[i]):
+            sent -= len(buffers[i])
+            i += 1
+        del buffers[:i]
+        if sent:
+            buffers[0] = memoryview(buffers[0])[sent:]
 
 
 # ANCP CLIENT -----------------------------------------------------------------
 
-class Client(object):
+class Client(Protocol):
     """ANCP Client
 
     :param address: ANCP server address (IPv4)
@@ -102,33 +72,46 @@ class Client(object):
         self.address = str(address)
         self.port = port
         self.source_address = str(source_address) if source_address else None
-
-        self.timer = timer  # adjacency timer
-        self.timeout = 1.0  # socket timeout
-        self._last_syn_time = None
-        self._tx_lock = Lock()
-
-        self.established = Event()
-        self.version = VERSION_RFC
-        self.tech_type = tech_type
-        self.state = AdjacencyState.IDLE
-        self.capabilities = [Capabilities.TOPO]
-        self.transaction_id = 1
         if self.source_address:
             # create sender_name from source_address
-            _sender_name = [int(i) for i in source_address.split(".")]
-            _sender_name.extend([0, 0])
-            self.sender_name = tuple(_sender_name)
+            sender_name = tosender(self.source_address)
             # TCP socket is created in connect method
         else:
-            self.sender_name = (1, 2, 3, 4, 5, 6)
+            sender_name = (1, 2, 3, 4, 5, 6)
             # create TCP socket
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sender_instance = 16777217
-        self.sender_port = 0
-        self.receiver_name = (0, 0, 0,  0, 0, 0)
-        self.receiver_instance = 0
-        self.receiver_port = 0
+        super(Client, self).__init__(tech_type=tech_type, timer=timer, sender_name=sender_name)
+
+        self.timeout = 1.0  # socket timeout
+        self._tx_lock = Lock()
+        # adjacency timer in the timer wheel shared by all clients
+        self._timer = None
+        self._timer_lock = RLock()
+        # messages of the timer wheel not sent without blocking
+        self._deferred = bytearray()
+        self._deferred_lock = Lock()
+        self._retry = None
+        self.established = Event()
+        # send port up/down messages using scatter-gather IO (sendmsg)
+        self.scatter_gather = False
+        # automatic reconnect (see auto_reconnect)
+        self.reconnect = False
+        self.reconnect_backoff = 0.5
+        self.reconnect_max_backoff = 30.0
+        self.reconnect_jitter = 0.5
+        self.reconnects = 0
+        self.store = None           # active ports replayed after reconnect
+        self.resync_time = None     # seconds to replay active ports
+        self.resynced = Event()
+        self._resync_pending = False
+        self._closed = Event()
+        self._reset = False         # RSTACK received
+        # prioritized transmit queue (see transmit_queue)
+        self.tx_queue = None        # ancp.transmit.TransmitQueue
+        self._tx_queue_config = None
+        # packet capture (see start_capture)
+        self.capture = None         # ancp.pcap.PcapWriter
+        self._endpoints = None      # (local, remote) socket address
 
     def __repr__(self):
         if self.source_address:
@@ -138,13 +121,8 @@ class Client(object):
 
     def connect(self):
         """connect"""
-        if self.source_address:
-            self.socket = socket.create_connection((self.address, self.port), source_address=(self.source_address, 0))
-        else:
-            self.socket.connect((self.address, self.port))
-        self.socket.setblocking(True)
-        self.socket.settimeout(self.timeout)
-        self._send_syn()
+        self._closed.clear()
+        self._open(None if self.source_address else self.socket)
         # rx / tx thread
         self._thread = Thread(target=self._handle, name="handle")
         self._thread.setDaemon(True)
@@ -161,260 +139,503 @@ class Client(object):
 
     def disconnect(self, send_ack=False):
         """disconnect"""
-        if send_ack:
-            self._send_ack()
-        else:
-            self._send_rstack()
-        self._thread.join(timeout=1.0)
+        self._closed.set()
+        # socket is closed while waiting for reconnect
+        if self.socket.fileno() != -1:
+            try:
+                if send_ack:
+                    self._send_ack()
+                else:
+                    self._send_rstack()
+            except (socket.error, OSError) as e:
+                log.warning("disconnect from %s:%s: %s", self.address, self.port, e)
+        self._close_tx_queue(self.timeout)
+        self._cancel_timer()
+        if current_thread() is not self._thread:
+            self._thread.join(timeout=1.0)
+        try:
+            # wake up RX thread blocked in recv
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except (socket.error, OSError):
+            pass
         self.socket.close()
         self.established.clear()
 
-    def port_up(self, subscribers):
-        """send port-up message
+    def is_established(self):
+        """return True if adjacency is established"""
+        return self.established.is_set()
+
+    def auto_reconnect(self, backoff=0.5, max_backoff=30.0, jitter=0.5, store=None):
+        """enable automatic reconnect
+
+        If the connection is lost, the client reconnects with exponential
+        backoff (randomized by +/- jitter). After the adjacency is
+        established again, all active ports are sent as port up messages
+        in a single stream. The time required is stored in
+        :attr:`resync_time` and :attr:`resynced` is set.
+
+        Ports sent with :meth:`port_up` and :meth:`port_down` are recorded
+        in the state store from now on.
+
+        :param backoff: initial reconnect delay in seconds (default=0.5)
+        :type backoff: float
+        :param max_backoff: max. reconnect delay in seconds (default=30.0)
+        :type max_backoff: float
+        :param jitter: relative jitter of reconnect delay (default=0.5)
+        :type jitter: float
+        :param store: state store of active ports (default: new store)
+        :type store: ancp.state.StateStore
+        """
+        self.reconnect = True
+        self.reconnect_backoff = backoff
+        self.reconnect_max_backoff = max_backoff
+        self.reconnect_jitter = jitter
+        self.store = store if store is not None else StateStore(self)
+
+    def enable_oam(self, dispatcher):
+        """enable OAM capability and handle port management requests
+
+        The OAM capability is announced with the next adjacency and
+        requests are only handled if the peer supports it as well (see
+        :attr:`negotiated`). Responses are sent from the worker threads of
+        the dispatcher holding the transmit lock.
+
+        :param dispatcher: port management handlers
+        :type dispatcher: ancp.oam.OamDispatcher
+        """
+        if Capabilities.OAM not in self.capabilities:
+            self.capabilities.append(Capabilities.OAM)
+        self.oam = dispatcher
+
+    def transmit_queue(self, high_water=4194304, max_write=65536):
+        """send through a prioritized transmit queue
+
+        Messages are sent by a writer thread per connection (see
+        :class:`ancp.transmit.TransmitQueue`). Adjacency messages are sent
+        before queued port up/down messages, so keep-alives do not time out
+        behind bulk sends. Small messages of concurrent threads are
+        coalesced into writes of up to `max_write` bytes. `port_up` and
+        `port_down` only wait if more than `high_water` bytes are queued.
+
+        :param high_water: max. queued bytes before port up/down waits (default=4 MiB)
+        :type high_water: int
+        :param max_write: max. bytes per socket write (default=65536)
+        :type max_write: int
+        """
+        self._tx_queue_config = {"high_water": high_water, "max_write": max_write}
+        if self.state != AdjacencyState.IDLE and self.tx_queue is None:
+            with self._tx_lock:
+                self._flush_deferred()
+                self.tx_queue = TransmitQueue(self.socket, on_write=self._written, **self._tx_queue_config)
+
+    def start_capture(self, path, pcapng=None, queue_size=10000):
+        """capture sent and received messages into pcap or pcapng file
+
+        Files are written by a background thread (see
+        :class:`ancp.pcap.PcapWriter`) so sending is never blocked by
+        disk IO; captures are dropped if the queue is full.
+
+        :param path: file path (pcapng if ending with .pcapng)
+        :type path: str
+        :param pcapng: write pcapng (default: from file extension)
+        :type pcapng: bool
+        :param queue_size: max. number of queued captures (default=10000)
+        :type queue_size: int
+        :rtype: ancp.pcap.PcapWriter
+        """
+        self.stop_capture()
+        writer = PcapWriter(path, pcapng=pcapng, queue_size=queue_size)
+        if self.state != AdjacencyState.IDLE:
+            self._endpoints = (self.socket.getsockname(), self.socket.getpeername())
+        self.capture = writer
+        return writer
+
+    def stop_capture(self):
+        """stop capture and write all queued captures"""
+        writer = self.capture
+        if writer is not None:
+            self.capture = None
+            with self._tx_lock:
+                pass    # wait for running send
+            writer.close()
 
-        For backwards compability single value ANCP subscribers are accepted.
+    def port_up(self, subscribers):
+        """send port-up message (see :meth:`ancp.protocol.Protocol.port_up`)
 
         :param subscriber: collection of ANCP subscribers
         :type subscriber: [ancp.subscriber.Subscriber]
         """
-        if not isinstance(subscribers, Iterable):
-            subscribers = [subscribers]
-        elif len(subscribers) == 0:
-            raise ValueError("No Subscribers passed")
-        self._port_updown(MessageType.PORT_UP, subscribers)
+        if self.store is None:
+            return super(Client, self).port_up(subscribers)
+        if not self._sized(subscribers):
+            # recorded while encoded to keep generators streaming
+            return super(Client, self).port_up(self._recorded(subscribers, True))
+        super(Client, self).port_up(subscribers)
+        self.store.record(subscribers, up=True)
 
     def port_down(self, subscribers):
-        """send port-down message
-
-        For backwards compability single value ANCP subscribers are accepted.
+        """send port-down message (see :meth:`ancp.protocol.Protocol.port_down`)
 
         :param subscriber: collection of ANCP subscribers
         :type subscriber: [ancp.subscriber.Subscriber]
         """
-        if not isinstance(subscribers, Iterable):
-            subscribers = [subscribers]
-        elif len(subscribers) == 0:
-            raise ValueError("No Subscribers passed")
-        self._port_updown(MessageType.PORT_DOWN, subscribers)
+        if self.store is None:
+            return super(Client, self).port_down(subscribers)
+        if not self._sized(subscribers):
+            return super(Client, self).port_down(self._recorded(subscribers, False))
+        super(Client, self).port_down(subscribers)
+        self.store.record(subscribers, up=False)
+
+    def wait_transactions(self, timeout=None):
+        """wait until all outstanding transactions are completed or expired
+
+        :param timeout: max. time to wait (default: wait forever)
+        :type timeout: float
+        :return: True if no transaction is outstanding
+        :rtype: bool
+        """
+        with self._window_cond:
+            return self._window_cond.wait_for(lambda: not self.transactions, timeout)
 
     # internal methods --------------------------------------------------------
 
+    def _open(self, sock=None):
+        if self.source_address:
+            self.socket = socket.create_connection((self.address, self.port), source_address=(self.source_address, 0))
+        else:
+            if sock is None:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.connect((self.address, self.port))
+            self.socket = sock
+        # blocking socket without timeout as adjacency timers
+        # are run from the shared timer wheel
+        self.socket.setblocking(True)
+        # port up/down messages are sent in chunks of the socket send buffer size
+        self.chunk_size = max(int(self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)), 4096)
+        if self.capture is not None:
+            self._endpoints = (self.socket.getsockname(), self.socket.getpeername())
+        with self._deferred_lock:
+            # deferred messages of the previous connection
+            del self._deferred[:]
+        if self._tx_queue_config is not None:
+            self.tx_queue = TransmitQueue(self.socket, on_write=self._written, **self._tx_queue_config)
+        with self._timer_lock:
+            self.initiate()
+            self._schedule_timer()
+
+    def _sized(self, subscribers):
+        """return True if subscribers can be iterated twice"""
+        return isinstance(subscribers, Subscriber) or isinstance(subscribers, Sized)
+
+    def _recorded(self, subscribers, up):
+        """yield subscribers and record them in the state store"""
+        record = self.store.record
+        for subscriber in subscribers:
+            if isinstance(subscriber, (Subscriber, Frame)):
+                record(subscriber, up=up)
+            yield subscriber
+
     def _handle(self):
         """RX / TX Thread"""
+        while True:
+            self._receive()
+            self._cancel_timer()
+            self.established.clear()
+            if not self.reconnect or self._closed.is_set() or not self._reconnect():
+                break
+
+    def _receive(self):
+        """receive until connection is lost"""
+        rx = ReceiveBuffer()
         while True:
             try:
-                b = self._recvall(4)
+                nbytes = rx.recv_into(self.socket)
             except socket.timeout:
-                self._handle_timeout()
-            else:
-                if len(b) == 0:
-                    log.warning("connection lost with %s ", tomac(self.receiver_name))
-                    break
-                else:
-                    log.debug("received len(b) = %d", len(b))
-                    (id, length) = struct.unpack("!HH", b)
-                    log.debug("message rcvd length field %d", length)
-                    if id != 0x880C:
-                        log.error("incorrect ident 0x%x", id)
-                        break
-                    b = self._recvall(length)
-                    if len(b) != length:
-                        log.warning("MSG_WAITALL failed")
-                    log.debug("rest received len(b) = %d", len(b))
-                    (ver, mtype, var) = struct.unpack_from("!BBH", b, 0)
-                    s0 = self.state
-                    if mtype == MessageType.ADJACENCY:
-                        self._handle_adjacency(var, b)
-                    elif mtype == MessageType.ADJACENCY_UPDATE:
-                        self._handle_adjacency_update(var, b)
-                    elif mtype == MessageType.PORT_UP:
-                        log.warning("received port up in AN mode")
-                    elif mtype == MessageType.PORT_DOWN:
-                        log.warning("received port down in AN mode")
-                    else:
-                        self._handle_general(var, b)
-                    if s0 != self.state and self.state == AdjacencyState.ESTAB and not self.established.is_set():
-                        self.established.set()
-                        log.info("adjacency established with %s", tomac(self.receiver_name))
-        self.established.clear()
+                continue
+            except (socket.error, OSError) as e:
+                log.warning("connection lost with %s: %s", tomac(self.receiver_name), e)
+                return
+            if nbytes == 0:
+                log.warning("connection lost with %s ", tomac(self.receiver_name))
+                return
+            log.debug("received len(b) = %d", nbytes)
+            capture = self.capture
+            if capture is not None:
+                local, remote = self._endpoints
+                capture.write(bytes(rx.tail(nbytes)), remote, local)
+            with self._timer_lock:
+                try:
+                    for b in rx.messages():
+                        self._handle_message(b)
+                except ValueError:
+                    return
+                self._schedule_timer()
+            if self._reset:
+                log.warning("connection reset by %s", tomac(self.receiver_name))
+                self._reset = False
+                self._close_tx_queue(self.timeout)
+                self.socket.close()
+                return
+
+    def _reconnect(self):
+        """reconnect with jittered exponential backoff
+
+        :return: True if connected
+        :rtype: bool
+        """
+        self.resynced.clear()
+        # outstanding transactions are lost with the connection
+        self._expire_transactions(float("inf"))
+        self._close_tx_queue(0)
+        try:
+            self.socket.close()
+        except (socket.error, OSError):
+            pass
+        delay = self.reconnect_backoff
+        while True:
+            wait = delay * random.uniform(1 - self.reconnect_jitter, 1 + self.reconnect_jitter)
+            log.info("reconnect to %s:%s in %.3fs", self.address, self.port, wait)
+            if self._closed.wait(wait):
+                return False
+            self.state = AdjacencyState.IDLE
+            try:
+                self._open()
+            except (socket.error, OSError) as e:
+                log.warning("reconnect to %s:%s failed: %s", self.address, self.port, e)
+                delay = min(delay * 2, self.reconnect_max_backoff)
+                continue
+            self.reconnects += 1
+            self._resync_pending = True
+            return True
 
-    def _port_updown(self, message_type, subscribers):
+    def _resync(self):
+        """send all active ports after reconnect"""
+        start = monotonic()
+        count = 0
+        try:
+            for subscribers in self.store.active():
+                # not recorded again
+                super(Client, self).port_up(subscribers)
+                count += len(subscribers)
+        except (socket.error, OSError, RuntimeError) as e:
+            log.error("resync failed after %d ports: %s", count, e)
+            return
+        self.resync_time = monotonic() - start
+        log.info("resync of %d ports in %.3fs", count, self.resync_time)
+        self.resynced.set()
+
+    def _schedule_timer(self):
+        """(re)schedule adjacency timer in shared timer wheel"""
+        with self._timer_lock:
+            deadline = self.next_deadline()
+            timer = self._timer
+            if timer is not None and timer.active:
+                if timer.deadline == deadline:
+                    return
+                timer.cancel()
+            if deadline is None:
+                self._timer = None
+            else:
+                self._timer = shared_wheel().schedule(deadline, self._expire)
+
+    def _cancel_timer(self):
+        with self._timer_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            with self._deferred_lock:
+                if self._retry is not None:
+                    self._retry.cancel()
+                    self._retry = None
+
+    def _expire(self):
+        """called from the shared timer wheel (must not block)"""
+        if not self._timer_lock.acquire(False):
+            # RX thread is handling messages (possibly blocked in send)
+            wheel = shared_wheel()
+            wheel.schedule(monotonic() + wheel.resolution, self._expire)
+            return
+        try:
+            if self._timer is None:
+                # cancelled while expired
+                return
+            try:
+                self.handle_timer()
+            except (socket.error, OSError) as e:
+                log.error("adjacency timer failed: %s", e)
+                self._timer = None
+                return
+            self._schedule_timer()
+        finally:
+            self._timer_lock.release()
+
+    def _wait_window(self):
+        if self.window is None:
+            return
+        # transaction timeout may expire before the adjacency timer
+        self._schedule_timer()
+        with self._window_cond:
+            while len(self.transactions) >= self.window and self.established.is_set():
+                self._window_cond.wait(self.timeout)
+
+    def _established(self):
         if not self.established.is_set():
-            raise RuntimeError("session not established")
-
-        self._send_port_updwn(message_type, self.tech_type, subscribers)
-
-    def _recvall(self, toread):
-        buf = bytearray(toread)
-        view = memoryview(buf)
-        while toread:
-            nbytes = self.socket.recv_into(view, toread)
-            if nbytes == 0:
-                return b''
-            view = view[nbytes:]    # slicing views is cheap
-            toread -= nbytes
-
-        return buf
-
-    def _mkadjac(self, mtype, time, m, code):
-        totcapslen = len(self.capabilities) * 4
-        b = bytearray(40 + totcapslen)
-        off = 0
-        struct.pack_into("!HH", b, off, 0x880c, 36 + totcapslen)
-        off += 4
-        struct.pack_into("!BBBB", b, off, self.version, mtype, int(self.timer * 10), (m << 7) | code)
-        off += 4
-        (s1, s2, s3, s4, s5, s6) = self.sender_name
-        (r1, r2, r3, r4, r5, r6) = self.receiver_name
-        struct.pack_into("!6B6B", b, off,
-                         s1, s2, s3, s4, s5, s6,
-                         r1, r2, r3, r4, r5, r6)
-        off += 12
-        struct.pack_into("!II", b, off, self.sender_port, self.receiver_port)
-        off += 8
-        struct.pack_into("!I", b, off, self.sender_instance)
-        off += 4
-        struct.pack_into("!I", b, off, self.receiver_instance)
-        off += 5
-        struct.pack_into("!BH", b, off, len(self.capabilities), totcapslen)
-        off += 3
-        for cap in self.capabilities:
-            struct.pack_into("!H", b, off, cap)
-            off += 2
-        return b
-
-    def _send_adjac(self, m, code):
-        log.debug("send adjanecy message with code %s", (code))
-        b = self._mkadjac(MessageType.ADJACENCY, self.timer * 10, m, code)
+            self.established.set()
+            log.info("adjacency established with %s", tomac(self.receiver_name))
+            if self._resync_pending:
+                self._resync_pending = False
+                thread = Thread(target=self._resync, name="resync")
+                thread.daemon = True
+                thread.start()
+
+    def _sendall(self, b, priority=False):
+        tx_queue = self.tx_queue
+        if tx_queue is not None:
+            self._enqueue(tx_queue, b, priority)
+            return
+        if shared_wheel().in_thread():
+            # never block the timer wheel shared by all clients
+            self._send_nowait(b)
+            return
+        metrics = self.metrics
+        if metrics is None:
+            with self._tx_lock:
+                self._flush_deferred()
+                self.socket.sendall(b)
+                if self.capture is not None:
+                    self._capture_tx(b)
+            return
+        t0 = clock()
         with self._tx_lock:
+            t1 = clock()
+            self._flush_deferred()
             self.socket.sendall(b)
+            t2 = clock()
+            if self.capture is not None:
+                self._capture_tx(b)
+        metrics.lock_wait.observe(t1 - t0)
+        metrics.send_latency.observe(t2 - t1)
+
+    def _sendmsg(self, buffers):
+        tx_queue = self.tx_queue
+        if tx_queue is not None:
+            self._enqueue(tx_queue, b"".join(buffers), False)
+            return
+        if not self.scatter_gather or not hasattr(self.socket, "sendmsg"):
+            self._sendall(b"".join(buffers))
+            return
+        metrics = self.metrics
+        if metrics is None:
+            with self._tx_lock:
+                self._flush_deferred()
+                sendmsgall(self.socket, buffers)
+                if self.capture is not None:
+                    self._capture_tx(b"".join(buffers))
+            return
+        t0 = clock()
+        with self._tx_lock:
+            t1 = clock()
+            self._flush_deferred()
+            sendmsgall(self.socket, buffers)
+            t2 = clock()
+            if self.capture is not None:
+                self._capture_tx(b"".join(buffers))
+        metrics.lock_wait.observe(t1 - t0)
+        metrics.send_latency.observe(t2 - t1)
+
+    def _sendall_threadsafe(self, b):
+        """send from any thread (e.g. OAM workers)"""
+        self._sendall(b)
+
+    def _send_nowait(self, b):
+        """send from the timer wheel thread without blocking
+
+        Data which can not be sent immediately (socket used by another
+        thread or send buffer full) is deferred. Deferred data is sent
+        before the next message of any thread or retried from the wheel.
+        """
+        with self._deferred_lock:
+            self._deferred += b
+        self._try_deferred()
 
-    def _send_syn(self):
-        self._send_adjac(0, MessageCode.SYN)
-        self.state = AdjacencyState.SYNSENT
-        self._last_syn_time = datetime.now()
-
-    def _send_ack(self):
-        self._send_adjac(0, MessageCode.ACK)
-
-    def _send_synack(self):
-        self._send_adjac(0, MessageCode.SYNACK)
-        self.state = AdjacencyState.SYNRCVD
-
-    def _send_rstack(self):
-        self._send_adjac(0, MessageCode.RSTACK)
-        self.state = AdjacencyState.SYNRCVD
-
-    def _handle_timeout(self):
-        if self.state == AdjacencyState.SYNSENT:
-            self._send_syn()
-        elif self.state == AdjacencyState.ESTAB:
-            # send every self.timer seconds a SYN, ... (keep-alive)
-            diff = datetime.now() - self._last_syn_time
-            if diff.seconds >= self.timer:
-                self._send_syn()
-
-    def _handle_syn(self):
-        log.debug("SYN received with current state %d", self.state)
-        if self.state == AdjacencyState.SYNSENT:
-            self._send_synack()
-        elif self.state == AdjacencyState.SYNRCVD:
-            self._send_synack()
-        elif self.state == AdjacencyState.ESTAB:
-            self._send_ack()
-        elif self.state == AdjacencyState.IDLE:
-            self._send_syn()
-        else:
-            log.warning('SYN not expected in state: %d', self.state)
-
-    def _handle_synack(self):
-        log.debug("SYNACK received with current state %d", self.state)
-        if self.state == AdjacencyState.SYNSENT:
-            # C !C ??
-            self._send_ack()
-            self.state = AdjacencyState.ESTAB
-        elif self.state == AdjacencyState.SYNRCVD:
-            # C !C ??
-            self._send_ack()
-        elif self.state == AdjacencyState.ESTAB:
-            self._send_ack()
-        else:
-            log.warning('SYNACK not expected in state: %d', self.state)
-
-    def _handle_ack(self):
-        log.debug("ACK received with current state %d", self.state)
-        if self.state == AdjacencyState.ESTAB:
-            self._send_ack()
-        else:
-            self.state = AdjacencyState.ESTAB
+    def _try_deferred(self):
+        if self._tx_lock.acquire(False):
+            try:
+                with self._deferred_lock:
+                    data = bytes(self._deferred)
+                try:
+                    sent = self.socket.send(data, MSG_DONTWAIT) if data else 0
+                except (BlockingIOError, InterruptedError):
+                    sent = 0
+                if sent:
+                    with self._deferred_lock:
+                        # only appended meanwhile
+                        del self._deferred[:sent]
+                    if self.capture is not None:
+                        self._capture_tx(data[:sent])
+            finally:
+                self._tx_lock.release()
+        with self._deferred_lock:
+            if self._deferred and (self._retry is None or not self._retry.active):
+                wheel = shared_wheel()
+                self._retry = wheel.schedule(monotonic() + wheel.resolution, self._retry_deferred)
+
+    def _retry_deferred(self):
+        try:
+            self._try_deferred()
+        except (socket.error, OSError) as e:
+            log.error("deferred send failed: %s", e)
+
+    def _flush_deferred(self):
+        """send deferred data before other data (tx lock held)"""
+        if self._deferred:
+            with self._deferred_lock:
+                data = bytes(self._deferred)
+                del self._deferred[:]
+            self.socket.sendall(data)
+            if self.capture is not None:
+                self._capture_tx(data)
+
+    def _close_tx_queue(self, timeout):
+        """send queued messages within timeout and stop transmit queue"""
+        tx_queue = self.tx_queue
+        if tx_queue is not None:
+            self.tx_queue = None
+            tx_queue.close(timeout)
+
+    def _enqueue(self, tx_queue, b, priority):
+        metrics = self.metrics
+        if metrics is None:
+            tx_queue.put(b, priority)
+            return
+        # time blocked by the high water mark
+        t0 = clock()
+        tx_queue.put(b, priority)
+        metrics.lock_wait.observe(clock() - t0)
+
+    def _written(self, b, seconds):
+        """called from the transmit queue writer thread"""
+        if self.metrics is not None:
+            self.metrics.send_latency.observe(seconds)
+        if self.capture is not None:
+            self._capture_tx(b)
+
+    def _capture_tx(self, b):
+        capture = self.capture
+        if capture is not None:
+            # copy as templates and send buffers are reused
+            local, remote = self._endpoints
+            capture.write(bytes(b), local, remote)
 
     def _handle_rstack(self):
         log.debug("RSTACK received with current state %d", self.state)
         if self.state == AdjacencyState.SYNSENT:
             pass
         else:
-            # disconnect
-            self.disconnect(send_ack=True)
-
-    def _handle_adjacency(self, var, b):
-        timer = var >> 8
-        m = var & 0x80
-        code = var & 0x7f
-        if m == 0:
-            log.error("received M flag 0 in AN mode")
-            raise RuntimeError("Trying to synchronize with other AN")
-        self.receiver_name = struct.unpack_from("!BBBBBB", b, 4)
-        self.receiver_instance = struct.unpack_from("!I", b, 24)[0] & 16777215
-        if code == MessageCode.SYN:
-            self._handle_syn()
-        elif code == MessageCode.SYNACK:
-            self._handle_synack()
-        elif code == MessageCode.ACK:
-            self._handle_ack()
-        elif code == MessageCode.RSTACK:
-            self._handle_rstack()
-        else:
-            log.warning("unknown code %d" % code)
-
-    def _handle_adjacency_update(self, var, b):
-        res = var >> 12
-        code = var & 0xfff
-
-    def _handle_general(self, var, b):
-        pass
-
-    def _mkgeneral(self, message_type, result, result_code, body):
-        b = bytearray(4 + 12)
-        partition_id = 0
-        off = 0
-        struct.pack_into("!HH", b, off, 0x880c, len(b) - 4 + len(body))
-        off += 4
-        struct.pack_into("!BBH", b, off, self.version, message_type, (result << 12) | result_code)
-        off += 4
-        struct.pack_into("!I", b, off, (partition_id << 24) | self.transaction_id)
-        self.transaction_id += 1
-        off += 4
-        struct.pack_into("!HH", b, off, 0x8001, len(b) - 4 + len(body))
-        off += 4
-        return b + body
-
-    def _send_port_updwn(self, message_type, tech_type, subscribers):
-        msg = bytearray()
-        for subscriber in subscribers:
+            # reset by peer: the RX thread closes the connection and
+            # reconnects if enabled (see _receive)
             try:
-                num_tlvs, tlvs = subscriber.tlvs
-            except:
-                log.warning("subscriber is not of type ancp.subscriber.Subscriber: skip")
-                continue
-            b = bytearray(28)
-            off = 20
-            struct.pack_into("!xBBx", b, off, message_type, tech_type)
-            off += 4
-            struct.pack_into("!HH", b, off, num_tlvs, len(tlvs))
-            off += 4
-            msg += self._mkgeneral(message_type, ResultFields.Nack,
-                                   ResultCodes.NoResult, b + tlvs)
-        if len(msg) == 0:
-            raise ValueError("No valid Subscriber passed")
-        with self._tx_lock:
-            self.socket.sendall(msg)
+                self._send_ack()
+            except (socket.error, OSError) as e:
+                log.warning("ACK to %s failed: %s", tomac(self.receiver_name), e)
+            self._reset = True
@@ -0,0 +1,337 @@
+"""ANCP Codec
+
+Message encoding based on precompiled :class:`struct.Struct` objects.
+Each message header is packed with a single call.
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+import struct
+
+IDENT = 0x880C
+
+# ident, length
+HEADER = struct.Struct("!HH")
+# ident, length, version, message type, timer, M flag | code, sender name,
+# receiver name, sender port, receiver port, sender instance,
+# receiver instance, reserved, number of capabilities, capabilities length
+ADJACENCY = struct.Struct("!HHBBBB6s6sIIIIxBH")
+# capability TLV (type, length)
+CAPABILITY = struct.Struct("!HH")
+# ident, length, version, message type, result | result code,
+# partition id | transaction id, I flag | sub-message number, length
+GENERAL = struct.Struct("!HHBBHIHH")
+# general header followed by port message (20 bytes reserved),
+# message type, tech type, number of TLVs and TLV length
+PORT = struct.Struct("!HHBBHIHH20xxBBxHH")
+# general header followed by port management message (port, port session
+# number, event sequence number, duration, function, x-function, reserved),
+# message type, tech type, number of TLVs and TLV length
+PORT_MANAGEMENT = struct.Struct("!HHBBHIHHIIIBBH4xxBBxHH")
+
+# TLV with header only (type, length)
+TLV_HEADER = struct.Struct("!HH")
+# TLV with 32 bit value (type, length, value)
+TLV_INT = struct.Struct("!HHI")
+UINT32 = struct.Struct("!I")
+# DSL line attributes TLV header followed by the mandatory sub TLVs
+# DSL type, access loop encapsulation and DSL line state
+LINE = struct.Struct("!HHHHIHHIHHI")
+
+
+def mkadjac(version, mtype, timer, m, code, sender_name, receiver_name,
+            sender_port, receiver_port, sender_instance, receiver_instance,
+            capabilities):
+    """Encode Adjacency Message
+
+    :param sender_name: sender name
+    :type sender_name: bytes
+    :param receiver_name: receiver name
+    :type receiver_name: bytes
+    :param capabilities: capabilities
+    :type capabilities: [ancp.client.Capabilities]
+    :rtype: bytearray
+    """
+    totcapslen = len(capabilities) * CAPABILITY.size
+    b = bytearray(ADJACENCY.size + totcapslen)
+    ADJACENCY.pack_into(b, 0, IDENT, ADJACENCY.size - 4 + totcapslen,
+                        version, mtype, timer, (m << 7) | code,
+                        sender_name, receiver_name, sender_port, receiver_port,
+                        sender_instance, receiver_instance,
+                        len(capabilities), totcapslen)
+    off = ADJACENCY.size
+    for cap in capabilities:
+        CAPABILITY.pack_into(b, off, cap, 0)
+        off += CAPABILITY.size
+    return b
+
+
+def mkgeneral(version, message_type, result, result_code, transaction_id, body):
+    """Encode General Message
+
+    :param body: message body
+    :type body: bytes
+    :rtype: bytearray
+    """
+    length = GENERAL.size - 4 + len(body)
+    b = bytearray(GENERAL.pack(IDENT, length, version, message_type,
+                               (result << 12) | result_code, transaction_id,
+                               0x8001, length))
+    b += body
+    return b
+
+
+def mkport(version, message_type, result, result_code, transaction_id,
+           tech_type, num_tlvs, tlvs):
+    """Encode Port Up/Down Message Header
+
+    The returned header must be followed by the TLVs.
+
+    :rtype: bytes
+    """
+    length = PORT.size - 4 + len(tlvs)
+    return PORT.pack(IDENT, length, version, message_type,
+                     (result << 12) | result_code, transaction_id,
+                     0x8001, length, message_type, tech_type,
+                     num_tlvs, len(tlvs))
+
+
+def mkportmgmt(version, result, result_code, transaction_id, port, port_session_number,
+               event_sequence_number, duration, function, x_function, tech_type,
+               num_tlvs, tlvs):
+    """Encode Port Management Message
+
+    :param tlvs: encoded TLVs
+    :type tlvs: bytes
+    :rtype: bytearray
+    """
+    length = PORT_MANAGEMENT.size - 4 + len(tlvs)
+    b = bytearray(PORT_MANAGEMENT.pack(IDENT, length, version, 32,
+                                       (result << 12) | result_code, transaction_id,
+                                       0x8001, length, port, port_session_number,
+                                       event_sequence_number, duration, function,
+                                       x_function, 32, tech_type, num_tlvs, len(tlvs)))
+    b += tlvs
+    return b
+
+
+def mktlv(tlv_type, val):
+    """Encode TLV
+
+    Strings are padded to a multiple of 4 bytes.
+
+    :param tlv_type: TLV type
+    :type tlv_type: ancp.subscriber.TlvType
+    :param val: value
+    :type val: int, tuple or str
+    :rtype: bytes
+    """
+    if isinstance(val, int):
+        return TLV_INT.pack(tlv_type, 4, val)
+    elif isinstance(val, tuple):
+        # list of int (e.g. for AACI_BIN)
+        return TLV_HEADER.pack(tlv_type, len(val) * 4) + b"".join([UINT32.pack(i) for i in val])
+    else:
+        length = len(val)
+        return (TLV_HEADER.pack(tlv_type, length) + val.encode("utf-8")[:length] +
+                b"\0" * (-length % 4))
+
+
+# DECODER ---------------------------------------------------------------------
+#
+# Messages are decoded without ident and length field (message body) over a
+# memoryview. TLVs are decoded lazily when accessed without copying.
+
+# version, message type, timer, M flag | code, sender name, receiver name,
+# sender port, receiver port, sender instance, receiver instance, reserved,
+# number of capabilities, capabilities length
+ADJACENCY_BODY = struct.Struct("!BBBB6s6sIIIIxBH")
+# version, message type, result | result code, partition id | transaction id,
+# I flag | sub-message number, length
+GENERAL_BODY = struct.Struct("!BBHIHH")
+# port, port session number, event sequence number, duration, function,
+# x-function, reserved, message type, tech type, number of TLVs, TLV length
+PORT_BODY = struct.Struct("!IIIBBH4xxBBxHH")
+# version, message type, result | result code, partition id | transaction id
+MESSAGE_HEADER = struct.Struct("!BBHI")
+UINT16 = struct.Struct("!H")
+
+
+class Tlv(object):
+    """Decoded TLV
+
+    The value is not copied but referenced as memoryview.
+    """
+    __slots__ = ("type", "length", "_view", "_off")
+
+    def __init__(self, view, off):
+        self.type, self.length = TLV_HEADER.unpack_from(view, off)
+        self._view = view
+        self._off = off
+
+    def __repr__(self):
+        return "Tlv(0x%04x, %d)" % (self.type, self.length)
+
+    @property
+    def value(self):
+        """value as memoryview"""
+        off = self._off + 4
+        return self._view[off:off + self.length]
+
+    @property
+    def int(self):
+        """value as 32 bit integer"""
+        return UINT32.unpack_from(self._view, self._off + 4)[0]
+
+    @property
+    def text(self):
+        """value as string"""
+        return self.value.tobytes().decode("utf-8")
+
+    @property
+    def tlvs(self):
+        """iterator of sub TLVs"""
+        off = self._off + 4
+        return iter_tlvs(self._view, off, off + self.length)
+
+
+def iter_tlvs(view, off, end):
+    """Iterate TLVs
+
+    :param view: message
+    :type view: memoryview
+    :param off: offset of first TLV
+    :type off: int
+    :param end: end of last TLV
+    :type end: int
+    :rtype: iterator of ancp.codec.Tlv
+    """
+    while off + 4 <= end:
+        tlv = Tlv(view, off)
+        yield tlv
+        off += 4 + ((tlv.length + 3) & ~3)
+
+
+class AdjacencyMessage(object):
+    """Decoded Adjacency Message"""
+    __slots__ = ("view", "version", "message_type", "timer", "m", "code",
+                 "sender_name", "receiver_name", "sender_port", "receiver_port",
+                 "sender_instance", "receiver_instance", "num_capabilities")
+
+    def __init__(self, view):
+        self.view = view
+        (self.version, self.message_type, self.timer, code, sender_name,
+         receiver_name, self.sender_port, self.receiver_port,
+         self.sender_instance, self.receiver_instance, self.num_capabilities,
+         _) = ADJACENCY_BODY.unpack_from(view)
+        self.m = code >> 7
+        self.code = code & 0x7f
+        self.sender_name = tuple(bytearray(sender_name))
+        self.receiver_name = tuple(bytearray(receiver_name))
+
+    def __repr__(self):
+        return "AdjacencyMessage(code=%d)" % self.code
+
+    @property
+    def capabilities(self):
+        """list of capabilities"""
+        return [TLV_HEADER.unpack_from(self.view, ADJACENCY_BODY.size + i * 4)[0]
+                for i in range(self.num_capabilities)]
+
+
+class Message(object):
+    """Decoded General Message
+
+    Only version, message type and the 32 bit fields following are decoded
+    when the message is created. All other fields are decoded on access.
+    """
+    __slots__ = ("view", "version", "message_type", "_var", "_tid")
+    offset = GENERAL_BODY.size
+
+    def __init__(self, view):
+        self.view = view
+        (self.version, self.message_type, self._var, self._tid) = MESSAGE_HEADER.unpack_from(view)
+
+    def __repr__(self):
+        return "%s(type=%d, transaction_id=%d)" % (type(self).__name__, self.message_type, self.transaction_id)
+
+    @property
+    def result(self):
+        return self._var >> 12
+
+    @property
+    def result_code(self):
+        return self._var & 0xfff
+
+    @property
+    def partition_id(self):
+        return self._tid >> 24
+
+    @property
+    def transaction_id(self):
+        return self._tid & 0xffffff
+
+    @property
+    def length(self):
+        return UINT16.unpack_from(self.view, 10)[0]
+
+    @property
+    def tlvs(self):
+        """iterator of TLVs"""
+        return iter_tlvs(self.view, self.offset, len(self.view))
+
+
+def _port_field(index):
+    def getter(self):
+        if self._port is None:
+            self._port = PORT_BODY.unpack_from(self.view, GENERAL_BODY.size)
+        return self._port[index]
+    return property(getter)
+
+
+class PortMessage(Message):
+    """Decoded Port Up/Down and Port Management Message"""
+    __slots__ = ("_port",)
+    offset = GENERAL_BODY.size + PORT_BODY.size
+
+    def __init__(self, view):
+        self.view = view
+        (self.version, self.message_type, self._var, self._tid) = MESSAGE_HEADER.unpack_from(view)
+        self._port = None
+
+    port = _port_field(0)
+    port_session_number = _port_field(1)
+    event_sequence_number = _port_field(2)
+    duration = _port_field(3)
+    function = _port_field(4)
+    x_function = _port_field(5)
+    tech_type = _port_field(7)
+    num_tlvs = _port_field(8)
+    tlv_length = _port_field(9)
+
+    @property
+    def tlvs(self):
+        """iterator of TLVs"""
+        return iter_tlvs(self.view, self.offset, self.offset + self.tlv_length)
+
+
+# message type to decoder (see ancp.protocol.MessageType)
+DECODERS = {
+    10: AdjacencyMessage,   # ADJACENCY
+    32: PortMessage,        # PORT_MANAGEMENT
+    80: PortMessage,        # PORT_UP
+    81: PortMessage,        # PORT_DOWN
+    85: Message,            # ADJACENCY_UPDATE
+}
+
+
+def decode(view):
+    """Decode Message (without ident and length)
+
+    :param view: message
+    :type view: memoryview
+    :rtype: ancp.codec.Message
+    """
+    return DECODERS.get(view[1], Message)(view)
@@ -0,0 +1,211 @@
+"""ANCP Subscriber Loader
+
+Streaming loader for subscriber inventories in CSV or JSON Lines format.
+Files are memory mapped and parsed line by line, so subscribers can be
+passed to :meth:`ancp.client.Client.port_up` as generator without
+loading the whole file into memory.
+
+CSV files start with a header line of attribute names (e.g.
+``aci,up,down,aaci_bin``). Empty values are not set. JSON Lines files
+contain one object per line. Values of `aaci_bin` are validated like
+:class:`ancp.subscriber.Subscriber` does; tuples are written as
+``outer:inner`` in CSV and as list in JSON Lines. Integer attributes
+(e.g. `state` or `dsl_type`) also accept constant names (e.g.
+``SHOWTIME`` or ``VDSL2``).
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from ancp.subscriber import (Subscriber, LineState, DslType, DataLink, Encap1, Encap2,
+                             check_aaci_bin)
+from ancp.table import SubscriberTable
+import csv
+import json
+import mmap
+import os
+import logging
+
+log = logging.getLogger(__name__)
+
+
+# string attributes
+TEXT = ("aci", "ari", "aaci_ascii")
+# integer attributes and the class of named constants
+INTEGERS = {
+    "state": LineState,
+    "up": None,
+    "down": None,
+    "min_up": None,
+    "min_down": None,
+    "att_up": None,
+    "att_down": None,
+    "max_up": None,
+    "max_down": None,
+    "dsl_type": DslType,
+    "data_link": DataLink,
+    "encap1": Encap1,
+    "encap2": Encap2,
+}
+
+
+def _lines(path):
+    """yield lines of memory mapped file"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for line in iter(mm.readline, b""):
+                yield line
+        finally:
+            mm.close()
+
+
+def _integer(name, value):
+    if isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except TypeError:
+        # e.g. JSON lists or objects
+        raise ValueError("invalid value for %s" % name)
+    except ValueError:
+        constants = INTEGERS[name]
+        if constants is not None and hasattr(constants, value.upper()):
+            return getattr(constants, value.upper())
+        raise ValueError("invalid value for %s" % name)
+
+
+def _aaci_bin(value):
+    if isinstance(value, list):
+        value = tuple(value)
+    elif isinstance(value, str):
+        try:
+            value = tuple(int(v) for v in value.split(":"))
+        except ValueError:
+            raise ValueError("invalid value for aaci_bin")
+        if len(value) == 1:
+            value = value[0]
+    check_aaci_bin(value)
+    return value
+
+
+def _convert(record):
+    """convert raw record to subscriber attributes"""
+    kwargs = {}
+    for name, value in record.items():
+        if value is None or value == "":
+            continue
+        if name in INTEGERS:
+            kwargs[name] = _integer(name, value)
+        elif name == "aaci_bin":
+            kwargs[name] = _aaci_bin(value)
+        elif name in TEXT:
+            kwargs[name] = str(value)
+        else:
+            raise ValueError("unknown attribute %s" % name)
+    if "aci" not in kwargs:
+        raise ValueError("missing aci")
+    return kwargs
+
+
+def read_csv(path):
+    """yield raw records of CSV file
+
+    :param path: file path
+    :type path: str
+    :rtype: iterator of (line number, dict)
+    """
+    reader = csv.reader(line.decode("utf-8") for line in _lines(path))
+    header = None
+    for row in reader:
+        if not row:
+            continue
+        if header is None:
+            header = [name.strip() for name in row]
+            continue
+        if len(row) != len(header):
+            raise ValueError("%s:%d: expected %d fields" % (path, reader.line_num, len(header)))
+        yield reader.line_num, dict(zip(header, row))
+
+
+def read_jsonl(path):
+    """yield raw records of JSON Lines file
+
+    :param path: file path
+    :type path: str
+    :rtype: iterator of (line number, dict)
+    """
+    for num, line in enumerate(_lines(path), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line.decode("utf-8"))
+        except ValueError:
+            raise ValueError("%s:%d: invalid JSON" % (path, num))
+        if not isinstance(record, dict):
+            raise ValueError("%s:%d: expected object" % (path, num))
+        yield num, record
+
+
+def records(path, format=None):
+    """yield validated subscriber attributes
+
+    :param path: file path
+    :type path: str
+    :param format: "csv" or "jsonl" (default: from file extension)
+    :type format: str
+    :rtype: iterator of dict
+    """
+    if format is None:
+        format = "jsonl" if os.path.splitext(path)[1].lower() in (".jsonl", ".json", ".ndjson") else "csv"
+    if format == "csv":
+        reader = read_csv(path)
+    elif format == "jsonl":
+        reader = read_jsonl(path)
+    else:
+        raise ValueError("unknown format %s" % format)
+    for num, record in reader:
+        try:
+            yield _convert(record)
+        except ValueError as e:
+            raise ValueError("%s:%d: %s" % (path, num, e))
+
+
+def load(path, format=None):
+    """yield ANCP subscribers from file
+
+    .. code-block:: python
+
+        client.port_up(load("subscribers.csv"))
+
+    :param path: file path
+    :type path: str
+    :param format: "csv" or "jsonl" (default: from file extension)
+    :type format: str
+    :rtype: iterator of ancp.subscriber.Subscriber
+    """
+    for kwargs in records(path, format):
+        yield Subscriber(kwargs.pop("aci"), **kwargs)
+
+
+def load_table(path, format=None, use_numpy=True):
+    """load ANCP subscribers from file into table
+
+    Subscribers are appended directly to the table without creating
+    :class:`ancp.subscriber.Subscriber` objects.
+
+    :param path: file path
+    :type path: str
+    :param format: "csv" or "jsonl" (default: from file extension)
+    :type format: str
+    :param use_numpy: use NumPy if installed (default=True)
+    :type use_numpy: bool
+    :rtype: ancp.table.SubscriberTable
+    """
+    table = SubscriberTable(use_numpy=use_numpy)
+    for kwargs in records(path, format):
+        table.append(kwargs.pop("aci"), **kwargs)
+    return table
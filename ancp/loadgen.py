@@ -0,0 +1,315 @@
+"""ANCP Load Generator
+
+Multi-process load generator which shards ANCP sessions and their
+subscribers across worker processes (one per CPU core by default) to
+scale encoding beyond a single interpreter. Each worker owns its clients
+and sends paced port churn with :class:`ancp.scheduler.Scheduler`. The
+parent process controls all workers together over pipes and collects
+their counters from shared memory.
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from ancp.client import Client
+from ancp.metrics import Metrics
+from ancp.protocol import MessageType, TechTypes, monotonic
+from ancp.scheduler import Scheduler, ConstantRate
+from ancp.subscriber import Subscriber
+from collections import OrderedDict
+import multiprocessing
+import os
+import logging
+
+log = logging.getLogger(__name__)
+
+
+# counters per worker in shared memory
+STATS = ("sessions", "established", "subscribers", "events",
+         "port_up", "port_down", "tx_bytes", "rate")
+
+
+class _Shard(object):
+    """port_up/port_down of all clients of a worker for the scheduler"""
+    def __init__(self, sessions):
+        self.owner = {}
+        for client, subscribers in sessions:
+            for s in subscribers:
+                self.owner[id(s)] = client
+
+    def _group(self, subscribers):
+        groups = OrderedDict()
+        for s in subscribers:
+            groups.setdefault(self.owner[id(s)], []).append(s)
+        return groups.items()
+
+    def port_up(self, subscribers):
+        for client, group in self._group(subscribers):
+            if client.is_established():
+                client.port_up(group)
+
+    def port_down(self, subscribers):
+        for client, group in self._group(subscribers):
+            if client.is_established():
+                client.port_down(group)
+
+
+def _worker(config, indices, conn, stats, slot):
+    """Worker Process"""
+    sessions = []
+    count = config["subscribers"]
+    for index in indices:
+        source_address = config["source_addresses"][index] if config["source_addresses"] else None
+        client = Client(config["address"], port=config["port"], tech_type=config["tech_type"],
+                        timer=config["timer"], source_address=source_address)
+        client.metrics = Metrics()
+        subscribers = [Subscriber(aci=config["aci"] % (index * count + i), **config["line"])
+                       for i in range(count)]
+        sessions.append((client, subscribers))
+    shard = _Shard(sessions)
+    scheduler = None
+    events = 0          # events of stopped schedulers
+    base = slot * len(STATS)
+    stats[base] = len(sessions)
+    stats[base + 2] = len(sessions) * count
+
+    def update():
+        values = [0] * 4
+        for client, _ in sessions:
+            values[0] += client.is_established()
+            values[2] += client.metrics.tx_frames.get(MessageType.PORT_UP, 0)
+            values[3] += client.metrics.tx_frames.get(MessageType.PORT_DOWN, 0)
+        stats[base + 1] = values[0]
+        stats[base + 3] = events + (scheduler.events if scheduler is not None else 0)
+        stats[base + 4] = values[2]
+        stats[base + 5] = values[3]
+        stats[base + 6] = sum(sum(c.metrics.tx_bytes.values()) for c, _ in sessions)
+
+    while True:
+        if conn.poll(0.1):
+            cmd, arg = conn.recv()
+            if cmd == "connect":
+                for client, subscribers in sessions:
+                    try:
+                        if client.connect():
+                            client.port_up(subscribers)
+                    except (OSError, RuntimeError) as e:
+                        log.error("%r connect failed: %s", client, e)
+                update()
+                conn.send(int(stats[base + 1]))
+            elif cmd == "rate":
+                stats[base + 7] = arg
+                if scheduler is None:
+                    subscribers = [s for _, subs in sessions for s in subs]
+                    scheduler = Scheduler(shard, subscribers, ConstantRate(arg))
+                    scheduler.start()
+                else:
+                    scheduler.profile.rate = float(arg)
+                    scheduler.profile.burst = max(arg / 10.0, 1)
+            elif cmd == "stop":
+                if scheduler is not None:
+                    scheduler.stop()
+                    events += scheduler.events
+                    scheduler = None
+                stats[base + 7] = 0
+                update()
+                conn.send(True)
+            elif cmd == "close":
+                if scheduler is not None:
+                    scheduler.stop()
+                for client, _ in sessions:
+                    if client.is_established():
+                        client.disconnect()
+                update()
+                conn.send(True)
+                return
+        update()
+
+
+class LoadGenerator(object):
+    """ANCP Load Generator
+
+    Sessions are distributed round robin over the worker processes. Each
+    session announces `subscribers` ports with unique ACIs created from the
+    format string `aci` and the global port number.
+
+    :param address: ANCP server address (IPv4)
+    :type address: str
+    :param sessions: number of sessions or list of source addresses (one session each)
+    :type sessions: int or [str]
+    :param subscribers: number of subscribers per session (default=1000)
+    :type subscribers: int
+    :param processes: number of worker processes (default: number of CPUs)
+    :type processes: int
+    :param port: ANCP port (default: 6068)
+    :type port: int
+    :param tech_type: tech type (default=DSL)
+    :type tech_type: ancp.client.TechTypes
+    :param timer: adjacency timer (default=25.0)
+    :type timer: float
+    :param aci: ACI format string (default="0.0.0.0 eth %d")
+    :type aci: str
+    :param line: subscriber attributes (e.g. {"up": 1024, "down": 16000})
+    :type line: dict
+    """
+    def __init__(self, address, sessions=1, subscribers=1000, processes=None, port=6068,
+                 tech_type=TechTypes.DSL, timer=25.0, aci="0.0.0.0 eth %d", line=None):
+        if isinstance(sessions, int):
+            source_addresses = None
+        else:
+            source_addresses = [str(a) for a in sessions]
+            sessions = len(source_addresses)
+        if sessions < 1:
+            raise ValueError("at least one session required")
+        self.sessions = sessions
+        self.processes = max(min(processes or os.cpu_count() or 1, sessions), 1)
+        self.rate = 0.0
+        self._config = {
+            "address": str(address),
+            "port": port,
+            "tech_type": tech_type,
+            "timer": timer,
+            "source_addresses": source_addresses,
+            "subscribers": subscribers,
+            "aci": aci,
+            "line": dict(line or {}),
+        }
+        self._context = multiprocessing.get_context("spawn")
+        self._stats = self._context.Array("d", self.processes * len(STATS), lock=False)
+        self._workers = []
+        self._failed = set()    # slots of workers which died
+        self._start_time = None
+
+    def __repr__(self):
+        return "LoadGenerator(%s, %d sessions, %d processes)" % (
+            self._config["address"], self.sessions, self.processes)
+
+    def connect(self, timeout=None):
+        """start worker processes, connect all sessions and send port up for all subscribers
+
+        :param timeout: max. time to wait for workers (default: wait forever)
+        :type timeout: float
+        :return: True if all adjacencies are established
+        :rtype: bool
+        """
+        for slot in range(self.processes):
+            parent, child = self._context.Pipe()
+            indices = list(range(slot, self.sessions, self.processes))
+            process = self._context.Process(target=_worker, name="ancp-worker-%d" % slot,
+                                            args=(self._config, indices, child, self._stats, slot))
+            process.daemon = True
+            process.start()
+            # the pipe reports EOF only if no other end is open
+            child.close()
+            self._workers.append((process, parent))
+        established = 0
+        deadline = None if timeout is None else monotonic() + timeout
+        for slot in range(len(self._workers)):
+            self._send(slot, ("connect", None))
+        for slot in range(len(self._workers)):
+            remaining = None if deadline is None else max(deadline - monotonic(), 0)
+            result = self._recv(slot, remaining)
+            if result is None:
+                continue
+            established += result
+        return established == self.sessions
+
+    def start(self, rate):
+        """start port churn
+
+        :param rate: port up/down events per second of all workers together
+        :type rate: float
+        """
+        if self._start_time is None:
+            self._start_time = monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """change rate of running port churn
+
+        The rate is shared by the workers proportional to their sessions.
+
+        :param rate: port up/down events per second of all workers together
+        :type rate: float
+        """
+        self.rate = float(rate)
+        for slot in range(len(self._workers)):
+            sessions = len(range(slot, self.sessions, self.processes))
+            self._send(slot, ("rate", self.rate * sessions / self.sessions))
+
+    def stop(self):
+        """stop port churn of all workers"""
+        for slot in range(len(self._workers)):
+            self._send(slot, ("stop", None))
+        for slot in range(len(self._workers)):
+            self._recv(slot)
+        self.rate = 0.0
+
+    def close(self):
+        """disconnect all sessions and stop worker processes"""
+        for slot, (process, _) in enumerate(self._workers):
+            if process.is_alive():
+                self._send(slot, ("close", None))
+        for slot, (process, _) in enumerate(self._workers):
+            if process.is_alive():
+                self._recv(slot, 5.0)
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+        self._workers = []
+
+    def report(self):
+        """return counters summed over all workers
+
+        Counters of each worker are returned in `workers`. Workers which
+        died (e.g. killed by the OOM killer) are marked as `failed`, their
+        counters are the last values reported.
+
+        :rtype: dict
+        """
+        n = len(STATS)
+        workers = [dict(zip(STATS, self._stats[slot * n:(slot + 1) * n]))
+                   for slot in range(self.processes)]
+        report = dict((name, sum(w[name] for w in workers)) for name in STATS)
+        for slot, worker in enumerate(workers):
+            worker["failed"] = slot in self._failed
+        report["failed"] = len(self._failed)
+        elapsed = monotonic() - self._start_time if self._start_time is not None else 0.0
+        report["elapsed"] = elapsed
+        report["achieved_rate"] = report["events"] / elapsed if elapsed else 0.0
+        report["processes"] = self.processes
+        report["workers"] = workers
+        return report
+
+    # internal methods --------------------------------------------------------
+
+    def _send(self, slot, command):
+        """send command to worker unless it failed"""
+        if slot in self._failed:
+            return
+        try:
+            self._workers[slot][1].send(command)
+        except (EOFError, OSError) as e:
+            self._fail(slot, e)
+
+    def _recv(self, slot, timeout=None):
+        """return response of worker or None if failed or timed out"""
+        if slot in self._failed:
+            return None
+        conn = self._workers[slot][1]
+        try:
+            if not conn.poll(timeout):
+                return None
+            return conn.recv()
+        except (EOFError, OSError) as e:
+            self._fail(slot, e)
+            return None
+
+    def _fail(self, slot, error):
+        process = self._workers[slot][0]
+        log.error("worker %d failed (exit code %s): %r", slot, process.exitcode, error)
+        self._failed.add(slot)
+        if process.is_alive():
+            process.terminate()
+        process.join(timeout=1.0)
@@ -0,0 +1,421 @@
+"""ANCP Session Manager
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from ancp.protocol import Protocol, MessageType, TechTypes, tosender, tomac, monotonic
+from ancp.timer import TimerWheel
+from collections import OrderedDict, deque
+from threading import Thread, Event, Lock, Condition, current_thread
+import selectors
+import socket
+import errno
+import logging
+
+log = logging.getLogger(__name__)
+
+
+# ANCP SESSION ----------------------------------------------------------------
+
+class Session(Protocol):
+    """ANCP Session managed by :class:`SessionManager`
+
+    :param name: session name
+    :type name: str
+    :param address: ANCP server address (IPv4)
+    :type address: str
+    :param port: ANCP port
+    :type port: int
+    :param source_address: source address
+    :type source_address: str
+    :param tech_type: tech type
+    :type tech_type: ancp.client.TechTypes
+    :param timer: adjacency timer
+    :type timer: int
+    """
+    def __init__(self, name, address, port, source_address, tech_type, timer):
+        if source_address:
+            sender_name = tosender(source_address)
+        else:
+            sender_name = (1, 2, 3, 4, 5, 6)
+        super(Session, self).__init__(tech_type=tech_type, timer=timer, sender_name=sender_name)
+        self.name = name
+        self.address = address
+        self.port = port
+        self.source_address = source_address
+        self.socket = None
+        self.established = Event()
+        self.connect_time = None            # start of TCP connect (monotonic)
+        self.establishment_time = None      # seconds from connect to ESTAB
+        self._connecting = False
+        self._events = 0
+        self._timer = None
+
+    def __repr__(self):
+        return "Session(%s, %s:%s)" % (self.name, self.address, self.port)
+
+    def is_established(self):
+        """return True if adjacency is established"""
+        return self.established.is_set()
+
+    def _established(self):
+        if not self.established.is_set():
+            self.establishment_time = monotonic() - self.connect_time
+            self.established.set()
+            log.info("adjacency %s established with %s in %.3fs",
+                     self.name, tomac(self.receiver_name), self.establishment_time)
+
+
+# ANCP SESSION MANAGER --------------------------------------------------------
+
+class SessionManager(object):
+    """ANCP Session Manager
+
+    The session manager runs many ANCP sessions from a single thread
+    using the best selector available on the platform (e.g. epoll).
+    Adjacency timers of all sessions are kept in a single timer wheel,
+    so the thread is only woken up if a timer of a session is due.
+
+    :param address: ANCP server address (IPv4)
+    :type address: str
+    :param port: ANCP port (default: 6086)
+    :type port: int
+    :param tech_type: tech type (default=DSL)
+    :type tech_type: ancp.client.TechTypes
+    :param timer: adjacency timer (default=25.0)
+    :type timer: int
+    :param rate: max. number of new connections per second (default=100.0)
+    :type rate: float
+    :param high_water: max. buffered bytes per session before port up/down waits (default=1 MiB)
+    :type high_water: int
+    """
+    def __init__(self, address, port=6068, tech_type=TechTypes.DSL, timer=25.0, rate=100.0, high_water=1048576):
+        self.address = str(address)
+        self.port = port
+        self.tech_type = tech_type
+        self.timer = timer
+        self.rate = rate
+        self.high_water = high_water
+        self.timeout = 1.0  # max. time to wait for a session to drain
+        self.sessions = OrderedDict()
+        self._pending = deque()
+        self._next_connect = 0
+        self._lock = Lock()
+        # notified if a session is established, closed or sent buffered bytes
+        self._changed = Condition(self._lock)
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._timers = TimerWheel()
+        self._running = False
+        self._thread = None
+
+    def __repr__(self):
+        return "SessionManager(%s:%s, %d sessions)" % (self.address, self.port, len(self.sessions))
+
+    def __getitem__(self, name):
+        return self.sessions[name]
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def add(self, source_address=None, name=None):
+        """add session
+
+        :param source_address: optional source address
+        :type source_address: str
+        :param name: session name (default: source_address)
+        :type name: str
+        :rtype: ancp.manager.Session
+        """
+        source_address = str(source_address) if source_address else None
+        name = name or source_address or str(len(self.sessions))
+        if name in self.sessions:
+            raise ValueError("session %s already exists" % name)
+        session = Session(name, self.address, self.port, source_address, self.tech_type, self.timer)
+        with self._lock:
+            self.sessions[name] = session
+        return session
+
+    def connect(self, timeout=None):
+        """connect all sessions not yet connected
+
+        New connections are opened with the configured rate in parallel.
+        Returns as soon as every session is established or failed (connect
+        failed or connection lost).
+
+        :param timeout: time to wait for all adjacencies (default: wait forever)
+        :type timeout: float
+        :return: True if all adjacencies are established
+        :rtype: bool
+        """
+        with self._lock:
+            pending = set(self._pending)
+            for session in self.sessions.values():
+                if session.socket is None and session not in pending:
+                    self._pending.append(session)
+        self.start()
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._changed:
+            while True:
+                pending = set(self._pending)
+                established = failed = 0
+                for session in self.sessions.values():
+                    if session.is_established():
+                        established += 1
+                    elif session.socket is None and session not in pending:
+                        failed += 1
+                if established == len(self.sessions):
+                    return True
+                if established + failed == len(self.sessions):
+                    return False
+                if deadline is None:
+                    self._changed.wait()
+                else:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._changed.wait(remaining)
+
+    def disconnect(self):
+        """disconnect all sessions and stop manager"""
+        with self._lock:
+            self._pending.clear()
+            for session in self.sessions.values():
+                if session.socket is not None and session.is_established():
+                    session._send_rstack()
+                    self._flush(session)
+        self.stop()
+
+    def start(self):
+        """start manager thread"""
+        if self._running:
+            self._wakeup()
+            return
+        self._running = True
+        self._thread = Thread(target=self._run, name="session-manager")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """stop manager thread and close all sessions"""
+        self._running = False
+        self._wakeup()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        with self._lock:
+            for session in self.sessions.values():
+                if session.socket is not None:
+                    self._close(session)
+
+    def port_up(self, name, subscribers):
+        """send port-up message for session
+
+        Messages are encoded in chunks without holding the manager lock,
+        so other sessions are not blocked. If more than `high_water` bytes
+        are buffered for the session, encoding waits until they are sent.
+
+        :param name: session name
+        :type name: str
+        :param subscriber: collection of ANCP subscribers
+        :type subscriber: [ancp.subscriber.Subscriber]
+        """
+        self._port_updown(self.sessions[name], MessageType.PORT_UP, subscribers)
+
+    def port_down(self, name, subscribers):
+        """send port-down message for session
+
+        :param name: session name
+        :type name: str
+        :param subscriber: collection of ANCP subscribers
+        :type subscriber: [ancp.subscriber.Subscriber]
+        """
+        self._port_updown(self.sessions[name], MessageType.PORT_DOWN, subscribers)
+
+    def report(self):
+        """return establishment time per session
+
+        :return: session name to establishment time in seconds (None if not established)
+        :rtype: dict
+        """
+        return OrderedDict((name, session.establishment_time) for name, session in self.sessions.items())
+
+    # internal methods --------------------------------------------------------
+
+    def _port_updown(self, session, message_type, subscribers):
+        for buffers in session._port_updown(message_type, subscribers):
+            with self._lock:
+                session._sendmsg(buffers)
+                self._flush(session)
+                while len(session._tx_buffer) > self.high_water and session.socket is not None:
+                    self._changed.wait(self.timeout)
+                if session.socket is None:
+                    raise RuntimeError("session %s closed" % session.name)
+
+    def _wakeup(self):
+        try:
+            self._wakeup_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run(self):
+        """Selector Thread"""
+        while self._running:
+            events = self._selector.select(self._next_timeout())
+            with self._lock:
+                for key, mask in events:
+                    session = key.data
+                    if session is None:
+                        try:
+                            self._wakeup_r.recv(4096)
+                        except (BlockingIOError, OSError):
+                            pass
+                    elif session._connecting:
+                        self._connected(session)
+                    else:
+                        if mask & selectors.EVENT_READ:
+                            self._read(session)
+                        if mask & selectors.EVENT_WRITE:
+                            self._flush(session)
+                self._start_pending()
+                self._timers.advance()
+
+    def _next_timeout(self):
+        now = monotonic()
+        timeout = None
+        with self._lock:
+            if self._pending:
+                timeout = max(self._next_connect - now, 0)
+        expiry = self._timers.next_expiry()
+        if expiry is not None:
+            t = max(expiry - now, 0)
+            if timeout is None or t < timeout:
+                timeout = t
+        return timeout
+
+    def _schedule(self, session):
+        """(re)schedule adjacency timer of session"""
+        deadline = session.next_deadline()
+        timer = session._timer
+        if timer is not None and timer.active:
+            if timer.deadline == deadline:
+                return
+            timer.cancel()
+        if deadline is None:
+            session._timer = None
+            return
+        session._timer = self._timers.schedule(deadline, self._expire, session)
+        if current_thread() is not self._thread:
+            self._wakeup()
+
+    def _expire(self, session):
+        if session.socket is not None and not session._connecting:
+            session.handle_timer()
+            self._flush(session)
+
+    def _start_pending(self):
+        now = monotonic()
+        while self._pending and self._next_connect <= now:
+            session = self._pending.popleft()
+            self._next_connect = max(self._next_connect, now) + 1.0 / self.rate
+            self._open(session)
+
+    def _open(self, session):
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        except (socket.error, OSError) as e:
+            log.error("session %s socket failed: %s", session.name, e)
+            self._close(session)
+            return
+        session.socket = sock
+        try:
+            sock.setblocking(False)
+            if session.source_address:
+                sock.bind((session.source_address, 0))
+        except (socket.error, OSError) as e:
+            log.error("session %s bind failed: %s", session.name, e)
+            self._close(session)
+            return
+        session._connecting = True
+        session.connect_time = monotonic()
+        err = sock.connect_ex((session.address, session.port))
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            log.error("session %s connect failed: %s", session.name, errno.errorcode.get(err, err))
+            self._close(session)
+            return
+        session._events = selectors.EVENT_WRITE
+        self._selector.register(sock, session._events, session)
+
+    def _connected(self, session):
+        err = session.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            log.error("session %s connect failed: %s", session.name, errno.errorcode.get(err, err))
+            self._close(session)
+            return
+        session._connecting = False
+        session.initiate()
+        self._flush(session)
+
+    def _read(self, session):
+        try:
+            data = session.socket.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        established = session.is_established()
+        try:
+            session.receive_data(data)
+        except (ValueError, RuntimeError) as e:
+            log.error("session %s: %s", session.name, e)
+            session.closed = True
+        if session.is_established() != established:
+            self._changed.notify_all()
+        self._flush(session)
+
+    def _flush(self, session):
+        sock = session.socket
+        if sock is None or session._connecting:
+            return
+        buf = session._tx_buffer
+        if buf:
+            try:
+                sent = sock.send(buf)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                session.closed = True
+                sent = 0
+            del buf[:sent]
+            if sent and len(buf) <= self.high_water:
+                self._changed.notify_all()
+        if session.closed:
+            self._close(session)
+            return
+        self._schedule(session)
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if buf else 0)
+        if events != session._events:
+            session._events = events
+            self._selector.modify(sock, events, session)
+            if current_thread() is not self._thread:
+                self._wakeup()
+
+    def _close(self, session):
+        if session._timer is not None:
+            session._timer.cancel()
+            session._timer = None
+        if session.socket is not None:
+            try:
+                self._selector.unregister(session.socket)
+            except (KeyError, ValueError):
+                pass
+            session.socket.close()
+            session.socket = None
+        session._connecting = False
+        session._events = 0
+        session.established.clear()
+        self._changed.notify_all()
@@ -0,0 +1,265 @@
+"""ANCP Metrics
+
+Counters and histograms maintained by :class:`ancp.protocol.Protocol` and
+its subclasses if metrics are enabled (e.g. ``client.metrics = Metrics()``).
+Port up/down messages are counted per encoded chunk and not per message to
+keep the overhead low.
+
+Metrics are updated from several threads (e.g. RX thread, timer wheel
+and OAM workers), so all updates and snapshots hold a lock.
+
+Metrics can be collected as dictionary (:meth:`Metrics.snapshot`), in
+Prometheus text format (:meth:`Metrics.prometheus`) or from a local HTTP
+endpoint (:func:`start_http_server`).
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from ancp.protocol import MessageType, AdjacencyState
+from collections import OrderedDict
+from threading import Thread, Lock
+import bisect
+import logging
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+log = logging.getLogger(__name__)
+
+
+MESSAGE_TYPES = dict((v, k.lower()) for k, v in vars(MessageType).items() if not k.startswith("_"))
+STATES = dict((v, k.lower()) for k, v in vars(AdjacencyState).items() if not k.startswith("_"))
+
+# histogram buckets in seconds (10us to 10s)
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+           0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    """Histogram with fixed buckets
+
+    :param buckets: upper bounds of buckets in seconds
+    :type buckets: tuple
+    """
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = Lock()
+
+    def observe(self, value):
+        """add value"""
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """return cumulative bucket counts, sum and count
+
+        :rtype: dict
+        """
+        with self._lock:
+            counts = list(self.counts)
+            total_sum = self.sum
+            total_count = self.count
+        cumulative = OrderedDict()
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            total += count
+            cumulative[bound] = total
+        return {"buckets": cumulative, "sum": total_sum, "count": total_count}
+
+
+class Metrics(object):
+    """ANCP Session Metrics
+
+    :ivar tx_frames: sent messages per message type
+    :ivar tx_bytes: sent bytes per message type
+    :ivar rx_frames: received messages per message type
+    :ivar rx_bytes: received bytes per message type
+    :ivar transitions: adjacency state transitions per (from, to) state
+    :ivar keepalives: number of keep-alive SYN messages sent
+    :ivar encode_time: port up/down encoding time per chunk (histogram)
+    :ivar lock_wait: time blocked on the transmit lock (histogram)
+    :ivar send_latency: time in sendall/sendmsg per call (histogram)
+    """
+    def __init__(self):
+        self.tx_frames = {}
+        self.tx_bytes = {}
+        self.rx_frames = {}
+        self.rx_bytes = {}
+        self.transitions = {}
+        self.keepalives = 0
+        self.encode_time = Histogram()
+        self.lock_wait = Histogram()
+        self.send_latency = Histogram()
+        self._lock = Lock()
+
+    def __repr__(self):
+        return "Metrics(tx=%d, rx=%d)" % (sum(self.tx_frames.values()), sum(self.rx_frames.values()))
+
+    def sent(self, message_type, frames, nbytes):
+        """count sent messages"""
+        with self._lock:
+            self.tx_frames[message_type] = self.tx_frames.get(message_type, 0) + frames
+            self.tx_bytes[message_type] = self.tx_bytes.get(message_type, 0) + nbytes
+
+    def received(self, message_type, nbytes):
+        """count received message"""
+        with self._lock:
+            self.rx_frames[message_type] = self.rx_frames.get(message_type, 0) + 1
+            self.rx_bytes[message_type] = self.rx_bytes.get(message_type, 0) + nbytes
+
+    def transition(self, old, new):
+        """count adjacency state transition"""
+        key = (old, new)
+        with self._lock:
+            self.transitions[key] = self.transitions.get(key, 0) + 1
+
+    def keepalive(self):
+        """count keep-alive SYN message"""
+        with self._lock:
+            self.keepalives += 1
+
+    def snapshot(self):
+        """return copy of all metrics
+
+        Message types and states are converted to names
+        (e.g. ``port_up`` or ``estab``).
+
+        :rtype: dict
+        """
+        def names(counters):
+            return dict((MESSAGE_TYPES.get(k, str(k)), v) for k, v in counters.items())
+        with self._lock:
+            counters = self._counters()
+        return {
+            "tx_frames": names(counters["tx_frames"]),
+            "tx_bytes": names(counters["tx_bytes"]),
+            "rx_frames": names(counters["rx_frames"]),
+            "rx_bytes": names(counters["rx_bytes"]),
+            "transitions": dict(("%s_%s" % (STATES.get(a, a), STATES.get(b, b)), v)
+                                for (a, b), v in counters["transitions"].items()),
+            "keepalives": counters["keepalives"],
+            "encode_time": self.encode_time.snapshot(),
+            "lock_wait": self.lock_wait.snapshot(),
+            "send_latency": self.send_latency.snapshot(),
+        }
+
+    def prometheus(self, labels=None):
+        """return metrics in Prometheus text format
+
+        :param labels: additional labels (e.g. {"session": "10.0.0.1"})
+        :type labels: dict
+        :rtype: str
+        """
+        return "".join(_prometheus([(labels or {}, self)]))
+
+    def _counters(self):
+        """return copy of counters (called with lock held)"""
+        return {
+            "tx_frames": dict(self.tx_frames),
+            "tx_bytes": dict(self.tx_bytes),
+            "rx_frames": dict(self.rx_frames),
+            "rx_bytes": dict(self.rx_bytes),
+            "transitions": dict(self.transitions),
+            "keepalives": self.keepalives,
+        }
+
+
+def _labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, str(v).replace('"', '\\"')) for k, v in items)
+
+
+def _prometheus(sessions):
+    """yield Prometheus text format lines for (labels, metrics) tuples"""
+    copies = []
+    for labels, metrics in sessions:
+        with metrics._lock:
+            copies.append((labels, metrics._counters()))
+    counters = (
+        ("ancp_tx_frames_total", "tx_frames", "Sent ANCP messages"),
+        ("ancp_tx_bytes_total", "tx_bytes", "Sent ANCP bytes"),
+        ("ancp_rx_frames_total", "rx_frames", "Received ANCP messages"),
+        ("ancp_rx_bytes_total", "rx_bytes", "Received ANCP bytes"),
+    )
+    for name, attr, text in counters:
+        yield "# HELP %s %s\n# TYPE %s counter\n" % (name, text, name)
+        for labels, values in copies:
+            for message_type, value in sorted(values[attr].items()):
+                yield "%s%s %d\n" % (name, _labels(labels, type=MESSAGE_TYPES.get(message_type, message_type)), value)
+    name = "ancp_state_transitions_total"
+    yield "# HELP %s Adjacency state transitions\n# TYPE %s counter\n" % (name, name)
+    for labels, values in copies:
+        for (old, new), value in sorted(values["transitions"].items()):
+            yield "%s%s %d\n" % (name, _labels(labels, old=STATES.get(old, old), new=STATES.get(new, new)), value)
+    name = "ancp_keepalives_total"
+    yield "# HELP %s Sent keep-alive SYN messages\n# TYPE %s counter\n" % (name, name)
+    for labels, values in copies:
+        yield "%s%s %d\n" % (name, _labels(labels), values["keepalives"])
+    histograms = (
+        ("ancp_encode_seconds", "encode_time", "Port up/down encoding time per chunk"),
+        ("ancp_tx_lock_wait_seconds", "lock_wait", "Time blocked on transmit lock"),
+        ("ancp_send_seconds", "send_latency", "Time spent in socket send"),
+    )
+    for name, attr, text in histograms:
+        yield "# HELP %s %s\n# TYPE %s histogram\n" % (name, text, name)
+        for labels, metrics in sessions:
+            snapshot = getattr(metrics, attr).snapshot()
+            for bound, count in snapshot["buckets"].items():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield "%s_bucket%s %d\n" % (name, _labels(labels, le=le), count)
+            yield "%s_sum%s %r\n" % (name, _labels(labels), snapshot["sum"])
+            yield "%s_count%s %d\n" % (name, _labels(labels), snapshot["count"])
+
+
+def start_http_server(sessions, port=9464, address="127.0.0.1"):
+    """serve metrics in Prometheus text format from a background thread
+
+    :param sessions: metrics, dictionary of session name to metrics or
+        callable returning such a dictionary (sessions are labeled with
+        ``session="<name>"``)
+    :type sessions: ancp.metrics.Metrics, dict or callable
+    :param port: TCP port (default=9464)
+    :type port: int
+    :param address: listen address (default=127.0.0.1)
+    :type address: str
+    :return: HTTP server (stop with ``server.shutdown()``)
+    :rtype: http.server.HTTPServer
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if isinstance(sessions, Metrics):
+                items = [({}, sessions)]
+            else:
+                current = sessions() if callable(sessions) else sessions
+                items = [({"session": name}, metrics) for name, metrics in list(current.items())
+                         if metrics is not None]
+            body = "".join(_prometheus(items)).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            log.debug(format, *args)
+
+    server = HTTPServer((address, port), Handler)
+    thread = Thread(target=server.serve_forever, name="metrics")
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,223 @@
+"""ANCP OAM (Port Management)
+
+Handling of port management requests (e.g. access loop connectivity
+tests) sent by the NAS if the OAM capability is negotiated (RFC 6320).
+Handlers are registered per port management function and run on a
+bounded pool of worker threads, so slow handlers (e.g. line tests taking
+seconds) never block the RX thread and adjacency messages.
+
+Handlers are called with the decoded request
+(:class:`ancp.codec.PortMessage`) and return the TLVs of the response as
+list of (type, value) tuples (value as int, tuple of int, str or bytes) or
+None. The response is sent with result Success and the transaction
+identifier of the request. If a handler raises
+:class:`PortManagementError`, the response is sent with result Failure and
+its result code. The Access-Loop-Circuit-ID TLV of the request is always
+returned first.
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from ancp import codec
+from ancp.protocol import ResultFields, ResultCodes
+from ancp.subscriber import TlvType
+from threading import Thread, Lock
+import logging
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+log = logging.getLogger(__name__)
+
+
+class Function(object):
+    "Port Management Functions"
+    CONFIGURE_CONNECTIVITY_TEST = 8
+
+
+class OamTlvType(object):
+    "OAM TLV Types"
+    LOOPBACK_TEST_PARAMETERS = 0x0007
+    OPAQUE_DATA = 0x0008
+    LOOPBACK_TEST_RESPONSE = 0x0009
+
+
+class PortManagementError(Exception):
+    """raised by handlers to send a response with result Failure
+
+    :param result_code: result code (e.g. ResultCodes.LoopbackTestTimeout)
+    :type result_code: int
+    """
+    def __init__(self, result_code, message=None):
+        super(PortManagementError, self).__init__(message or "result code 0x%x" % result_code)
+        self.result_code = result_code
+
+
+def mktlvs(tlvs):
+    """encode list of (type, value) tuples
+
+    :return: number of TLVs and encoded TLVs
+    :rtype: tuple
+    """
+    b = bytearray()
+    count = 0
+    for tlv_type, value in tlvs:
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            value = bytes(value)
+            b += codec.TLV_HEADER.pack(tlv_type, len(value)) + value + b"\0" * (-len(value) % 4)
+        else:
+            b += codec.mktlv(tlv_type, value)
+        count += 1
+    return count, bytes(b)
+
+
+class OamDispatcher(object):
+    """Port management request dispatcher
+
+    Requests are queued (up to `queue_size`) and handled by `workers`
+    threads. If the queue is full, requests are answered immediately with
+    result code OutOfResources.
+
+    .. code-block:: python
+
+        def connectivity_test(request):
+            return [(OamTlvType.LOOPBACK_TEST_RESPONSE, "OK")]
+
+        oam = OamDispatcher(workers=64)
+        oam.register(Function.CONFIGURE_CONNECTIVITY_TEST, connectivity_test)
+        client.enable_oam(oam)
+
+    :param workers: number of worker threads (default=64)
+    :type workers: int
+    :param queue_size: max. number of queued requests (default=10000)
+    :type queue_size: int
+    """
+    def __init__(self, workers=64, queue_size=10000):
+        self.workers = workers
+        self.handlers = {}
+        self.requests = 0
+        self.responses = 0
+        self.rejected = 0
+        self._queue = queue.Queue(queue_size)
+        self._threads = []
+        self._lock = Lock()
+
+    def __repr__(self):
+        return "OamDispatcher(%d workers, %d handlers)" % (self.workers, len(self.handlers))
+
+    @property
+    def pending(self):
+        """number of queued requests"""
+        return self._queue.qsize()
+
+    def register(self, function, handler):
+        """register handler for port management function
+
+        :param function: port management function (e.g. Function.CONFIGURE_CONNECTIVITY_TEST)
+        :type function: int
+        :param handler: called with the request, returns response TLVs or None
+        :type handler: callable
+        """
+        self.handlers[function] = handler
+
+    def submit(self, protocol, msg):
+        """queue request received by protocol without blocking
+
+        The message is copied as received messages are only valid until
+        the next receive.
+
+        :param protocol: session which received the request
+        :type protocol: ancp.client.Client
+        :param msg: port management request
+        :type msg: ancp.codec.PortMessage
+        """
+        with self._lock:
+            self.requests += 1
+            if not self._threads:
+                self._start()
+        if msg.function not in self.handlers:
+            log.warning("port management function %d not supported", msg.function)
+            self.respond(protocol, msg, ResultFields.Failure, ResultCodes.RequestNotImplemented)
+            return
+        msg = codec.decode(memoryview(msg.view.tobytes()))
+        try:
+            self._queue.put_nowait((protocol, msg))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            self.respond(protocol, msg, ResultFields.Failure, ResultCodes.OutOfResources)
+
+    def respond(self, protocol, msg, result, result_code=ResultCodes.NoResult, tlvs=None):
+        """send response to request
+
+        Successful responses are only sent if requested with AckAll,
+        failures if requested with Nack or AckAll.
+        """
+        if msg.result == ResultFields.Ignore:
+            return
+        if result == ResultFields.Success and msg.result != ResultFields.AckAll:
+            return
+        b = bytearray()
+        num_tlvs = 0
+        for tlv in msg.tlvs:
+            if tlv.type == TlvType.ACI:
+                # echo ACI TLV of request
+                b += msg.view[tlv._off:tlv._off + 4 + ((tlv.length + 3) & ~3)]
+                num_tlvs += 1
+                break
+        if tlvs:
+            count, encoded = mktlvs(tlvs)
+            b += encoded
+            num_tlvs += count
+        protocol._sendall_threadsafe(codec.mkportmgmt(
+            msg.version, result, result_code, (msg.partition_id << 24) | msg.transaction_id,
+            msg.port, msg.port_session_number, msg.event_sequence_number, msg.duration,
+            msg.function, msg.x_function, msg.tech_type, num_tlvs, bytes(b)))
+        with self._lock:
+            self.responses += 1
+
+    def close(self):
+        """stop worker threads after queued requests are handled"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    # internal methods --------------------------------------------------------
+
+    def _start(self):
+        for i in range(self.workers):
+            thread = Thread(target=self._run, name="oam-%d" % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        """Worker Thread"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            protocol, msg = item
+            try:
+                tlvs = self.handlers[msg.function](msg)
+                result, result_code = ResultFields.Success, ResultCodes.NoResult
+            except PortManagementError as e:
+                tlvs = None
+                result, result_code = ResultFields.Failure, e.result_code
+            except Exception:
+                log.exception("port management handler failed")
+                tlvs = None
+                result, result_code = ResultFields.Failure, ResultCodes.InvalidRequest
+            if not protocol.is_established():
+                continue
+            try:
+                self.respond(protocol, msg, result, result_code, tlvs)
+            except (OSError, RuntimeError) as e:
+                log.error("port management response failed: %s", e)
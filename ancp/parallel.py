@@ -0,0 +1,131 @@
+"""ANCP Parallel Encoder
+
+Encoding of port up/down messages on a worker pool. Subscribers are
+split into batches which are encoded by the workers with transaction
+identifier 0. Encoded batches are returned in order to the sending thread
+which assigns consecutive transaction identifiers (patched in place) and
+sends them, so the result is identical to serial encoding.
+
+By default a process pool is used as encoding TLVs does not release the
+GIL. A thread pool only scales on interpreters without GIL.
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from ancp import codec
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+import multiprocessing
+import os
+import struct
+import logging
+
+log = logging.getLogger(__name__)
+
+
+# offset of the transaction identifier in port messages (including ident and length)
+TID_OFFSET = 8
+
+UINT32 = struct.Struct("!I")
+
+
+def encode(subscribers, message_type, tech_type, version, result):
+    """encode port messages with transaction identifier 0 (worker)
+
+    :return: (buffer, message offsets, ACIs)
+    :rtype: tuple
+    """
+    buf = bytearray()
+    offsets = []
+    acis = []
+    pack = codec.PORT.pack
+    for subscriber in subscribers:
+        try:
+            num_tlvs, tlvs = subscriber.tlvs
+        except Exception:
+            log.warning("subscriber is not of type ancp.subscriber.Subscriber: skip")
+            continue
+        length = codec.PORT.size - 4 + len(tlvs)
+        offsets.append(len(buf))
+        buf += pack(codec.IDENT, length, version, message_type, result,
+                    0, 0x8001, length, message_type, tech_type, num_tlvs, len(tlvs))
+        buf += tlvs
+        acis.append(subscriber.aci)
+    return buf, offsets, acis
+
+
+def patch(buf, offsets, transaction_id):
+    """write consecutive transaction identifiers into encoded messages"""
+    pack = UINT32.pack_into
+    for tid, off in enumerate(offsets, transaction_id):
+        pack(buf, off + TID_OFFSET, tid)
+
+
+class ParallelEncoder(object):
+    """Port up/down encoder running on a worker pool
+
+    Assign to :attr:`ancp.protocol.Protocol.encoder` to encode subscriber
+    collections (not tables or templates) in parallel. Process pools are
+    started with the `spawn` method, so the main module must be guarded
+    by ``if __name__ == "__main__"``.
+
+    :param workers: number of workers (default: number of CPUs)
+    :type workers: int
+    :param batch: subscribers per batch (default=2048)
+    :type batch: int
+    :param threads: use thread pool instead of process pool (default=False)
+    :type threads: bool
+    :param executor: use existing executor (concurrent.futures)
+    :type executor: concurrent.futures.Executor
+    """
+    def __init__(self, workers=None, batch=2048, threads=False, executor=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch = batch
+        if executor is None:
+            if threads:
+                executor = ThreadPoolExecutor(self.workers)
+            else:
+                executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self._owner = True
+        else:
+            self._owner = False
+        self.executor = executor
+
+    def __repr__(self):
+        return "ParallelEncoder(%d workers, batch=%d)" % (self.workers, self.batch)
+
+    def encode(self, subscribers, message_type, tech_type, version, result):
+        """yield encoded batches in order
+
+        Not more than two batches per worker are submitted ahead, so
+        subscriber generators are consumed incrementally.
+
+        :rtype: iterator of (buffer, message offsets, ACIs)
+        """
+        iterator = iter(subscribers)
+        pending = deque()
+        ahead = self.workers * 2
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < ahead:
+                    batch = list(islice(iterator, self.batch))
+                    if not batch:
+                        exhausted = True
+                        break
+                    pending.append(self.executor.submit(encode, batch, message_type, tech_type, version, result))
+                if not pending:
+                    return
+                yield pending.popleft().result()
+        finally:
+            # sending aborted
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        """shutdown worker pool (if not passed as executor)"""
+        if self._owner:
+            self.executor.shutdown()
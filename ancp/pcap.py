@@ -0,0 +1,361 @@
+"""ANCP Packet Capture
+
+Capture of sent and received ANCP messages into pcap or pcapng files and
+replay of captured port up/down messages.
+
+Captured data is wrapped into IPv4/TCP headers (link type RAW) with the
+addresses of the session, so that the files can be analyzed with
+Wireshark. Files are written by a background thread; if its bounded queue
+is full, data is dropped (and counted) instead of blocking the caller.
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from ancp import codec
+from ancp.protocol import MessageType, ResultCodes, monotonic
+from ancp.subscriber import TlvType
+from itertools import groupby
+from threading import Thread
+import socket
+import struct
+import time
+import logging
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+log = logging.getLogger(__name__)
+
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+
+PCAP_MAGIC = 0xa1b2c3d4
+PCAPNG_MAGIC = 0x0a0d0d0a
+BYTE_ORDER_MAGIC = 0x1a2b3c4d
+
+PCAP_HEADER = struct.Struct("<IHHiIII")
+PCAP_RECORD = struct.Struct("<IIII")
+PCAPNG_BLOCK = struct.Struct("<II")
+PCAPNG_SHB = struct.Struct("<IIIHHqI")
+PCAPNG_IDB = struct.Struct("<IIHHII")
+PCAPNG_EPB = struct.Struct("<IIIIIII")
+IPV4 = struct.Struct("!BBHHHBBH4s4s")
+TCP = struct.Struct("!HHIIBBHHH")
+
+# max. TCP payload per captured packet
+SEGMENT_SIZE = 65000
+
+
+def _checksum(header):
+    total = sum(struct.unpack("!%dH" % (len(header) // 2), header))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+# PCAP WRITER -----------------------------------------------------------------
+
+class PcapWriter(object):
+    """Background pcap/pcapng writer
+
+    :param path: file path
+    :type path: str
+    :param pcapng: write pcapng (default: if path ends with .pcapng)
+    :type pcapng: bool
+    :param queue_size: max. number of queued captures (default=10000)
+    :type queue_size: int
+    """
+    def __init__(self, path, pcapng=None, queue_size=10000):
+        self.path = path
+        self.pcapng = path.endswith(".pcapng") if pcapng is None else pcapng
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._seq = {}
+        self._ident = 0
+        self._file = open(path, "wb")
+        self._write_header()
+        self._thread = Thread(target=self._run, name="pcap-writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __repr__(self):
+        return "PcapWriter(%s, written=%d, dropped=%d)" % (self.path, self.written, self.dropped)
+
+    def write(self, data, src, dst, timestamp=None):
+        """queue data sent from src to dst without blocking
+
+        :param data: TCP payload (must not be changed afterwards)
+        :type data: bytes
+        :param src: source (address, port)
+        :type src: tuple
+        :param dst: destination (address, port)
+        :type dst: tuple
+        :return: False if dropped
+        :rtype: bool
+        """
+        try:
+            self._queue.put_nowait((timestamp or time.time(), src, dst, data))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def close(self):
+        """write all queued captures and close file"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+        if self.dropped:
+            log.warning("%s: %d captures dropped", self.path, self.dropped)
+
+    # internal methods --------------------------------------------------------
+
+    def _run(self):
+        """Writer Thread"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            timestamp, src, dst, data = item
+            for off in range(0, len(data), SEGMENT_SIZE):
+                self._write_packet(timestamp, self._packet(src, dst, data[off:off + SEGMENT_SIZE]))
+            self.written += 1
+        self._file.flush()
+
+    def _packet(self, src, dst, payload):
+        flow = (src, dst)
+        seq = self._seq.get(flow, 1)
+        self._seq[flow] = (seq + len(payload)) & 0xffffffff
+        ack = self._seq.get((dst, src), 1)
+        self._ident = (self._ident + 1) & 0xffff
+        tcp = TCP.pack(src[1], dst[1], seq, ack, 5 << 4, 0x18, 65535, 0, 0)
+        length = IPV4.size + TCP.size + len(payload)
+        ip = IPV4.pack(0x45, 0, length, self._ident, 0x4000, 64, socket.IPPROTO_TCP, 0,
+                       socket.inet_aton(src[0]), socket.inet_aton(dst[0]))
+        ip = ip[:10] + struct.pack("!H", _checksum(ip)) + ip[12:]
+        return ip + tcp + bytes(payload)
+
+    def _write_header(self):
+        if self.pcapng:
+            self._file.write(PCAPNG_SHB.pack(PCAPNG_MAGIC, PCAPNG_SHB.size, BYTE_ORDER_MAGIC,
+                                             1, 0, -1, PCAPNG_SHB.size))
+            self._file.write(PCAPNG_IDB.pack(1, PCAPNG_IDB.size, LINKTYPE_RAW, 0, 0,
+                                             PCAPNG_IDB.size))
+        else:
+            self._file.write(PCAP_HEADER.pack(PCAP_MAGIC, 2, 4, 0, 0, 65535, LINKTYPE_RAW))
+
+    def _write_packet(self, timestamp, packet):
+        usec = int(round(timestamp * 1000000))
+        if self.pcapng:
+            pad = -len(packet) % 4
+            total = PCAPNG_EPB.size + len(packet) + pad + 4
+            self._file.write(PCAPNG_EPB.pack(6, total, 0, usec >> 32, usec & 0xffffffff,
+                                             len(packet), len(packet)))
+            self._file.write(packet + b"\0" * pad + struct.pack("<I", total))
+        else:
+            self._file.write(PCAP_RECORD.pack(usec // 1000000, usec % 1000000, len(packet), len(packet)))
+            self._file.write(packet)
+
+
+# PCAP READER -----------------------------------------------------------------
+
+def read(path):
+    """read packets from pcap or pcapng file
+
+    Only little endian files with microsecond timestamps are supported.
+    Packets are read one by one, so memory usage does not depend on the
+    file size.
+
+    :param path: file path
+    :type path: str
+    :rtype: iterator of (timestamp, linktype, packet)
+    """
+    with open(path, "rb") as f:
+        data = f.read(4)
+        magic = struct.unpack("<I", data)[0] if len(data) == 4 else None
+        if magic == PCAP_MAGIC:
+            data += f.read(PCAP_HEADER.size - 4)
+            if len(data) < PCAP_HEADER.size:
+                return
+            linktype = PCAP_HEADER.unpack(data)[6]
+            while True:
+                record = f.read(PCAP_RECORD.size)
+                if len(record) < PCAP_RECORD.size:
+                    break
+                sec, usec, incl_len, _ = PCAP_RECORD.unpack(record)
+                yield sec + usec / 1000000.0, linktype, f.read(incl_len)
+        elif magic == PCAPNG_MAGIC:
+            linktypes = []
+            data += f.read(PCAPNG_BLOCK.size - 4)
+            while len(data) == PCAPNG_BLOCK.size:
+                block_type, total = PCAPNG_BLOCK.unpack(data)
+                if total < 12 or total % 4:
+                    raise ValueError("%s: invalid block length %d" % (path, total))
+                block = data + f.read(total - PCAPNG_BLOCK.size)
+                if block_type == 1:
+                    linktypes.append(struct.unpack_from("<H", block, 8)[0])
+                elif block_type == 6:
+                    _, _, interface, high, low, incl_len, _ = PCAPNG_EPB.unpack_from(block)
+                    packet = block[PCAPNG_EPB.size:PCAPNG_EPB.size + incl_len]
+                    yield ((high << 32) | low) / 1000000.0, linktypes[interface], packet
+                data = f.read(PCAPNG_BLOCK.size)
+        else:
+            raise ValueError("%s: unsupported file format" % path)
+
+
+def tcp_payload(linktype, packet):
+    """return TCP payload of IPv4 packet
+
+    :return: (src, dst, payload) or None if not IPv4/TCP
+    :rtype: tuple
+    """
+    if linktype == LINKTYPE_ETHERNET:
+        if len(packet) < 14 or packet[12:14] != b"\x08\x00":
+            return None
+        packet = packet[14:]
+    elif linktype != LINKTYPE_RAW:
+        return None
+    if len(packet) < IPV4.size or packet[0] >> 4 != 4 or packet[9] != socket.IPPROTO_TCP:
+        return None
+    ihl = (packet[0] & 0x0f) * 4
+    length = struct.unpack_from("!H", packet, 2)[0]
+    tcp = packet[ihl:length]
+    if len(tcp) < TCP.size:
+        return None
+    sport, dport = struct.unpack_from("!HH", tcp)
+    src = (socket.inet_ntoa(packet[12:16]), sport)
+    dst = (socket.inet_ntoa(packet[16:20]), dport)
+    return src, dst, tcp[(tcp[12] >> 4) * 4:]
+
+
+def port_events(path, port=6068):
+    """yield captured port up/down messages sent to ANCP port
+
+    Messages of each TCP connection are reassembled. Messages completed
+    by the same packet are returned together.
+
+    :param path: file path
+    :type path: str
+    :param port: ANCP server port (default=6068)
+    :type port: int
+    :rtype: iterator of (timestamp, [bytes])
+    """
+    streams = {}
+    for timestamp, linktype, packet in read(path):
+        result = tcp_payload(linktype, packet)
+        if result is None:
+            continue
+        src, dst, payload = result
+        if dst[1] != port or not payload:
+            continue
+        stream = streams.setdefault((src, dst), bytearray())
+        stream += payload
+        messages = []
+        off = 0
+        while len(stream) - off >= 4:
+            ident, length = codec.HEADER.unpack_from(stream, off)
+            if ident != codec.IDENT:
+                raise ValueError("%s: incorrect ident 0x%x" % (path, ident))
+            if len(stream) - off - 4 < length:
+                break
+            if length >= 2 and stream[off + 5] in (MessageType.PORT_UP, MessageType.PORT_DOWN):
+                messages.append(bytes(stream[off:off + 4 + length]))
+            off += 4 + length
+        del stream[:off]
+        if messages:
+            yield timestamp, messages
+
+
+def _aci(msg):
+    """return ACI of encoded port message or None"""
+    for tlv in codec.iter_tlvs(memoryview(msg), codec.PORT.size, len(msg)):
+        if tlv.type == TlvType.ACI:
+            return tlv.text
+    return None
+
+
+def _send(client, messages):
+    """send captured messages with transaction identifiers of the client
+
+    Messages are sent with the result field of the client, tracked and
+    limited by its window like port up/down messages (see
+    :meth:`ancp.protocol.Protocol.ack_all`).
+    """
+    window = client.window
+    metrics = client.metrics
+    result = struct.pack("!H", (client.result << 12) | ResultCodes.NoResult)
+    start = 0
+    while start < len(messages):
+        if window is None:
+            stop = len(messages)
+        else:
+            stop = min(len(messages), start + max(window - len(client.transactions), 1))
+        buf = bytearray()
+        # runs of messages with equal message type
+        for message_type, run in groupby(messages[start:stop], lambda m: m[5]):
+            run = list(run)
+            if window is None:
+                tid = client._next_tid(len(run))
+            else:
+                tid = client._track(message_type, [_aci(msg) for msg in run])
+            size = len(buf)
+            for msg in run:
+                offset = len(buf)
+                buf += msg
+                buf[offset + 6:offset + 8] = result
+                # keep partition id of the captured message
+                struct.pack_into("!I", buf, offset + 8, (msg[8] << 24) | (tid & 0xffffff))
+                tid += 1
+            if metrics is not None:
+                metrics.sent(message_type, len(run), len(buf) - size)
+        client._sendmsg([bytes(buf)])
+        client._wait_window()
+        start = stop
+
+
+def replay(path, client, speed=1.0, port=None):
+    """send captured port up/down messages again
+
+    Transaction identifiers are replaced by the next identifiers of the
+    client and tracked if result AckAll is enabled. Messages are sent at
+    their original timing divided by speed or as fast as possible if
+    speed is None.
+
+    :param path: file path
+    :type path: str
+    :param client: established ANCP client
+    :type client: ancp.client.Client
+    :param speed: replay speed factor (default=1.0, None: as fast as possible)
+    :type speed: float
+    :param port: ANCP server port of captured sessions (default: client port)
+    :type port: int
+    :return: number of messages and elapsed seconds
+    :rtype: dict
+    """
+    if not client.is_established():
+        raise RuntimeError("session not established")
+    port = client.port if port is None else port
+    start = monotonic()
+    first = None
+    count = 0
+    for timestamp, messages in port_events(path, port):
+        if speed:
+            if first is None:
+                first = timestamp
+            delay = start + (timestamp - first) / speed - monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if not client.is_established():
+            raise RuntimeError("session not established")
+        _send(client, messages)
+        count += len(messages)
+    return {"messages": count, "elapsed": monotonic() - start}
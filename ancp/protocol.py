@@ -0,0 +1,805 @@
+"""ANCP Protocol
+
+Sans-IO implementation of the ANCP adjacency protocol and message encoding.
+The protocol object does not own a socket or thread. Received bytes are
+passed to :meth:`Protocol.receive_data`, bytes to be sent are collected
+from :meth:`Protocol.data_to_send` and :meth:`Protocol.handle_timer` must
+be called once :meth:`Protocol.next_deadline` is reached.
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from ancp import codec
+from ancp import parallel
+from ancp.table import SubscriberTable, TableSlice
+from ancp.template import FrameTemplate
+from collections import OrderedDict
+from threading import Lock, Condition
+import logging
+import os
+
+try:
+    from collections.abc import Iterable, Sized
+except ImportError:
+    from collections import Iterable, Sized
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+try:
+    from time import perf_counter as clock
+except ImportError:
+    from time import time as clock
+
+log = logging.getLogger(__name__)
+
+
+VERSION_RFC = 50
+
+# max. number of buffers per scatter-gather IO call
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = -1
+if IOV_MAX <= 0:
+    IOV_MAX = 1024
+
+
+class MessageType(object):
+    ADJACENCY = 10
+    PORT_MANAGEMENT = 32
+    PORT_UP = 80
+    PORT_DOWN = 81
+    ADJACENCY_UPDATE = 85
+
+
+class AdjacencyState(object):
+    IDLE = 1
+    SYNSENT = 2
+    SYNRCVD = 3
+    ESTAB = 4
+
+
+class MessageCode(object):
+    SYN = 1
+    SYNACK = 2
+    ACK = 3
+    RSTACK = 4
+
+
+class TechTypes(object):
+    ANY = 0
+    PON = 1
+    DSL = 5
+
+
+class ResultFields(object):
+    Ignore = 0x00
+    Nack = 0x01
+    AckAll = 0x02
+    Success = 0x03
+    Failure = 0x04
+
+
+class ResultCodes(object):
+    NoResult = 0x000
+    InvalidRequest = 0x006
+    OutOfResources = 0x013
+    RequestNotImplemented = 0x051
+    PortDoesNotExist = 0x500
+    LoopbackTestTimeout = 0x501
+
+
+class Capabilities(object):
+    TOPO = 1
+    OAM = 4
+
+
+# HELPER FUNCTIONS AND CALSSES ------------------------------------------------
+
+def tomac(v):
+    """Tuple to MAC Address
+
+    :param v: MAC address
+    :type v: tuple
+    :return: MAC address
+    :rtype: str
+    """
+    return "%02x:%02x:%02x:%02x:%02x:%02x" % v
+
+
+def tosender(address):
+    """IPv4 Address to Sender Name
+
+    The sender name is created from the address (e.g. 1.2.3.4 is
+    converted to 01:02:03:04:00:00).
+
+    :param address: IPv4 address
+    :type address: str
+    :return: sender name
+    :rtype: tuple
+    """
+    _sender_name = [int(i) for i in address.split(".")]
+    _sender_name.extend([0, 0])
+    return tuple(_sender_name)
+
+
+class ReceiveBuffer(object):
+    """Reusable Receive Buffer
+
+    Data is received with `recv_into` directly into a preallocated buffer
+    and all complete messages are returned as memoryview (without ident
+    and length) referencing this buffer. A partial message at the end is
+    moved to the start of the buffer before the next read. The buffer is
+    replaced by a larger one if a message does not fit.
+
+    Returned messages are only valid until the next call of `recv_into`.
+
+    :param size: initial buffer size (default=65536)
+    :type size: int
+    """
+    def __init__(self, size=65536):
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        """number of buffered bytes"""
+        return self._end - self._start
+
+    def recv_into(self, sock):
+        """receive data from socket
+
+        :param sock: connected socket
+        :type sock: socket.socket
+        :return: number of bytes received (0 if connection is closed)
+        :rtype: int
+        """
+        start = self._start
+        end = self._end
+        if start:
+            # move partial message to start of buffer
+            end -= start
+            self._view[:end] = self._view[start:self._end]
+            self._start = 0
+            self._end = end
+        if end >= len(self._buffer) - 4:
+            size = len(self._buffer)
+            if end >= 4:
+                size = max(size, codec.HEADER.unpack_from(self._view)[1] + 4)
+            # previous messages may still reference the old buffer
+            buffer = bytearray(size * 2)
+            buffer[:end] = self._view[:end]
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+        nbytes = sock.recv_into(self._view[end:])
+        self._end = end + nbytes
+        return nbytes
+
+    def tail(self, nbytes):
+        """return the last nbytes received (e.g. for packet capture)
+
+        :rtype: memoryview
+        """
+        return self._view[self._end - nbytes:self._end]
+
+    def messages(self):
+        """iterator of complete messages
+
+        :raises ValueError: if ident is not 0x880C
+        :rtype: iterator of memoryview
+        """
+        view = self._view
+        off = self._start
+        end = self._end
+        unpack_from = codec.HEADER.unpack_from
+        while end - off >= 4:
+            (id, length) = unpack_from(view, off)
+            if id != codec.IDENT:
+                log.error("incorrect ident 0x%x", id)
+                raise ValueError("incorrect ident 0x%x" % id)
+            if end - off - 4 < length:
+                break
+            off += 4 + length
+            self._start = off
+            yield view[off - length:off]
+
+
+class Transaction(object):
+    """Port Up/Down Transaction sent in AckAll mode
+
+    :ivar transaction_id: transaction identifier
+    :ivar message_type: message type (port up or down)
+    :ivar aci: access loop circuit identifier of the subscriber
+    :ivar sent: time (monotonic) when the message was encoded
+    :ivar latency: seconds until the response was received (None if expired)
+    :ivar result: result field of response (None if expired)
+    :ivar result_code: result code of response (None if expired)
+    """
+    __slots__ = ("transaction_id", "message_type", "aci", "sent",
+                 "latency", "result", "result_code")
+
+    def __init__(self, transaction_id, message_type, aci, sent):
+        self.transaction_id = transaction_id
+        self.message_type = message_type
+        self.aci = aci
+        self.sent = sent
+        self.latency = None
+        self.result = None
+        self.result_code = None
+
+    def __repr__(self):
+        return "Transaction(%d, %s)" % (self.transaction_id, self.aci)
+
+
+# ANCP PROTOCOL ---------------------------------------------------------------
+
+class Protocol(object):
+    """ANCP Protocol (sans-IO)
+
+    :param tech_type: tech type (default=DSL)
+    :type tech_type: ancp.client.TechTypes
+    :param timer: adjacency timer (default=25.0)
+    :type timer: int
+    :param sender_name: sender name (default=01:02:03:04:05:06)
+    :type sender_name: tuple
+    """
+    def __init__(self, tech_type=TechTypes.DSL, timer=25.0, sender_name=(1, 2, 3, 4, 5, 6)):
+        self.timer = timer  # adjacency timer
+        self.timeout = 1.0  # SYN retransmit timer
+        self.chunk_size = 65536  # max. bytes encoded before sending
+        self._last_syn_time = None
+        self._rx_buffer = bytearray()
+        self._tx_buffer = bytearray()
+
+        self.metrics = None  # ancp.metrics.Metrics
+        self.encoder = None  # ancp.parallel.ParallelEncoder
+        self.version = VERSION_RFC
+        self.tech_type = tech_type
+        self._state = AdjacencyState.IDLE
+        self.capabilities = [Capabilities.TOPO]
+        self.peer_capabilities = []
+        self.oam = None  # ancp.oam.OamDispatcher (see ancp.client.Client.enable_oam)
+        self.transaction_id = 1
+        self._tid_lock = Lock()
+        # AckAll transaction tracking (see ack_all)
+        self.result = ResultFields.Nack
+        self.window = None
+        self.transaction_timeout = 10.0
+        self.transactions = OrderedDict()
+        self._callback = None
+        self._window_cond = Condition(self._tid_lock)
+        self.sender_name = sender_name
+        self.sender_instance = 16777217
+        self.sender_port = 0
+        self.receiver_name = (0, 0, 0,  0, 0, 0)
+        self.receiver_instance = 0
+        self.receiver_port = 0
+        self.closed = False
+        # message dispatch tables
+        self._handlers = {
+            MessageType.ADJACENCY: self._handle_adjacency,
+            MessageType.ADJACENCY_UPDATE: self._handle_adjacency_update,
+            MessageType.PORT_UP: self._handle_port_updown,
+            MessageType.PORT_DOWN: self._handle_port_updown,
+            MessageType.PORT_MANAGEMENT: self._handle_port_management,
+        }
+        self._adjacency_handlers = {
+            MessageCode.SYN: self._handle_syn,
+            MessageCode.SYNACK: self._handle_synack,
+            MessageCode.ACK: self._handle_ack,
+            MessageCode.RSTACK: self._handle_rstack,
+        }
+
+    @property
+    def state(self):
+        """adjacency state"""
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        if self.metrics is not None and state != self._state:
+            self.metrics.transition(self._state, state)
+        self._state = state
+
+    def initiate(self):
+        """start adjacency by sending SYN"""
+        self.closed = False
+        self._send_syn()
+
+    def receive_data(self, data):
+        """process received bytes
+
+        Partial messages are buffered until the rest is received.
+        An empty byte string signals that the connection is lost.
+
+        :param data: received bytes
+        :type data: bytes
+        :return: list of received messages
+        :rtype: [ancp.codec.Message]
+        """
+        if len(data) == 0:
+            log.warning("connection lost with %s ", tomac(self.receiver_name))
+            self.closed = True
+            self._connection_lost()
+            return []
+        if self._rx_buffer:
+            # continue partial message
+            data = bytes(self._rx_buffer + data)
+            del self._rx_buffer[:]
+        view = memoryview(data)
+        size = len(view)
+        messages = []
+        off = 0
+        while size - off >= 4:
+            (id, length) = codec.HEADER.unpack_from(view, off)
+            if id != codec.IDENT:
+                log.error("incorrect ident 0x%x", id)
+                raise ValueError("incorrect ident 0x%x" % id)
+            if size - off - 4 < length:
+                break
+            messages.append(self._handle_message(view[off + 4:off + 4 + length]))
+            off += 4 + length
+        if off < size:
+            self._rx_buffer += view[off:]
+        return messages
+
+    def data_to_send(self):
+        """return and clear bytes to be sent
+
+        :rtype: bytes
+        """
+        b = bytes(self._tx_buffer)
+        del self._tx_buffer[:]
+        return b
+
+    def next_deadline(self):
+        """return time (monotonic) when handle_timer must be called
+
+        :return: deadline or None if no timer is running
+        :rtype: float
+        """
+        deadline = self._adjacency_deadline()
+        if self.transactions:
+            expire = self._transaction_deadline()
+            if expire is not None and (deadline is None or expire < deadline):
+                return expire
+        return deadline
+
+    def handle_timer(self, now=None):
+        """handle expired timers
+
+        :param now: current time (monotonic)
+        :type now: float
+        """
+        now = now or monotonic()
+        deadline = self._adjacency_deadline()
+        if deadline is not None and now >= deadline:
+            self._send_syn()
+        if self.transactions:
+            self._expire_transactions(now)
+
+    def ack_all(self, window=1000, callback=None, timeout=10.0):
+        """enable AckAll mode for port up/down messages
+
+        Port up/down messages are sent with result AckAll and tracked
+        until the response with the same transaction identifier is received
+        or the transaction is expired. Not more than `window` transactions
+        are outstanding, further messages are delayed until responses are
+        received (backpressure).
+
+        :param window: max. number of outstanding transactions (default=1000)
+        :type window: int
+        :param callback: called with :class:`Transaction` if completed or expired
+        :type callback: callable
+        :param timeout: seconds until transactions are expired (default=10.0)
+        :type timeout: float
+        """
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.result = ResultFields.AckAll
+        self.window = window
+        self.transaction_timeout = timeout
+        self._callback = callback
+
+    @property
+    def negotiated(self):
+        """capabilities supported by both peers"""
+        return [c for c in self.capabilities if c in self.peer_capabilities]
+
+    @property
+    def in_flight(self):
+        """number of outstanding transactions"""
+        return len(self.transactions)
+
+    def is_established(self):
+        """return True if adjacency is established"""
+        return self.state == AdjacencyState.ESTAB
+
+    def port_up(self, subscribers):
+        """send port-up message
+
+        For backwards compability single value ANCP subscribers are accepted.
+        Any iterable (e.g. generator) of subscribers is accepted and sent
+        in chunks of up to `chunk_size` bytes. Subscriber tables and frame
+        templates (:class:`ancp.template.FrameTemplate`) are accepted too.
+
+        :param subscriber: collection of ANCP subscribers
+        :type subscriber: [ancp.subscriber.Subscriber]
+        """
+        for buffers in self._port_updown(MessageType.PORT_UP, subscribers):
+            self._sendmsg(buffers)
+            self._wait_window()
+
+    def port_down(self, subscribers):
+        """send port-down message
+
+        For backwards compability single value ANCP subscribers are accepted.
+        Any iterable (e.g. generator) of subscribers is accepted and sent
+        in chunks of up to `chunk_size` bytes.
+
+        :param subscriber: collection of ANCP subscribers
+        :type subscriber: [ancp.subscriber.Subscriber]
+        """
+        for buffers in self._port_updown(MessageType.PORT_DOWN, subscribers):
+            self._sendmsg(buffers)
+            self._wait_window()
+
+    # internal methods --------------------------------------------------------
+
+    def _sendall(self, b, priority=False):
+        self._tx_buffer += b
+
+    def _sendmsg(self, buffers):
+        for b in buffers:
+            self._tx_buffer += b
+
+    def _wait_window(self):
+        """wait until window is open (sans-IO: not waiting)"""
+        pass
+
+    def _window_open(self):
+        """called if outstanding transactions are completed or expired"""
+        self._window_cond.notify_all()
+
+    def _next_tid(self, count=1):
+        with self._tid_lock:
+            tid = self.transaction_id
+            self.transaction_id += count
+        return tid
+
+    def _track(self, message_type, acis):
+        """allocate consecutive transaction identifiers and track them
+
+        :return: first transaction identifier
+        :rtype: int
+        """
+        now = monotonic()
+        transactions = self.transactions
+        with self._tid_lock:
+            tid = first = self.transaction_id
+            for aci in acis:
+                transactions[tid] = Transaction(tid, message_type, aci, now)
+                tid += 1
+            self.transaction_id = tid
+        return first
+
+    def _complete(self, msg):
+        with self._tid_lock:
+            transaction = self.transactions.pop(msg.transaction_id, None)
+            if transaction is not None:
+                self._window_open()
+        if transaction is not None:
+            transaction.latency = monotonic() - transaction.sent
+            transaction.result = msg.result
+            transaction.result_code = msg.result_code
+            if self._callback is not None:
+                self._callback(transaction)
+        return transaction
+
+    def _adjacency_deadline(self):
+        if self.state == AdjacencyState.SYNSENT:
+            return self._last_syn_time + self.timeout
+        elif self.state == AdjacencyState.ESTAB:
+            # send every self.timer seconds a SYN, ... (keep-alive)
+            return self._last_syn_time + self.timer
+        return None
+
+    def _transaction_deadline(self):
+        with self._tid_lock:
+            for transaction in self.transactions.values():
+                # oldest transaction first
+                return transaction.sent + self.transaction_timeout
+        return None
+
+    def _expire_transactions(self, now):
+        expired = []
+        with self._tid_lock:
+            transactions = self.transactions
+            limit = now - self.transaction_timeout
+            while transactions:
+                tid, transaction = next(iter(transactions.items()))
+                if transaction.sent > limit:
+                    break
+                del transactions[tid]
+                expired.append(transaction)
+            if expired:
+                self._window_open()
+        for transaction in expired:
+            log.warning("transaction %d expired", transaction.transaction_id)
+            if self._callback is not None:
+                self._callback(transaction)
+
+    def _established(self):
+        log.info("adjacency established with %s", tomac(self.receiver_name))
+
+    def _connection_lost(self):
+        pass
+
+    def _handle_message(self, b):
+        """handle single message (without ident and length)"""
+        msg = codec.decode(b)
+        if self.metrics is not None:
+            self.metrics.received(msg.message_type, len(b) + 4)
+        s0 = self.state
+        self._handlers.get(msg.message_type, self._handle_general)(msg)
+        if s0 != self.state and self.state == AdjacencyState.ESTAB:
+            self._established()
+        return msg
+
+    def _port_updown(self, message_type, subscribers):
+        """return iterator of encoded port up/down message chunks"""
+        if isinstance(subscribers, FrameTemplate):
+            if len(subscribers) == 0:
+                raise ValueError("No Subscribers passed")
+        elif not isinstance(subscribers, Iterable):
+            subscribers = [subscribers]
+        elif isinstance(subscribers, Sized) and len(subscribers) == 0:
+            raise ValueError("No Subscribers passed")
+        if not self.is_established():
+            raise RuntimeError("session not established")
+
+        return self._encode_port_updwn(message_type, self.tech_type, subscribers)
+
+    def _mkadjac(self, mtype, time, m, code):
+        return codec.mkadjac(self.version, mtype, int(self.timer * 10), m, code,
+                             bytes(bytearray(self.sender_name)),
+                             bytes(bytearray(self.receiver_name)),
+                             self.sender_port, self.receiver_port,
+                             self.sender_instance, self.receiver_instance,
+                             self.capabilities)
+
+    def _send_adjac(self, m, code):
+        log.debug("send adjanecy message with code %s", (code))
+        b = self._mkadjac(MessageType.ADJACENCY, self.timer * 10, m, code)
+        if self.metrics is not None:
+            self.metrics.sent(MessageType.ADJACENCY, 1, len(b))
+        self._sendall(b, priority=True)
+
+    def _send_syn(self):
+        if self.metrics is not None and self.state == AdjacencyState.ESTAB:
+            self.metrics.keepalive()
+        self._send_adjac(0, MessageCode.SYN)
+        self.state = AdjacencyState.SYNSENT
+        self._last_syn_time = monotonic()
+
+    def _send_ack(self):
+        self._send_adjac(0, MessageCode.ACK)
+
+    def _send_synack(self):
+        self._send_adjac(0, MessageCode.SYNACK)
+        self.state = AdjacencyState.SYNRCVD
+
+    def _send_rstack(self):
+        self._send_adjac(0, MessageCode.RSTACK)
+        self.state = AdjacencyState.SYNRCVD
+
+    def _handle_syn(self):
+        log.debug("SYN received with current state %d", self.state)
+        if self.state == AdjacencyState.SYNSENT:
+            self._send_synack()
+        elif self.state == AdjacencyState.SYNRCVD:
+            self._send_synack()
+        elif self.state == AdjacencyState.ESTAB:
+            self._send_ack()
+        elif self.state == AdjacencyState.IDLE:
+            self._send_syn()
+        else:
+            log.warning('SYN not expected in state: %d', self.state)
+
+    def _handle_synack(self):
+        log.debug("SYNACK received with current state %d", self.state)
+        if self.state == AdjacencyState.SYNSENT:
+            # C !C ??
+            self._send_ack()
+            self.state = AdjacencyState.ESTAB
+        elif self.state == AdjacencyState.SYNRCVD:
+            # C !C ??
+            self._send_ack()
+        elif self.state == AdjacencyState.ESTAB:
+            self._send_ack()
+        else:
+            log.warning('SYNACK not expected in state: %d', self.state)
+
+    def _handle_ack(self):
+        log.debug("ACK received with current state %d", self.state)
+        if self.state == AdjacencyState.ESTAB:
+            self._send_ack()
+        else:
+            self.state = AdjacencyState.ESTAB
+
+    def _handle_rstack(self):
+        log.debug("RSTACK received with current state %d", self.state)
+        if self.state == AdjacencyState.SYNSENT:
+            pass
+        else:
+            # disconnect
+            self._send_ack()
+            self.closed = True
+
+    def _handle_adjacency(self, msg):
+        if msg.m == 0:
+            log.error("received M flag 0 in AN mode")
+            raise RuntimeError("Trying to synchronize with other AN")
+        self.receiver_name = msg.sender_name
+        self.receiver_instance = msg.sender_instance & 16777215
+        if msg.code in (MessageCode.SYN, MessageCode.SYNACK):
+            self.peer_capabilities = msg.capabilities
+        handler = self._adjacency_handlers.get(msg.code)
+        if handler is None:
+            log.warning("unknown code %d" % msg.code)
+        else:
+            handler()
+
+    def _handle_adjacency_update(self, msg):
+        pass
+
+    def _handle_port_updown(self, msg):
+        if self.transactions and self._complete(msg) is not None:
+            return
+        if msg.message_type == MessageType.PORT_UP:
+            log.warning("received port up in AN mode")
+        else:
+            log.warning("received port down in AN mode")
+
+    def _handle_port_management(self, msg):
+        if self.oam is None or Capabilities.OAM not in self.negotiated:
+            log.warning("port management request without OAM capability")
+            return
+        self.oam.submit(self, msg)
+
+    def _handle_general(self, msg):
+        pass
+
+    def _mkgeneral(self, message_type, result, result_code, body):
+        partition_id = 0
+        return codec.mkgeneral(self.version, message_type, result, result_code,
+                               (partition_id << 24) | self._next_tid(), body)
+
+    def _encode_parallel(self, message_type, tech_type, subscribers, result):
+        """encode port up/down messages on the worker pool of `encoder`
+
+        Transaction identifiers are assigned here in send order.
+        """
+        window = self.window
+        metrics = self.metrics
+        sent = 0
+        t0 = clock()
+        for buf, offsets, acis in self.encoder.encode(subscribers, message_type, tech_type, self.version, result):
+            start = 0
+            count = len(offsets)
+            while start < count:
+                if window is None:
+                    stop = count
+                    tid = self._next_tid(stop - start)
+                else:
+                    stop = min(count, start + max(window - len(self.transactions), 1))
+                    tid = self._track(message_type, acis[start:stop])
+                parallel.patch(buf, offsets[start:stop], tid)
+                end = offsets[stop] if stop < count else len(buf)
+                msg = memoryview(buf)[offsets[start]:end]
+                if metrics is not None:
+                    metrics.encode_time.observe(clock() - t0)
+                    metrics.sent(message_type, stop - start, len(msg))
+                sent += stop - start
+                start = stop
+                yield [msg]
+                t0 = clock()
+        if sent == 0:
+            raise ValueError("No valid Subscriber passed")
+
+    def _send_port_updwn(self, message_type, tech_type, subscribers):
+        for buffers in self._encode_port_updwn(message_type, tech_type, subscribers):
+            self._sendmsg(buffers)
+
+    def _encode_port_updwn(self, message_type, tech_type, subscribers):
+        """encode port up/down messages
+
+        Yields lists of buffers (message header and TLVs) with up to
+        chunk_size bytes and IOV_MAX buffers which can be sent without
+        copying using scatter-gather IO.
+        """
+        window = self.window
+        metrics = self.metrics
+        result = (self.result << 12) | ResultCodes.NoResult
+        t0 = clock()
+        if isinstance(subscribers, (SubscriberTable, TableSlice, FrameTemplate)):
+            template = isinstance(subscribers, FrameTemplate)
+            rows = max(self.chunk_size // 128, 1)
+            start = 0
+            count = len(subscribers)
+            while start < count:
+                stop = min(start + rows, count)
+                if window is not None:
+                    stop = min(stop, start + max(window - len(self.transactions), 1))
+                if template:
+                    # patch pre-encoded messages in place
+                    if window is None:
+                        tid = self._next_tid(stop - start)
+                    else:
+                        tid = self._track(message_type, subscribers.aci[start:stop])
+                    msg = subscribers.patch(message_type, tid, self.version, tech_type, self.result, start, stop)
+                else:
+                    rows_slice = subscribers[start:stop]
+                    if window is None:
+                        tid = self._next_tid(stop - start)
+                    else:
+                        tid = self._track(message_type, rows_slice.table.aci[rows_slice.start:rows_slice.stop])
+                    _, msg = rows_slice.encode(message_type, tech_type, self.version, tid, self.result)
+                if metrics is not None:
+                    metrics.encode_time.observe(clock() - t0)
+                    metrics.sent(message_type, stop - start, len(msg))
+                start = stop
+                yield [msg]
+                t0 = clock()
+            return
+        if self.encoder is not None:
+            for buffers in self._encode_parallel(message_type, tech_type, subscribers, result):
+                yield buffers
+            return
+        buffers = []
+        size = 0
+        sent = 0
+        chunk_size = self.chunk_size
+        iov_max = IOV_MAX - 1
+        pack = codec.PORT.pack
+        version = self.version
+        for subscriber in subscribers:
+            try:
+                num_tlvs, tlvs = subscriber.tlvs
+            except:
+                log.warning("subscriber is not of type ancp.subscriber.Subscriber: skip")
+                continue
+            if window is None:
+                tid = self._next_tid()
+            else:
+                tid = self._track(message_type, (subscriber.aci,))
+            length = codec.PORT.size - 4 + len(tlvs)
+            buffers.append(pack(codec.IDENT, length, version, message_type, result,
+                                tid, 0x8001, length, message_type,
+                                tech_type, num_tlvs, len(tlvs)))
+            buffers.append(tlvs)
+            size += length + 4
+            if (size >= chunk_size or len(buffers) >= iov_max or
+                    (window is not None and len(self.transactions) >= window)):
+                # chunk or window is full
+                if metrics is not None:
+                    metrics.encode_time.observe(clock() - t0)
+                    metrics.sent(message_type, len(buffers) >> 1, size)
+                sent += size
+                yield buffers
+                buffers = []
+                size = 0
+                t0 = clock()
+        if sent + size == 0:
+            raise ValueError("No valid Subscriber passed")
+        if buffers:
+            if metrics is not None:
+                metrics.encode_time.observe(clock() - t0)
+                metrics.sent(message_type, len(buffers) >> 1, size)
+            yield buffers
@@ -0,0 +1,298 @@
+"""ANCP Traffic Profile Scheduler
+
+The scheduler sends paced port up/down messages (port churn) according to
+a traffic profile. Events due within a scheduler tick are sent as a single
+batch which allows accurate pacing at high event rates.
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from ancp.protocol import monotonic
+from ancp.subscriber import LineState
+from abc import ABC, abstractmethod
+from threading import Thread, Event
+import random
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+
+# TRAFFIC PROFILES ------------------------------------------------------------
+
+class Profile(ABC):
+    """Traffic Profile (abstract base class)
+
+    Subclasses implement :meth:`expected`.
+
+    :param duration: profile duration in seconds (default: unlimited)
+    :type duration: float
+    """
+    burst = None
+
+    def __init__(self, duration=None):
+        self.duration = duration
+
+    @abstractmethod
+    def expected(self, t):
+        """expected number of events from start to t
+
+        :param t: seconds since start
+        :type t: float
+        :rtype: float
+        """
+
+    def tokens(self, t0, t1):
+        """number of events in time interval [t0, t1)
+
+        :rtype: float
+        """
+        return self.expected(t1) - self.expected(t0)
+
+
+class ConstantRate(Profile):
+    """Constant Rate (Token Bucket)
+
+    :param rate: events per second
+    :type rate: float
+    :param burst: bucket size (default: 100ms of events)
+    :type burst: int
+    :param duration: profile duration in seconds (default: unlimited)
+    :type duration: float
+    """
+    def __init__(self, rate, burst=None, duration=None):
+        super(ConstantRate, self).__init__(duration)
+        self.rate = float(rate)
+        self.burst = burst or max(self.rate / 10, 1)
+
+    def __repr__(self):
+        return "ConstantRate(%s/s)" % self.rate
+
+    def expected(self, t):
+        return self.rate * t
+
+
+class LinearRamp(Profile):
+    """Linear Ramp from start rate to end rate
+
+    :param start_rate: events per second at start
+    :type start_rate: float
+    :param end_rate: events per second after duration
+    :type end_rate: float
+    :param duration: ramp duration in seconds
+    :type duration: float
+    """
+    def __init__(self, start_rate, end_rate, duration):
+        super(LinearRamp, self).__init__(duration)
+        self.start_rate = float(start_rate)
+        self.end_rate = float(end_rate)
+
+    def __repr__(self):
+        return "LinearRamp(%s/s -> %s/s, %ss)" % (self.start_rate, self.end_rate, self.duration)
+
+    def expected(self, t):
+        t = min(t, self.duration)
+        slope = (self.end_rate - self.start_rate) / self.duration
+        return self.start_rate * t + slope * t * t / 2
+
+
+class PoissonChurn(Profile):
+    """Poisson Churn with exponentially distributed inter-arrival times
+
+    :param rate: mean events per second
+    :type rate: float
+    :param duration: profile duration in seconds (default: unlimited)
+    :type duration: float
+    :param seed: optional random seed
+    :type seed: int
+    """
+    def __init__(self, rate, duration=None, seed=None):
+        super(PoissonChurn, self).__init__(duration)
+        self.rate = float(rate)
+        self._random = random.Random(seed)
+        self._next = self._random.expovariate(self.rate)
+
+    def __repr__(self):
+        return "PoissonChurn(%s/s)" % self.rate
+
+    def expected(self, t):
+        return self.rate * t
+
+    def tokens(self, t0, t1):
+        n = 0
+        while self._next < t1:
+            self._next += self._random.expovariate(self.rate)
+            n += 1
+        return n
+
+
+class Flapping(ConstantRate):
+    """Flapping between SHOWTIME and IDLE
+
+    Each subscriber changes its line state every period seconds.
+
+    :param subscribers: number of flapping subscribers
+    :type subscribers: int
+    :param period: seconds between line state changes of a subscriber
+    :type period: float
+    :param duration: profile duration in seconds (default: unlimited)
+    :type duration: float
+    """
+    flap = True
+
+    def __init__(self, subscribers, period, duration=None):
+        super(Flapping, self).__init__(subscribers / float(period), duration=duration)
+        self.period = period
+
+    def __repr__(self):
+        return "Flapping(%s/s, period %ss)" % (self.rate, self.period)
+
+
+# SCHEDULER -------------------------------------------------------------------
+
+class Scheduler(object):
+    """Traffic Profile Scheduler
+
+    Every event takes the next subscriber (round robin) and toggles its port
+    by sending port-down if the port is up or port-up otherwise. With
+    `flap` enabled (default for :class:`Flapping`) the line state is changed
+    between SHOWTIME (port-up) and IDLE (port-down).
+
+    Subscribers with line state SHOWTIME are considered up at start.
+
+    :param client: ANCP client (or any object with port_up/port_down)
+    :type client: ancp.client.Client
+    :param subscribers: subscribers to be used
+    :type subscribers: [ancp.subscriber.Subscriber]
+    :param profile: traffic profile
+    :type profile: ancp.scheduler.Profile
+    :param flap: change line state (default: profile specific)
+    :type flap: bool
+    :param interval: scheduler tick in seconds (default=0.001)
+    :type interval: float
+    """
+    def __init__(self, client, subscribers, profile, flap=None, interval=0.001):
+        if len(subscribers) == 0:
+            raise ValueError("No Subscribers passed")
+        self.client = client
+        self.subscribers = list(subscribers)
+        self.profile = profile
+        self.flap = getattr(profile, "flap", False) if flap is None else flap
+        self.interval = interval
+        self.events = 0
+        self.elapsed = 0.0
+        self._up = [s.state == LineState.SHOWTIME for s in self.subscribers]
+        self._index = 0
+        self._stop = Event()
+        self._thread = None
+
+    def __repr__(self):
+        return "Scheduler(%r, %d subscribers)" % (self.profile, len(self.subscribers))
+
+    def start(self, duration=None):
+        """start scheduler in background thread
+
+        :param duration: run time in seconds (default: profile duration)
+        :type duration: float
+        """
+        self._stop.clear()
+        self._thread = Thread(target=self.run, args=(duration,), name="scheduler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """stop scheduler"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def join(self, timeout=None):
+        """wait for scheduler"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self, duration=None):
+        """run scheduler until duration (default: profile duration) or stop
+
+        :param duration: run time in seconds
+        :type duration: float
+        :return: report
+        :rtype: dict
+        """
+        duration = duration or self.profile.duration
+        burst = self.profile.burst
+        credit = 0.0
+        start = last = monotonic()
+        tick = start
+        while not self._stop.is_set():
+            now = monotonic()
+            t = now - start
+            if duration is not None and t >= duration:
+                t = duration
+            credit += self.profile.tokens(last - start, t)
+            if burst is not None and credit > burst:
+                credit = burst
+            last = start + t
+            n = int(credit)
+            if n:
+                credit -= n
+                self._send(n)
+            self.elapsed = t
+            if duration is not None and t >= duration:
+                break
+            tick += self.interval
+            delay = tick - monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                tick = monotonic()
+        return self.report()
+
+    def report(self):
+        """return target and achieved event rate
+
+        :rtype: dict
+        """
+        elapsed = self.elapsed
+        target = self.profile.expected(elapsed)
+        return {
+            "events": self.events,
+            "elapsed": elapsed,
+            "target_events": target,
+            "target_rate": target / elapsed if elapsed else 0.0,
+            "achieved_rate": self.events / elapsed if elapsed else 0.0,
+        }
+
+    # internal methods --------------------------------------------------------
+
+    def _send(self, n):
+        subscribers = self.subscribers
+        count = len(subscribers)
+        events = n
+        # each subscriber is toggled at most once per batch, so the
+        # final state of a subscriber is sent last
+        while n:
+            ups = []
+            downs = []
+            for _ in range(min(n, count)):
+                i = self._index
+                self._index = (i + 1) % count
+                subscriber = subscribers[i]
+                if self._up[i]:
+                    self._up[i] = False
+                    if self.flap:
+                        subscriber.state = LineState.IDLE
+                    downs.append(subscriber)
+                else:
+                    self._up[i] = True
+                    if self.flap:
+                        subscriber.state = LineState.SHOWTIME
+                    ups.append(subscriber)
+            n -= len(ups) + len(downs)
+            if ups:
+                self.client.port_up(ups)
+            if downs:
+                self.client.port_down(downs)
+        self.events += events
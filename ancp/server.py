@@ -0,0 +1,361 @@
+"""ANCP Server (NAS)
+
+Minimal ANCP server acting as NAS for load and integration tests on
+localhost. The server accepts many adjacencies on a single asyncio event
+loop, answers the adjacency protocol of :class:`ancp.client.Client` and
+decodes port up/down messages with :mod:`ancp.codec`.
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.protocol import (Protocol, MessageType, MessageCode, AdjacencyState,
+                           ResultFields, ResultCodes, Capabilities, TechTypes, tomac)
+from ancp.subscriber import TlvType
+from ancp.oam import Function, mktlvs
+from ancp import codec
+from collections import OrderedDict
+from threading import Thread, Event, Lock
+import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+
+
+# NAS SESSION -----------------------------------------------------------------
+
+class NasSession(Protocol):
+    """ANCP Session of the NAS with a single access node
+
+    Port up/down messages are counted and the port state is stored per
+    access loop circuit ID in :attr:`ports` (True if up). Messages with
+    result AckAll are answered with result Success and the TLVs of the
+    request. Responses to port management requests are stored by
+    transaction identifier in :attr:`responses`.
+
+    :param peer: access node address (host, port)
+    :type peer: tuple
+    :param timer: adjacency timer
+    :type timer: float
+    :param sender_name: NAS sender name
+    :type sender_name: tuple
+    """
+    def __init__(self, peer, timer=25.0, sender_name=(10, 0, 0, 0, 0, 1)):
+        super(NasSession, self).__init__(timer=timer, sender_name=sender_name)
+        self.peer = peer
+        self.ports = {}
+        self.port_up_count = 0
+        self.port_down_count = 0
+        self.rx_messages = 0
+        self.rx_bytes = 0
+        self.tech_types = set()
+        self.capabilities = [Capabilities.TOPO, Capabilities.OAM]
+        self.responses = OrderedDict()
+        self.transport = None
+
+    def __repr__(self):
+        return "NasSession(%s:%s, %s)" % (self.peer[0], self.peer[1], tomac(self.receiver_name))
+
+    def receive_data(self, data):
+        self.rx_bytes += len(data)
+        return super(NasSession, self).receive_data(data)
+
+    @property
+    def ports_up(self):
+        """number of ports up"""
+        return sum(1 for up in self.ports.values() if up)
+
+    def port_management(self, aci, function=Function.CONFIGURE_CONNECTIVITY_TEST, tlvs=None,
+                        result=ResultFields.AckAll):
+        """encode port management request (see :meth:`Server.port_management`)
+
+        :return: transaction identifier
+        :rtype: int
+        """
+        num_tlvs, b = mktlvs([(TlvType.ACI, aci)] + list(tlvs or []))
+        tid = self._next_tid()
+        self._sendall(codec.mkportmgmt(self.version, result, ResultCodes.NoResult, tid,
+                                       0, 0, 0, 0, function, 0, TechTypes.DSL, num_tlvs, b))
+        return tid
+
+    # internal methods --------------------------------------------------------
+
+    def _established(self):
+        log.info("adjacency established with %s", tomac(self.receiver_name))
+
+    def _handle_message(self, b):
+        self.rx_messages += 1
+        return super(NasSession, self)._handle_message(b)
+
+    def _send_adjac(self, m, code):
+        # messages from NAS are sent with M flag set
+        super(NasSession, self)._send_adjac(1, code)
+
+    def _handle_adjacency(self, msg):
+        if msg.m == 1:
+            log.error("received M flag 1 in NAS mode")
+            raise RuntimeError("Trying to synchronize with other NAS")
+        self.receiver_name = msg.sender_name
+        self.receiver_instance = msg.sender_instance & 16777215
+        self.receiver_port = msg.sender_port
+        if msg.code in (MessageCode.SYN, MessageCode.SYNACK):
+            self.peer_capabilities = msg.capabilities
+        handler = self._adjacency_handlers.get(msg.code)
+        if handler is None:
+            log.warning("unknown code %d" % msg.code)
+        else:
+            handler()
+
+    def _handle_syn(self):
+        log.debug("SYN received with current state %d", self.state)
+        if self.state == AdjacencyState.ESTAB:
+            # keep-alive
+            self._send_ack()
+        else:
+            self._send_adjac(1, MessageCode.SYNACK)
+            self.state = AdjacencyState.SYNRCVD
+
+    def _handle_synack(self):
+        log.debug("SYNACK received with current state %d", self.state)
+        self._send_ack()
+
+    def _handle_ack(self):
+        log.debug("ACK received with current state %d", self.state)
+        if self.state == AdjacencyState.SYNRCVD:
+            self.state = AdjacencyState.ESTAB
+
+    def _handle_rstack(self):
+        log.debug("RSTACK received with current state %d", self.state)
+        self._send_ack()
+        self.state = AdjacencyState.IDLE
+        self.closed = True
+
+    def _handle_port_updown(self, msg):
+        up = msg.message_type == MessageType.PORT_UP
+        if up:
+            self.port_up_count += 1
+        else:
+            self.port_down_count += 1
+        self.tech_types.add(msg.tech_type)
+        view = msg.view
+        off = msg.offset
+        tlv_type, length = codec.TLV_HEADER.unpack_from(view, off) if len(view) >= off + 4 else (0, 0)
+        if tlv_type == TlvType.ACI:
+            # fast path: ACI is the first TLV
+            self.ports[bytes(view[off + 4:off + 4 + length]).decode("utf-8")] = up
+        else:
+            for tlv in msg.tlvs:
+                if tlv.type == TlvType.ACI:
+                    self.ports[tlv.text] = up
+                    break
+        if msg.result == ResultFields.AckAll:
+            tlvs = bytes(view[off:off + msg.tlv_length])
+            self._sendall(codec.mkport(self.version, msg.message_type, ResultFields.Success,
+                                       ResultCodes.NoResult, msg.transaction_id,
+                                       msg.tech_type, msg.num_tlvs, tlvs) + tlvs)
+
+    def _handle_port_management(self, msg):
+        # response of access node (copied as the receive buffer is reused)
+        self.responses[msg.transaction_id] = codec.decode(memoryview(msg.view.tobytes()))
+
+
+# ANCP SERVER -----------------------------------------------------------------
+
+class _Connection(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.session = None
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        peer = transport.get_extra_info("peername")[:2]
+        self.session = NasSession(peer, timer=self.server.timer, sender_name=self.server.sender_name)
+        self.session.transport = transport
+        with self.server._lock:
+            self.server.sessions[peer] = self.session
+            self.server.accepted += 1
+
+    def data_received(self, data):
+        session = self.session
+        try:
+            session.receive_data(data)
+        except (ValueError, RuntimeError) as e:
+            log.error("session %s:%s: %s", session.peer[0], session.peer[1], e)
+            self.server.errors += 1
+            session.closed = True
+        b = session.data_to_send()
+        if b:
+            self.transport.write(b)
+        if session.closed:
+            self.transport.close()
+
+    def connection_lost(self, exc):
+        session = self.session
+        session.state = AdjacencyState.IDLE
+        session.closed = True
+        self.server._remove(session)
+
+
+class Server(object):
+    """ANCP Server (NAS)
+
+    The server can be started in a background thread (:meth:`start`) or
+    from a running asyncio event loop (:meth:`listen`). Sessions are
+    removed from :attr:`sessions` when the connection is closed, their
+    message counters are kept in :meth:`counters`.
+
+    :param address: listen address (default=127.0.0.1)
+    :type address: str
+    :param port: listen port (default: 6068, 0 for any free port)
+    :type port: int
+    :param timer: adjacency timer (default=25.0)
+    :type timer: float
+    :param sender_name: NAS sender name (default=0a:00:00:00:00:01)
+    :type sender_name: tuple
+    """
+    def __init__(self, address="127.0.0.1", port=6068, timer=25.0, sender_name=(10, 0, 0, 0, 0, 1)):
+        self.address = address
+        self.port = port
+        self.timer = timer
+        self.sender_name = sender_name
+        self.sessions = OrderedDict()
+        self.accepted = 0
+        self.errors = 0
+        # counters of closed sessions
+        self._closed = {"port_up": 0, "port_down": 0, "rx_messages": 0, "rx_bytes": 0, "port_management": 0}
+        self._lock = Lock()
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    def __repr__(self):
+        return "Server(%s:%s, %d sessions)" % (self.address, self.port, len(self.sessions))
+
+    async def listen(self):
+        """start listening from running event loop"""
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: _Connection(self), self.address, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """stop listening and close all connections"""
+        self._server.close()
+        with self._lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.transport.close()
+        await self._server.wait_closed()
+
+    def start(self):
+        """start server in background thread
+
+        :return: listen port
+        :rtype: int
+        """
+        ready = Event()
+        errors = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self.listen())
+            except Exception as e:
+                errors.append(e)
+                ready.set()
+                return
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.close())
+            self._loop.close()
+
+        self._thread = Thread(target=run, name="ancp-server")
+        self._thread.daemon = True
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self.port
+
+    def stop(self):
+        """stop background thread"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def port_management(self, session, acis, function=Function.CONFIGURE_CONNECTIVITY_TEST,
+                        tlvs=None, result=ResultFields.AckAll):
+        """send port management requests (e.g. connectivity tests) to access node
+
+        Thread-safe if the server is started with :meth:`start`. Responses
+        are stored in :attr:`NasSession.responses`.
+
+        :param session: established session
+        :type session: ancp.server.NasSession
+        :param acis: access loop circuit IDs (one request each)
+        :type acis: [str]
+        :param function: port management function
+        :type function: int
+        :param tlvs: additional request TLVs as (type, value) tuples
+        :type tlvs: list
+        :param result: request result field (default=AckAll)
+        :type result: int
+        :return: transaction identifiers
+        :rtype: [int]
+        """
+        def send():
+            tids = [session.port_management(aci, function, tlvs, result) for aci in acis]
+            session.transport.write(session.data_to_send())
+            return tids
+
+        if self._loop is None:
+            return send()
+
+        async def run():
+            return send()
+
+        return asyncio.run_coroutine_threadsafe(run(), self._loop).result()
+
+    def established(self):
+        """return established sessions
+
+        :rtype: [ancp.server.NasSession]
+        """
+        return [s for s in list(self.sessions.values()) if s.state == AdjacencyState.ESTAB]
+
+    def counters(self):
+        """return counters summed over all sessions
+
+        :rtype: dict
+        """
+        with self._lock:
+            sessions = list(self.sessions.values())
+            closed = dict(self._closed)
+        return {
+            "sessions": len(sessions),
+            "accepted": self.accepted,
+            "established": sum(1 for s in sessions if s.state == AdjacencyState.ESTAB),
+            "port_up": closed["port_up"] + sum(s.port_up_count for s in sessions),
+            "port_down": closed["port_down"] + sum(s.port_down_count for s in sessions),
+            "ports_up": sum(s.ports_up for s in sessions),
+            "rx_messages": closed["rx_messages"] + sum(s.rx_messages for s in sessions),
+            "rx_bytes": closed["rx_bytes"] + sum(s.rx_bytes for s in sessions),
+            "port_management": closed["port_management"] + sum(len(s.responses) for s in sessions),
+            "errors": self.errors,
+        }
+
+    # internal methods --------------------------------------------------------
+
+    def _remove(self, session):
+        """remove closed session and keep its counters"""
+        with self._lock:
+            if self.sessions.get(session.peer) is not session:
+                return
+            del self.sessions[session.peer]
+            closed = self._closed
+            closed["port_up"] += session.port_up_count
+            closed["port_down"] += session.port_down_count
+            closed["rx_messages"] += session.rx_messages
+            closed["rx_bytes"] += session.rx_bytes
+            closed["port_management"] += len(session.responses)
@@ -0,0 +1,218 @@
+"""ANCP Subscriber State Store
+
+Differential state store which records the last announced state of each
+port (keyed by Access-Loop-Circuit-ID) and sends only the port up/down
+messages required to reach a new desired state.
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from ancp.subscriber import Subscriber
+from ancp.table import SubscriberTable, TableSlice
+from ancp.template import FrameTemplate
+from copy import copy
+from itertools import count, repeat
+from operator import attrgetter
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class Diff(object):
+    """Difference between announced and desired state
+
+    :ivar up: new or changed subscribers (list or SubscriberTable)
+    :ivar down: removed subscribers
+    """
+    def __init__(self, up, down, state):
+        self.up = up
+        self.down = down
+        self._state = state
+
+    def __repr__(self):
+        return "Diff(up=%d, down=%d)" % (len(self.up), len(self.down))
+
+    def __bool__(self):
+        return bool(len(self.up) or self.down)
+
+    __nonzero__ = __bool__
+
+
+class Frame(object):
+    """announced subscriber recorded from a frame template
+
+    Provides the ACI and encoded TLVs like :class:`ancp.subscriber.Subscriber`,
+    which is all that is required to send the port again.
+    """
+    __slots__ = ("aci", "tlvs")
+
+    def __init__(self, aci, tlvs):
+        self.aci = aci
+        self.tlvs = tlvs
+
+    def __repr__(self):
+        return "Frame(%s)" % (self.aci)
+
+
+class StateStore(object):
+    """ANCP Subscriber State Store
+
+    Subscribers are compared by their encoded TLVs (cached by
+    :class:`ancp.subscriber.Subscriber`) or by the rows of a
+    :class:`ancp.table.SubscriberTable`, so a port is sent again if any
+    attribute (e.g. rates or line state) has changed. Use the same kind
+    of desired set (subscribers or table) for all calls of :meth:`sync`,
+    otherwise all ports are sent again once.
+
+    The store keeps copies of the announced subscribers, so changing a
+    subscriber or table row after it was sent does not change the
+    announced state (e.g. replayed after reconnect).
+
+    :param client: ANCP client (or session) used to send messages
+    :type client: ancp.protocol.Protocol
+    """
+    def __init__(self, client):
+        self.client = client
+        # ACI -> (fingerprint, copied subscriber or table, index)
+        self._ports = {}
+
+    def __repr__(self):
+        return "StateStore(%d ports)" % len(self._ports)
+
+    def __len__(self):
+        return len(self._ports)
+
+    def __contains__(self, aci):
+        return aci in self._ports
+
+    def diff(self, desired):
+        """compute difference to desired state without sending
+
+        :param desired: desired subscribers
+        :type desired: [ancp.subscriber.Subscriber] or ancp.table.SubscriberTable
+        :rtype: ancp.state.Diff
+        """
+        ports = self._ports
+        table = isinstance(desired, SubscriberTable)
+        if table:
+            current = desired.aci
+            fingerprints = desired.fingerprints()
+        else:
+            desired = list(desired)
+            current = list(map(attrgetter("aci"), desired))
+            fingerprints = list(map(attrgetter("tlvs"), desired))
+        # indices of new or changed subscribers (runs for every desired port)
+        indices = [i for i, fingerprint, old in zip(count(), fingerprints, map(ports.get, current))
+                   if old is None or (old[0] is not fingerprint and old[0] != fingerprint)]
+        if table:
+            # the table returned by take is a copy used as announced state
+            up = desired.take(indices)
+            changed = dict((current[i], (fingerprints[i], up, j)) for j, i in enumerate(indices))
+        else:
+            up = [desired[i] for i in indices]
+            changed = dict((current[i], (fingerprints[i], copy(desired[i]), None)) for i in indices)
+        removed = set(ports) - set(current)
+        down = [self._subscriber(aci) for aci in removed]
+        return Diff(up, down, (changed, removed))
+
+    def apply(self, diff):
+        """record diff as announced without sending
+
+        :param diff: difference returned by :meth:`diff`
+        :type diff: ancp.state.Diff
+        """
+        changed, removed = diff._state
+        for aci in removed:
+            self._ports.pop(aci, None)
+        self._ports.update(changed)
+
+    def sync(self, desired):
+        """send port down for removed and port up for new or changed subscribers
+
+        :param desired: desired subscribers
+        :type desired: [ancp.subscriber.Subscriber] or ancp.table.SubscriberTable
+        :return: sent difference
+        :rtype: ancp.state.Diff
+        """
+        diff = self.diff(desired)
+        log.debug("sync %d ports: %r", len(self._ports), diff)
+        if diff.down:
+            self.client.port_down(diff.down)
+        if len(diff.up):
+            self.client.port_up(diff.up)
+        self.apply(diff)
+        return diff
+
+    def record(self, subscribers, up=True):
+        """record sent port up/down messages as announced state
+
+        :param subscribers: sent subscribers
+        :type subscribers: [ancp.subscriber.Subscriber], ancp.table.SubscriberTable,
+            ancp.table.TableSlice or ancp.template.FrameTemplate
+        :param up: True for port up and False for port down
+        :type up: bool
+        """
+        ports = self._ports
+        if isinstance(subscribers, FrameTemplate):
+            acis = subscribers.aci
+            if up:
+                frames = (Frame(aci, subscribers.tlvs(i)) for i, aci in enumerate(acis))
+                ports.update((f.aci, (f.tlvs, f, None)) for f in frames)
+                return
+        elif isinstance(subscribers, (SubscriberTable, TableSlice)):
+            if isinstance(subscribers, TableSlice):
+                table, start, stop = subscribers.table, subscribers.start, subscribers.stop
+            else:
+                table, start, stop = subscribers, 0, len(subscribers)
+            acis = table.aci[start:stop]
+            if up:
+                snapshot = table.take(range(start, stop))
+                ports.update(zip(acis, zip(snapshot.fingerprints(), repeat(snapshot), count())))
+                return
+        else:
+            if isinstance(subscribers, (Subscriber, Frame)):
+                subscribers = [subscribers]
+            # invalid entries are skipped by the encoder and not sent
+            subscribers = [s for s in subscribers if isinstance(s, (Subscriber, Frame))]
+            if up:
+                ports.update((s.aci, (s.tlvs, copy(s), None)) for s in subscribers)
+                return
+            acis = [s.aci for s in subscribers]
+        for aci in acis:
+            ports.pop(aci, None)
+
+    def active(self):
+        """return announced subscribers
+
+        Subscribers recorded from tables are returned as tables (see
+        :meth:`ancp.table.SubscriberTable.take`) so that they can be
+        encoded vectorized.
+
+        :return: collections of subscribers
+        :rtype: list
+        """
+        subscribers = []
+        tables = {}
+        for _, source, index in self._ports.values():
+            if index is None:
+                subscribers.append(source)
+            else:
+                tables.setdefault(id(source), (source, []))[1].append(index)
+        result = [table.take(indices) for table, indices in tables.values()]
+        if subscribers:
+            result.insert(0, subscribers)
+        return result
+
+    def clear(self):
+        """forget announced state (e.g. after reconnect)"""
+        self._ports.clear()
+
+    # internal methods --------------------------------------------------------
+
+    def _subscriber(self, aci):
+        _, source, index = self._ports[aci]
+        if index is None:
+            return source
+        return source[index]
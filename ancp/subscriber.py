@@ -6,7 +6,7 @@ SPDX-License-Identifier: MIT
 from __future__ import print_function
 from __future__ import unicode_literals
 from builtins import bytes
-import struct
+from ancp.codec import TLV_HEADER, TLV_INT, UINT32, LINE, mktlv
 import logging
 
 log = logging.getLogger(__name__)
@@ -117,41 +117,33 @@ def mktlvs(tlvs):
     b = bytearray(blen)
     off = 0
     for t in tlvs:
-        if isinstance(t.val, tuple):
+        val = t.val
+        if isinstance(val, int):
+            # int
+            TLV_INT.pack_into(b, off, t.type, t.len, val)
+        elif isinstance(val, tuple):
             # list of int (e.g. for AACI_BIN)
-            struct.pack_into("!HH", b, off, t.type, t.len)
-            off += 4
-            for i in t.val:
-                struct.pack_into("!I", b, off, i)
-                off += 4
-        elif isinstance(t.val, list):
+            TLV_HEADER.pack_into(b, off, t.type, t.len)
+            ioff = off + 4
+            for i in val:
+                UINT32.pack_into(b, ioff, i)
+                ioff += 4
+        elif isinstance(val, list):
             # sub tlvs
-            struct.pack_into("!HH", b, off, t.type, t.off)
-            off += 4
-            for s in t.val:
+            TLV_HEADER.pack_into(b, off, t.type, t.off)
+            soff = off + 4
+            for s in val:
                 if isinstance(s.val, int):
-                    struct.pack_into("!HHI", b, off, s.type, s.len, s.val)
+                    TLV_INT.pack_into(b, soff, s.type, s.len, s.val)
                 else:
-                    fmt = "!HH%ds" % s.len
-                    struct.pack_into(fmt, b, off, s.type, s.len, bytes(s.val, encoding='utf-8'))
-                off += 4 + s.off
+                    TLV_HEADER.pack_into(b, soff, s.type, s.len)
+                    b[soff + 4:soff + 4 + s.len] = bytes(s.val, encoding='utf-8')[:s.len]
+                soff += 4 + s.off
         else:
-            # tlv
-            if isinstance(t.val, int):
-                # int
-                struct.pack_into("!HHI", b, off, t.type, t.len, t.val)
-            elif isinstance(t.val, tuple):
-                # list of int (e.g. for AACI_BIN)
-                struct.pack_into("!HH", b, off, t.type, t.len)
-                off += 4
-                for i in t.val:
-                    struct.pack_into("!I", b, off, i)
-                    off += 4
-            else:
-                # string
-                fmt = "!HH%ds" % t.len
-                struct.pack_into(fmt, b, off, t.type, t.len, bytes(t.val, encoding='utf-8'))
-            off += 4 + t.off
+            # string
+            TLV_HEADER.pack_into(b, off, t.type, t.len)
+            b[off + 4:off + 4 + t.len] = bytes(val, encoding='utf-8')[:t.len]
+        off += 4 + t.off
     return b
 
 
@@ -173,6 +165,22 @@ def access_loop_enc(data_link, encap1, encap2):
     return tlv
 
 
+def check_aaci_bin(value):
+    """Validate Access-Aggregation-Circuit-ID-Binary
+
+    :param value: Access-Aggregation-Circuit-ID-Binary
+    :type value: int or tuple
+    :raises ValueError: if value is not None, int or tuple of int
+    """
+    if value is not None:
+        if isinstance(value, tuple):
+            for v in value:
+                if not isinstance(v, int):
+                    raise ValueError("invalid value for aaci_bin")
+        elif not isinstance(value, int):
+            raise ValueError("invalid value for aaci_bin")
+
+
 # ANCP SUBSCRIBER -------------------------------------------------------------
 
 class Subscriber(object):
@@ -235,49 +243,57 @@ class Subscriber(object):
     def __repr__(self):
         return "Subscriber(%s)" % (self.aci)
 
+    def __setattr__(self, name, value):
+        # invalidate cached TLVs if any attribute is changed
+        object.__setattr__(self, name, value)
+        if name != "_tlvs":
+            object.__setattr__(self, "_tlvs", None)
+
     @property
     def aaci_bin(self):
         return self._aaci_bin
 
     @aaci_bin.setter
     def aaci_bin(self, value):
-        if value is not None:
-            if isinstance(value, tuple):
-                for v in value:
-                    if not isinstance(v, int):
-                        raise ValueError("invalid value for aaci_bin")
-            elif not isinstance(value, int):
-                raise ValueError("invalid value for aaci_bin")
+        check_aaci_bin(value)
         self._aaci_bin = value
 
     @property
     def tlvs(self):
-        tlvs = [TLV(TlvType.ACI, self.aci)]
+        """encoded TLVs (number of TLVs, bytes)
+
+        The encoded TLVs are cached until an attribute is changed.
+        """
+        tlvs = self._tlvs
+        if tlvs is None:
+            tlvs = self._tlvs = self._mktlvs()
+        return tlvs
+
+    def _mktlvs(self):
+        b = bytearray(mktlv(TlvType.ACI, self.aci))
+        num_tlvs = 2
         if self.ari is not None:
-            tlvs.append(TLV(TlvType.ARI, self.ari))
+            b += mktlv(TlvType.ARI, self.ari)
+            num_tlvs += 1
         if self.aaci_bin is not None:
-            tlvs.append(TLV(TlvType.AACI_BIN, self.aaci_bin))
+            b += mktlv(TlvType.AACI_BIN, self.aaci_bin)
+            num_tlvs += 1
         if self.aaci_ascii is not None:
-            tlvs.append(TLV(TlvType.AACI_ASCII, self.aaci_ascii))
+            b += mktlv(TlvType.AACI_ASCII, self.aaci_ascii)
+            num_tlvs += 1
         # DSL LINE ATTRIBUTES
-        line = [TLV(TlvType.TYPE, self.dsl_type)]
-        line.append(access_loop_enc(self.data_link, self.encap1, self.encap2))
-        line.append(TLV(TlvType.STATE, self.state))
-        if self.up is not None:
-            line.append(TLV(TlvType.UP, self.up))
-        if self.down is not None:
-            line.append(TLV(TlvType.DOWN, self.down))
-        if self.min_up is not None:
-            line.append(TLV(TlvType.MIN_UP, self.min_up))
-        if self.min_down is not None:
-            line.append(TLV(TlvType.MIN_DOWN, self.min_down))
-        if self.att_up is not None:
-            line.append(TLV(TlvType.ATT_UP, self.att_up))
-        if self.att_down is not None:
-            line.append(TLV(TlvType.ATT_DOWN, self.att_down))
-        if self.max_up is not None:
-            line.append(TLV(TlvType.MAX_UP, self.max_up))
-        if self.max_down is not None:
-            line.append(TLV(TlvType.MAX_DOWN, self.max_down))
-        tlvs.append(TLV(TlvType.LINE, line))
-        return (len(tlvs), mktlvs(tlvs))
+        rates = [(t, v) for t, v in ((TlvType.UP, self.up),
+                                     (TlvType.DOWN, self.down),
+                                     (TlvType.MIN_UP, self.min_up),
+                                     (TlvType.MIN_DOWN, self.min_down),
+                                     (TlvType.ATT_UP, self.att_up),
+                                     (TlvType.ATT_DOWN, self.att_down),
+                                     (TlvType.MAX_UP, self.max_up),
+                                     (TlvType.MAX_DOWN, self.max_down)) if v is not None]
+        b += LINE.pack(TlvType.LINE, LINE.size - 4 + len(rates) * TLV_INT.size,
+                       TlvType.TYPE, 4, self.dsl_type,
+                       TlvType.ACC_LOOP_ENC, 3, self.data_link << 24 | self.encap1 << 16 | self.encap2 << 8,
+                       TlvType.STATE, 4, self.state)
+        for t, v in rates:
+            b += TLV_INT.pack(t, 4, v)
+        return (num_tlvs, bytes(b))
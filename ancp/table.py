@@ -0,0 +1,417 @@
+"""ANCP Subscriber Table
+
+Columnar storage of ANCP subscribers. Line attributes are stored in a NumPy
+structured array (or in :mod:`array` columns if NumPy is not installed)
+and port up/down messages are encoded for a whole table or slice at once.
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from ancp import codec
+from ancp.subscriber import (Subscriber, TlvType, LineState, DslType, DataLink,
+                             Encap1, Encap2, check_aaci_bin)
+import array
+import logging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+log = logging.getLogger(__name__)
+
+
+# optional rate attributes in order of encoding
+RATES = ("up", "down", "min_up", "min_down", "att_up", "att_down", "max_up", "max_down")
+RATE_TYPES = (TlvType.UP, TlvType.DOWN, TlvType.MIN_UP, TlvType.MIN_DOWN,
+              TlvType.ATT_UP, TlvType.ATT_DOWN, TlvType.MAX_UP, TlvType.MAX_DOWN)
+# identifiers encoded before the line attributes
+IDS = ("ari", "aaci_bin", "aaci_ascii")
+ID_TYPES = (TlvType.ARI, TlvType.AACI_BIN, TlvType.AACI_ASCII)
+# line attributes with default value (None is stored as -1)
+COLUMNS = (("state", LineState.SHOWTIME),
+           ("up", 0),
+           ("down", 0),
+           ("min_up", None),
+           ("min_down", None),
+           ("att_up", None),
+           ("att_down", None),
+           ("max_up", None),
+           ("max_down", None),
+           ("dsl_type", DslType.OTHER),
+           ("data_link", DataLink.ETHERNET),
+           ("encap1", Encap1.DOUBLE_TAGGED_ETHERNET),
+           ("encap2", Encap2.EOAAL5_LLC))
+
+if numpy is not None:
+    ROW_DTYPE = numpy.dtype([(name, "i8") for name, _ in COLUMNS] + [("num_tlvs", "u1")])
+    PORT_DTYPE = numpy.dtype([("ident", ">u2"), ("length", ">u2"),
+                              ("version", "u1"), ("message_type", "u1"),
+                              ("result", ">u2"), ("transaction_id", ">u4"),
+                              ("flags", ">u2"), ("length2", ">u2"),
+                              ("reserved", "V21"), ("message_type2", "u1"),
+                              ("tech_type", "u1"), ("reserved2", "u1"),
+                              ("num_tlvs", ">u2"), ("tlv_length", ">u2")])
+    LINE_DTYPE = numpy.dtype([("type", ">u2"), ("length", ">u2"),
+                              ("dsl_type_type", ">u2"), ("dsl_type_length", ">u2"), ("dsl_type", ">u4"),
+                              ("encap_type", ">u2"), ("encap_length", ">u2"), ("encap", ">u4"),
+                              ("state_type", ">u2"), ("state_length", ">u2"), ("state", ">u4")])
+    RATE_DTYPE = numpy.dtype([("type", ">u2"), ("length", ">u2"), ("value", ">u4")])
+    assert PORT_DTYPE.itemsize == codec.PORT.size
+    assert LINE_DTYPE.itemsize == codec.LINE.size
+    assert RATE_DTYPE.itemsize == codec.TLV_INT.size
+
+
+def mkprefix(aci, ids):
+    """encode ACI and identifier TLVs
+
+    :param aci: Access-Loop-Circuit-ID
+    :type aci: str
+    :param ids: identifiers as tuple of (name, value)
+    :type ids: tuple
+    :return: encoded TLVs and number of TLVs including the line TLV
+    :rtype: (bytes, int)
+    """
+    b = codec.mktlv(TlvType.ACI, aci)
+    ids = dict(ids)
+    num_tlvs = 2
+    for name, tlv_type in zip(IDS, ID_TYPES):
+        if name in ids:
+            b += codec.mktlv(tlv_type, ids[name])
+            num_tlvs += 1
+    return b, num_tlvs
+
+
+# ANCP SUBSCRIBER TABLE -------------------------------------------------------
+
+class SubscriberTable(object):
+    """ANCP Subscriber Table
+
+    The table supports the same attributes as
+    :class:`ancp.subscriber.Subscriber`. Tables and slices of tables
+    (e.g. ``table[1000:2000]``) can be passed directly to
+    :meth:`ancp.client.Client.port_up` and
+    :meth:`ancp.client.Client.port_down`.
+
+    :param capacity: initial capacity (default=1024)
+    :type capacity: int
+    :param use_numpy: use NumPy if installed (default=True)
+    :type use_numpy: bool
+    """
+    def __init__(self, capacity=1024, use_numpy=True):
+        self.numpy = use_numpy and numpy is not None
+        self._size = 0
+        # ACI, ARI and AACI values and the TLVs encoded from them
+        self.aci = []
+        self._ids = []
+        self._prefix = []
+        if self.numpy:
+            self._rows = numpy.zeros(max(capacity, 1), dtype=ROW_DTYPE)
+        else:
+            self._columns = dict((name, array.array("q")) for name, _ in COLUMNS)
+            self._columns["num_tlvs"] = array.array("B")
+
+    def __repr__(self):
+        return "SubscriberTable(%d)" % self._size
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for index in range(self._size):
+            yield self[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._size)
+            if step != 1:
+                raise ValueError("slice step is not supported")
+            return TableSlice(self, start, max(start, stop))
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("subscriber index out of range")
+        kwargs = dict(self._ids[index])
+        for name, _ in COLUMNS:
+            value = self._get(name, index)
+            kwargs[name] = None if value < 0 else value
+        return Subscriber(self.aci[index], **kwargs)
+
+    @classmethod
+    def from_subscribers(cls, subscribers, use_numpy=True):
+        """create table from ANCP subscribers
+
+        :param subscribers: ANCP subscribers
+        :type subscribers: [ancp.subscriber.Subscriber]
+        :rtype: ancp.table.SubscriberTable
+        """
+        table = cls(use_numpy=use_numpy)
+        table.extend(subscribers)
+        return table
+
+    def append(self, aci, **kwargs):
+        """append subscriber
+
+        Accepts the same arguments as :class:`ancp.subscriber.Subscriber`.
+
+        :return: index of the new subscriber
+        :rtype: int
+        """
+        check_aaci_bin(kwargs.get("aaci_bin"))
+        index = self._size
+        values = [kwargs.get(name, default) for name, default in COLUMNS]
+        values = [-1 if v is None else v for v in values]
+        ids = tuple((k, kwargs[k]) for k in IDS if kwargs.get(k) is not None)
+        prefix, num_tlvs = mkprefix(aci, ids)
+        if self.numpy:
+            if index == len(self._rows):
+                rows = numpy.zeros(len(self._rows) * 2, dtype=ROW_DTYPE)
+                rows[:index] = self._rows
+                self._rows = rows
+            self._rows[index] = tuple(values) + (num_tlvs,)
+        else:
+            for (name, _), value in zip(COLUMNS, values):
+                self._columns[name].append(value)
+            self._columns["num_tlvs"].append(num_tlvs)
+        self.aci.append(aci)
+        self._ids.append(ids)
+        self._prefix.append(prefix)
+        self._size += 1
+        return index
+
+    def extend(self, subscribers):
+        """append ANCP subscribers
+
+        :param subscribers: ANCP subscribers
+        :type subscribers: [ancp.subscriber.Subscriber]
+        """
+        for s in subscribers:
+            kwargs = dict((name, getattr(s, name)) for name, _ in COLUMNS)
+            self.append(s.aci, ari=s.ari, aaci_bin=s.aaci_bin, aaci_ascii=s.aaci_ascii, **kwargs)
+
+    def update(self, index, **kwargs):
+        """update subscriber attributes
+
+        :param index: subscriber index
+        :type index: int
+        """
+        check_aaci_bin(kwargs.get("aaci_bin"))
+        aci = kwargs.pop("aci", self.aci[index])
+        ids = [(k, kwargs.pop(k)) for k in IDS if k in kwargs]
+        if ids or aci != self.aci[index]:
+            ids = dict(self._ids[index], **dict(ids))
+            ids = tuple((k, ids[k]) for k in IDS if ids.get(k) is not None)
+            self.aci[index] = aci
+            self._ids[index] = ids
+            self._prefix[index], num_tlvs = mkprefix(aci, ids)
+            self._set("num_tlvs", index, num_tlvs)
+        for name, value in kwargs.items():
+            self._set(name, index, -1 if value is None else value)
+
+    def take(self, indices):
+        """return new table with the subscribers at indices
+
+        :param indices: subscriber indices
+        :type indices: [int]
+        :rtype: ancp.table.SubscriberTable
+        """
+        indices = list(indices)
+        table = SubscriberTable(capacity=len(indices), use_numpy=self.numpy)
+        if self.numpy:
+            table._rows[:len(indices)] = self._rows[numpy.asarray(indices, dtype=numpy.int64)]
+        else:
+            for name, column in self._columns.items():
+                table._columns[name] = array.array(column.typecode, [column[i] for i in indices])
+        table.aci = [self.aci[i] for i in indices]
+        table._ids = [self._ids[i] for i in indices]
+        table._prefix = [self._prefix[i] for i in indices]
+        table._size = len(indices)
+        return table
+
+    def fingerprints(self, start=0, stop=None):
+        """return one fingerprint per subscriber
+
+        Fingerprints of two subscribers are equal if all attributes are
+        equal. They are only comparable between tables of the same kind
+        (with or without NumPy).
+
+        :rtype: list
+        """
+        stop = self._size if stop is None else stop
+        prefix = self._prefix[start:stop]
+        if self.numpy:
+            width = ROW_DTYPE.itemsize
+            b = self._rows[start:stop].tobytes()
+            return [(p, b[i:i + width]) for p, i in zip(prefix, range(0, len(b), width))]
+        return list(zip(prefix, *[self._columns[name][start:stop] for name, _ in COLUMNS]))
+
+    def encode(self, message_type, tech_type, version, transaction_id, start=0, stop=None, result=1):
+        """encode port up/down messages
+
+        The result is identical to encoding each subscriber separately
+        with consecutive transaction identifiers.
+
+        :param result: result field (default: ResultFields.Nack)
+        :type result: int
+        :return: number of messages and encoded messages
+        :rtype: (int, bytes)
+        """
+        stop = self._size if stop is None else stop
+        if stop <= start:
+            return (0, b"")
+        if self.numpy:
+            return (stop - start, self._encode_numpy(message_type, tech_type, version,
+                                                     transaction_id, start, stop, result))
+        return (stop - start, self._encode_array(message_type, tech_type, version,
+                                                 transaction_id, start, stop, result))
+
+    # internal methods --------------------------------------------------------
+
+    def _get(self, name, index):
+        if self.numpy:
+            return int(self._rows[name][index])
+        return self._columns[name][index]
+
+    def _set(self, name, index, value):
+        if self.numpy:
+            self._rows[name][index] = value
+        else:
+            self._columns[name][index] = value
+
+    def _encode_array(self, message_type, tech_type, version, transaction_id, start, stop, result):
+        c = self._columns
+        pack = codec.PORT.pack
+        line = codec.LINE.pack
+        rate = codec.TLV_INT.pack
+        result = (result << 12)  # ResultCodes.NoResult
+        rates = [(t, c[name]) for t, name in zip(RATE_TYPES, RATES)]
+        msg = bytearray()
+        for i in range(start, stop):
+            tlvs = bytearray(self._prefix[i])
+            present = [(t, column[i]) for t, column in rates if column[i] >= 0]
+            tlvs += line(TlvType.LINE, codec.LINE.size - 4 + len(present) * codec.TLV_INT.size,
+                         TlvType.TYPE, 4, c["dsl_type"][i],
+                         TlvType.ACC_LOOP_ENC, 3,
+                         c["data_link"][i] << 24 | c["encap1"][i] << 16 | c["encap2"][i] << 8,
+                         TlvType.STATE, 4, c["state"][i])
+            for t, v in present:
+                tlvs += rate(t, 4, v)
+            length = codec.PORT.size - 4 + len(tlvs)
+            msg += pack(codec.IDENT, length, version, message_type, result,
+                        transaction_id, 0x8001, length, message_type,
+                        tech_type, c["num_tlvs"][i], len(tlvs))
+            msg += tlvs
+            transaction_id += 1
+        return bytes(msg)
+
+    def _encode_numpy(self, message_type, tech_type, version, transaction_id, start, stop, result, chunk=65536):
+        parts = []
+        for off in range(start, stop, chunk):
+            end = min(off + chunk, stop)
+            parts.append(self._encode_chunk(message_type, tech_type, version,
+                                            transaction_id + off - start, off, end, result))
+        return b"".join(parts)
+
+    def _encode_chunk(self, message_type, tech_type, version, transaction_id, start, stop, result):
+        """encode chunk of rows
+
+        Each message is written into a fixed size row of a byte matrix with
+        space for the longest prefix and all optional rates. The messages are
+        then compacted by selecting all used bytes in row major order.
+        """
+        n = stop - start
+        rows = self._rows[start:stop]
+        prefix = self._prefix[start:stop]
+        prefix_len = numpy.fromiter((len(p) for p in prefix), dtype=numpy.int64, count=n)
+        max_prefix = int(prefix_len.max())
+        rate_values = numpy.stack([rows[name] for name in RATES], axis=1)
+        present = rate_values >= 0
+        tlv_len = prefix_len + codec.LINE.size + present.sum(axis=1) * codec.TLV_INT.size
+
+        # port message header
+        header = numpy.zeros(n, dtype=PORT_DTYPE)
+        header["ident"] = codec.IDENT
+        header["length"] = codec.PORT.size - 4 + tlv_len
+        header["version"] = version
+        header["message_type"] = message_type
+        header["result"] = result << 12  # ResultCodes.NoResult
+        header["transaction_id"] = numpy.arange(transaction_id, transaction_id + n, dtype=numpy.int64)
+        header["flags"] = 0x8001
+        header["length2"] = header["length"]
+        header["message_type2"] = message_type
+        header["tech_type"] = tech_type
+        header["num_tlvs"] = rows["num_tlvs"]
+        header["tlv_length"] = tlv_len
+
+        # DSL line attributes
+        line = numpy.zeros(n, dtype=LINE_DTYPE)
+        line["type"] = TlvType.LINE
+        line["length"] = tlv_len - prefix_len - 4
+        line["dsl_type_type"] = TlvType.TYPE
+        line["dsl_type_length"] = 4
+        line["dsl_type"] = rows["dsl_type"]
+        line["encap_type"] = TlvType.ACC_LOOP_ENC
+        line["encap_length"] = 3
+        line["encap"] = (rows["data_link"] << 24) | (rows["encap1"] << 16) | (rows["encap2"] << 8)
+        line["state_type"] = TlvType.STATE
+        line["state_length"] = 4
+        line["state"] = rows["state"]
+
+        rates = numpy.zeros((n, len(RATES)), dtype=RATE_DTYPE)
+        rates["type"] = RATE_TYPES
+        rates["length"] = 4
+        rates["value"] = numpy.where(present, rate_values, 0)
+
+        p0 = codec.PORT.size
+        l0 = p0 + max_prefix
+        r0 = l0 + codec.LINE.size
+        width = r0 + len(RATES) * codec.TLV_INT.size
+        matrix = numpy.zeros((n, width), dtype=numpy.uint8)
+        mask = numpy.ones((n, width), dtype=bool)
+        matrix[:, :p0] = header.view(numpy.uint8).reshape(n, p0)
+        prefix_mask = numpy.arange(max_prefix) < prefix_len[:, None]
+        matrix[:, p0:l0][prefix_mask] = numpy.frombuffer(b"".join(prefix), dtype=numpy.uint8)
+        mask[:, p0:l0] = prefix_mask
+        matrix[:, l0:r0] = line.view(numpy.uint8).reshape(n, codec.LINE.size)
+        matrix[:, r0:] = rates.view(numpy.uint8).reshape(n, width - r0)
+        mask[:, r0:] = numpy.repeat(present, codec.TLV_INT.size, axis=1)
+        return matrix[mask].tobytes()
+
+
+class TableSlice(object):
+    """Slice of :class:`SubscriberTable`"""
+    def __init__(self, table, start, stop):
+        self.table = table
+        self.start = start
+        self.stop = stop
+
+    def __repr__(self):
+        return "TableSlice(%d:%d)" % (self.start, self.stop)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        for index in range(self.start, self.stop):
+            yield self.table[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return self.table[self.start + start:self.start + max(start, stop):step]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("subscriber index out of range")
+        return self.table[self.start + index]
+
+    def encode(self, message_type, tech_type, version, transaction_id, result=1):
+        """encode port up/down messages
+
+        :return: number of messages and encoded messages
+        :rtype: (int, bytes)
+        """
+        return self.table.encode(message_type, tech_type, version, transaction_id,
+                                 self.start, self.stop, result)
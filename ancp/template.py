@@ -0,0 +1,181 @@
+"""ANCP Frame Templates
+
+Pre-encoded port up/down messages for a batch of subscribers. Port up and
+port down messages of a subscriber only differ in the message type and
+transaction identifier, so a template is encoded once and only these
+fields are patched in place before the messages are sent again (e.g. for
+port flapping). Templates are passed to
+:meth:`ancp.protocol.Protocol.port_up` and
+:meth:`ancp.protocol.Protocol.port_down` like subscribers.
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from ancp import codec
+from ancp.subscriber import TlvType
+from ancp.table import SubscriberTable, TableSlice, numpy
+import struct
+import logging
+
+log = logging.getLogger(__name__)
+
+
+# offsets of patched fields in port messages (including ident and length)
+VERSION_OFFSET = 4
+MESSAGE_TYPE_OFFSETS = (5, 37)
+RESULT_OFFSET = 6
+TID_OFFSET = 8
+TECH_TYPE_OFFSET = 38
+
+UINT32 = struct.Struct("!I")
+
+
+def _state_offset(view, off, end):
+    """return offset of the DSL line state value or None"""
+    for tlv in codec.iter_tlvs(view, off + codec.PORT.size, end):
+        if tlv.type == TlvType.LINE:
+            line = tlv._off + 4
+            for sub in codec.iter_tlvs(view, line, line + tlv.length):
+                if sub.type == TlvType.STATE:
+                    return sub._off + 4
+    return None
+
+
+class FrameTemplate(object):
+    """Pre-encoded port messages of ANCP subscribers
+
+    :param subscribers: ANCP subscribers
+    :type subscribers: [ancp.subscriber.Subscriber] or ancp.table.SubscriberTable
+    :param use_numpy: patch fields vectorized if NumPy is installed (default=True)
+    :type use_numpy: bool
+    """
+    def __init__(self, subscribers, use_numpy=True):
+        if isinstance(subscribers, (SubscriberTable, TableSlice)):
+            count, msg = subscribers.encode(0, 0, 0, 0)
+            self.buffer = bytearray(msg)
+            if isinstance(subscribers, TableSlice):
+                self.aci = subscribers.table.aci[subscribers.start:subscribers.stop]
+            else:
+                self.aci = list(subscribers.aci)
+        else:
+            self.buffer = bytearray()
+            self.aci = []
+            pack = codec.PORT.pack
+            for s in subscribers:
+                num_tlvs, tlvs = s.tlvs
+                length = codec.PORT.size - 4 + len(tlvs)
+                self.buffer += pack(codec.IDENT, length, 0, 0, 0, 0, 0x8001, length, 0, 0, num_tlvs, len(tlvs))
+                self.buffer += tlvs
+                self.aci.append(s.aci)
+        # offsets of messages and line state values
+        self.offsets = []
+        self.states = []
+        view = memoryview(self.buffer)
+        off = 0
+        while off < len(self.buffer):
+            end = off + 4 + codec.UINT16.unpack_from(view, off + 2)[0]
+            self.offsets.append(off)
+            self.states.append(_state_offset(view, off, end))
+            off = end
+        view.release()
+        self.numpy = use_numpy and numpy is not None
+        if self.numpy:
+            offsets = numpy.array(self.offsets + [len(self.buffer)], dtype=numpy.int64)
+            self._array = numpy.frombuffer(self.buffer, dtype=numpy.uint8)
+            self._tid_index = offsets[:-1, None] + numpy.arange(TID_OFFSET, TID_OFFSET + 4)
+            self._state_index = numpy.array([s + 3 for s in self.states if s is not None], dtype=numpy.int64)
+        self._fields = None
+        self.state = None
+
+    def __repr__(self):
+        return "FrameTemplate(%d)" % len(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def set_state(self, state):
+        """change DSL line state of all messages (e.g. IDLE for port down)
+
+        :param state: line state
+        :type state: ancp.subscriber.LineState
+        """
+        if state == self.state:
+            return
+        if self.numpy:
+            self._array[self._state_index] = state
+        else:
+            for off in self.states:
+                if off is not None:
+                    UINT32.pack_into(self.buffer, off, state)
+        self.state = state
+
+    def patch(self, message_type, transaction_id, version, tech_type, result=1, start=0, stop=None):
+        """patch header fields of messages in place
+
+        Transaction identifiers are consecutive starting with
+        `transaction_id`. Fields which are equal for all messages are only
+        written if changed.
+
+        :return: encoded messages (valid until next patch)
+        :rtype: memoryview
+        """
+        stop = len(self.offsets) if stop is None else stop
+        fields = (message_type, version, tech_type, result)
+        if fields != self._fields:
+            self._patch_fields(message_type, version, tech_type, result)
+            self._fields = fields
+        if self.numpy:
+            tids = numpy.arange(transaction_id, transaction_id + stop - start, dtype=">u4")
+            self._array[self._tid_index[start:stop]] = tids.view(numpy.uint8).reshape(-1, 4)
+        else:
+            pack = UINT32.pack_into
+            buf = self.buffer
+            for tid, off in enumerate(self.offsets[start:stop], transaction_id):
+                pack(buf, off + TID_OFFSET, tid)
+        return self.view(start, stop)
+
+    def tlvs(self, index):
+        """return number of TLVs and encoded TLVs of a message
+
+        Same format as :attr:`ancp.subscriber.Subscriber.tlvs`.
+
+        :rtype: (int, bytes)
+        """
+        off = self.offsets[index]
+        end = off + 4 + codec.UINT16.unpack_from(self.buffer, off + 2)[0]
+        num_tlvs = codec.PORT.unpack_from(self.buffer, off)[10]
+        return num_tlvs, bytes(self.buffer[off + codec.PORT.size:end])
+
+    def view(self, start=0, stop=None):
+        """return messages start to stop
+
+        :rtype: memoryview
+        """
+        stop = len(self.offsets) if stop is None else stop
+        begin = self.offsets[start] if start < len(self.offsets) else len(self.buffer)
+        end = self.offsets[stop] if stop < len(self.offsets) else len(self.buffer)
+        return memoryview(self.buffer)[begin:end]
+
+    # internal methods --------------------------------------------------------
+
+    def _patch_fields(self, message_type, version, tech_type, result):
+        result = struct.pack("!H", result << 12)    # ResultCodes.NoResult
+        if self.numpy:
+            offsets = numpy.array(self.offsets, dtype=numpy.int64)
+            array = self._array
+            array[offsets + VERSION_OFFSET] = version
+            for off in MESSAGE_TYPE_OFFSETS:
+                array[offsets + off] = message_type
+            array[offsets + RESULT_OFFSET] = result[0]
+            array[offsets + RESULT_OFFSET + 1] = result[1]
+            array[offsets + TECH_TYPE_OFFSET] = tech_type
+            return
+        buf = self.buffer
+        for off in self.offsets:
+            buf[off + VERSION_OFFSET] = version
+            for o in MESSAGE_TYPE_OFFSETS:
+                buf[off + o] = message_type
+            buf[off + RESULT_OFFSET:off + RESULT_OFFSET + 2] = result
+            buf[off + TECH_TYPE_OFFSET] = tech_type
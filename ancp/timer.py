@@ -0,0 +1,277 @@
+"""ANCP Timer Wheel
+
+Hierarchical timer wheel on the monotonic clock used to run adjacency
+timers (SYN retransmit and keep-alive) of many sessions. Scheduling and
+cancelling a timer is O(1) and a wheel without due timers is not woken
+up, so idle sessions do not cost CPU.
+
+Each level has `slots` slots. A slot of level 0 covers `resolution`
+seconds and a slot of level n covers `slots ** n` slots of level 0.
+Timers of higher levels are moved to lower levels (cascaded) when the
+lower level wraps around.
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from ancp.protocol import monotonic
+from threading import Thread, Lock, Condition, current_thread
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class Timer(object):
+    """Timer scheduled in :class:`TimerWheel`"""
+    __slots__ = ("deadline", "callback", "args", "_tick", "_level", "_slot", "_wheel")
+
+    def __init__(self, wheel, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self._tick = 0
+        self._level = 0
+        self._slot = None
+        self._wheel = wheel
+
+    def __repr__(self):
+        return "Timer(%.3f, %r)" % (self.deadline, self.callback)
+
+    @property
+    def active(self):
+        """True if timer is scheduled"""
+        return self._slot is not None
+
+    def cancel(self):
+        """cancel timer"""
+        self._wheel.cancel(self)
+
+
+class TimerWheel(object):
+    """Hierarchical Timer Wheel
+
+    The wheel can be driven from an own thread (:meth:`start`) or from
+    an existing event loop by sleeping until :meth:`next_expiry` and
+    calling :meth:`advance`. Callbacks are called without holding the
+    wheel lock and must not block for long.
+
+    :param resolution: seconds per tick (default=0.01)
+    :type resolution: float
+    :param slots: slots per level (default=256)
+    :type slots: int
+    :param levels: number of levels (default=4)
+    :type levels: int
+    """
+    def __init__(self, resolution=0.01, slots=256, levels=4):
+        self.resolution = resolution
+        self.slots = slots
+        self.levels = levels
+        self._wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        self._counts = [0] * levels
+        self._overflow = set()
+        self._tick = int(monotonic() / resolution)
+        self._lock = Lock()
+        self._cond = Condition(self._lock)
+        self._wakeup = None     # wake up time of the waiting thread
+        self._running = False
+        self._thread = None
+
+    def __repr__(self):
+        return "TimerWheel(%s, %d timers)" % (self.resolution, len(self))
+
+    def __len__(self):
+        return sum(self._counts) + len(self._overflow)
+
+    def schedule(self, deadline, callback, *args):
+        """schedule callback at deadline
+
+        :param deadline: time (monotonic)
+        :type deadline: float
+        :param callback: called with args if timer expires
+        :type callback: callable
+        :rtype: ancp.timer.Timer
+        """
+        timer = Timer(self, deadline, callback, args)
+        # expire at the first tick not before the deadline
+        tick = int(deadline / self.resolution)
+        if tick * self.resolution < deadline:
+            tick += 1
+        timer._tick = tick
+        with self._lock:
+            self._insert(timer)
+            if self._wakeup is not None and deadline < self._wakeup:
+                self._cond.notify()
+        return timer
+
+    def cancel(self, timer):
+        """cancel timer"""
+        with self._lock:
+            if timer._slot is not None:
+                timer._slot.discard(timer)
+                if timer._slot is not self._overflow:
+                    self._counts[timer._level] -= 1
+                timer._slot = None
+
+    def next_expiry(self):
+        """return time (monotonic) of next expiry or cascade
+
+        :return: time or None if no timer is scheduled
+        :rtype: float
+        """
+        with self._lock:
+            tick = self._next_tick()
+        return None if tick is None else tick * self.resolution
+
+    def advance(self, now=None):
+        """expire all timers due until now
+
+        :param now: current time (monotonic)
+        :type now: float
+        :return: number of expired timers
+        :rtype: int
+        """
+        target = int((monotonic() if now is None else now) / self.resolution)
+        expired = []
+        with self._lock:
+            slots = self.slots
+            wheel = self._wheels[0]
+            while self._tick < target:
+                if not any(self._counts) and not self._overflow:
+                    self._tick = target
+                    break
+                self._tick += 1
+                tick = self._tick
+                if tick % slots == 0:
+                    self._cascade(tick)
+                slot = wheel[tick % slots]
+                if slot:
+                    for timer in slot:
+                        timer._slot = None
+                    self._counts[0] -= len(slot)
+                    expired.extend(slot)
+                    slot.clear()
+        for timer in sorted(expired, key=lambda t: t.deadline):
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                log.exception("timer callback %r failed", timer.callback)
+        return len(expired)
+
+    def in_thread(self):
+        """return True if called from the background thread of the wheel"""
+        return self._thread is not None and current_thread() is self._thread
+
+    def start(self):
+        """run wheel in background thread"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        self._thread = Thread(target=self._run, name="timer-wheel")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """stop background thread"""
+        with self._lock:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # internal methods --------------------------------------------------------
+
+    def _insert(self, timer, cascade=False):
+        if cascade:
+            # slot of the current tick is expired right after the cascade
+            tick = max(timer._tick, self._tick)
+        else:
+            tick = max(timer._tick, self._tick + 1)
+        delta = tick - self._tick
+        span = self.slots
+        for level in range(self.levels):
+            if delta < span:
+                slot = self._wheels[level][(tick * self.slots // span) % self.slots]
+                slot.add(timer)
+                timer._level = level
+                timer._slot = slot
+                self._counts[level] += 1
+                return
+            span *= self.slots
+        self._overflow.add(timer)
+        timer._slot = self._overflow
+
+    def _cascade(self, tick):
+        """move timers of higher levels to lower levels"""
+        slots = self.slots
+        span = slots
+        timers = []
+        for level in range(1, self.levels):
+            if tick % span:
+                break
+            slot = self._wheels[level][(tick // span) % slots]
+            self._counts[level] -= len(slot)
+            timers.extend(slot)
+            slot.clear()
+            span *= slots
+        else:
+            if self._overflow:
+                timers.extend(self._overflow)
+                self._overflow.clear()
+        for timer in timers:
+            self._insert(timer, cascade=True)
+
+    def _next_tick(self):
+        if not any(self._counts) and not self._overflow:
+            return None
+        slots = self.slots
+        wheel = self._wheels[0]
+        higher = any(self._counts[1:]) or self._overflow
+        for i in range(1, slots + 1):
+            tick = self._tick + i
+            if wheel[tick % slots] or (higher and tick % slots == 0):
+                return tick
+        return self._tick + slots
+
+    def _run(self):
+        """Timer Thread"""
+        with self._lock:
+            while self._running:
+                tick = self._next_tick()
+                now = monotonic()
+                if tick is None or tick > int(now / self.resolution):
+                    if tick is None:
+                        self._wakeup = float("inf")
+                        self._cond.wait()
+                    else:
+                        self._wakeup = tick * self.resolution
+                        self._cond.wait(max(self._wakeup - now, 0.001))
+                    self._wakeup = None
+                    continue
+                self._lock.release()
+                try:
+                    self.advance(now)
+                finally:
+                    self._lock.acquire()
+
+
+_shared = None
+_shared_lock = Lock()
+
+
+def shared_wheel():
+    """return timer wheel shared by all clients of the process
+
+    The wheel is started in a background thread on first use. Callbacks
+    must never block on socket IO as all clients share this thread.
+
+    :rtype: ancp.timer.TimerWheel
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = TimerWheel()
+            _shared.start()
+    return _shared
@@ -0,0 +1,227 @@
+"""ANCP Transmit Queue
+
+Prioritized transmit queue with a dedicated writer thread per socket.
+Adjacency messages (SYN, ACK, ...) are queued separately and sent before
+any queued port up/down message, so keep-alives are not delayed by bulk
+sends if the TCP window of the NAS is small. Small frames queued by
+concurrent threads are coalesced into writes of up to `max_write` bytes.
+
+Producers never wait for the socket. Only bulk producers wait if more than
+`high_water` bytes are queued (backpressure); adjacency messages are never
+blocked. Bulk data larger than `max_write` (e.g. a chunk of port up
+messages) is split at message boundaries, so an adjacency message waits at
+most for the write in progress (up to `max_write` bytes or a single larger
+message).
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from ancp import codec
+from ancp.protocol import clock
+from collections import deque
+from threading import Thread, Condition
+import selectors
+import socket
+import logging
+
+log = logging.getLogger(__name__)
+
+
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+
+
+class TransmitQueue(object):
+    """Prioritized and coalescing transmit queue
+
+    :param sock: connected socket
+    :type sock: socket.socket
+    :param high_water: max. queued bulk bytes before producers wait (default=4 MiB)
+    :type high_water: int
+    :param max_write: max. bytes coalesced into a single write (default=65536)
+    :type max_write: int
+    :param on_write: called from the writer thread with (data, seconds) after each write
+    :type on_write: callable
+    """
+    def __init__(self, sock, high_water=4194304, max_write=65536, on_write=None):
+        self.socket = sock
+        self.high_water = high_water
+        self.max_write = max_write
+        self.on_write = on_write
+        self.error = None       # exception which stopped the writer
+        self.frames = 0
+        self.writes = 0
+        self.bytes = 0
+        self._control = deque()
+        self._bulk = deque()
+        self._pending = 0       # queued bulk bytes
+        self._cond = Condition()
+        self._closing = False
+        self._writing = False
+        self._thread = Thread(target=self._run, name="tx")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __repr__(self):
+        return "TransmitQueue(pending=%d, writes=%d)" % (self._pending, self.writes)
+
+    @property
+    def pending(self):
+        """number of queued bulk bytes"""
+        return self._pending
+
+    def put(self, data, priority=False):
+        """queue data for sending
+
+        Data is copied. Bulk data waits while more than `high_water` bytes
+        are queued and is split into writes of up to `max_write` bytes at
+        message boundaries; priority data is queued immediately.
+
+        :param data: encoded messages
+        :type data: bytes
+        :param priority: send before all queued bulk data (adjacency messages)
+        :type priority: bool
+        :raises socket.error: if the writer is stopped
+        """
+        data = bytes(data)
+        if not priority and len(data) > self.max_write:
+            frames = self._split(data)
+        else:
+            frames = (data,)
+        with self._cond:
+            if priority:
+                self._check()
+                self._control.append(data)
+            else:
+                while self._pending >= self.high_water and self.error is None and not self._closing:
+                    self._cond.wait()
+                self._check()
+                self._bulk.extend(frames)
+                self._pending += len(data)
+            self.frames += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """wait until all queued data is sent
+
+        :return: True if all data is sent
+        :rtype: bool
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._idle() or self.error is not None, timeout)
+
+    def close(self, timeout=None):
+        """send queued data and stop writer thread
+
+        Queued data is discarded if not sent within timeout.
+        """
+        self.flush(timeout)
+        with self._cond:
+            self._closing = True
+            self._control.clear()
+            self._bulk.clear()
+            self._pending = 0
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    # internal methods --------------------------------------------------------
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+        if self._closing:
+            raise socket.error("transmit queue closed")
+
+    def _idle(self):
+        return not self._control and not self._bulk and not self._writing
+
+    def _split(self, data):
+        """split data into pieces of up to max_write bytes at message boundaries"""
+        pieces = []
+        size = len(data)
+        max_write = self.max_write
+        unpack = codec.HEADER.unpack_from
+        start = off = 0
+        while off + 4 <= size:
+            ident, length = unpack(data, off)
+            end = off + 4 + length
+            if ident != codec.IDENT or end > size:
+                break
+            if end - start > max_write and off > start:
+                pieces.append(data[start:off])
+                start = off
+            off = end
+        pieces.append(data[start:])
+        return pieces
+
+    def _next(self):
+        """return next write (all adjacency messages or coalesced bulk data)"""
+        if self._control:
+            data = b"".join(self._control)
+            self._control.clear()
+            return data
+        bulk = self._bulk
+        first = bulk.popleft()
+        if len(first) >= self.max_write or not bulk:
+            self._pending -= len(first)
+            return first
+        size = len(first)
+        frames = [first]
+        while bulk and size + len(bulk[0]) <= self.max_write:
+            data = bulk.popleft()
+            frames.append(data)
+            size += len(data)
+        self._pending -= size
+        return b"".join(frames)
+
+    def _run(self):
+        """Writer Thread"""
+        while True:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+                while not self._control and not self._bulk and not self._closing:
+                    self._cond.wait()
+                if self._closing:
+                    return
+                data = self._next()
+                self._writing = True
+                # producers waiting for high water
+                self._cond.notify_all()
+            t0 = clock()
+            try:
+                self._write(data)
+                self.writes += 1
+                self.bytes += len(data)
+                if self.on_write is not None:
+                    self.on_write(data, clock() - t0)
+            except Exception as e:
+                log.warning("transmit failed: %s", e)
+                with self._cond:
+                    self.error = e
+                    self._writing = False
+                    self._control.clear()
+                    self._bulk.clear()
+                    self._pending = 0
+                    self._cond.notify_all()
+                return
+
+    def _write(self, data):
+        """send data without blocking in send (wait for writable socket)"""
+        view = memoryview(data)
+        sock = self.socket
+        with selectors.DefaultSelector() as selector:
+            selector.register(sock, selectors.EVENT_WRITE)
+            while view:
+                try:
+                    sent = sock.send(view, MSG_DONTWAIT)
+                except (BlockingIOError, InterruptedError):
+                    sent = 0
+                if sent:
+                    view = view[sent:]
+                    continue
+                # poll/epoll based, not limited to file descriptors < FD_SETSIZE
+                while not selector.select(1.0):
+                    if self._closing:
+                        raise socket.error("transmit queue closed")
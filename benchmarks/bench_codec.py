@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""ANCP Codec Benchmark
+
+Compares port-up encoding throughput (frames/second) of the legacy
+format-string based encoder with the precompiled struct codec.
+
+    python benchmarks/bench_codec.py -n 1000000
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from ancp.protocol import Protocol, MessageType, AdjacencyState
+from ancp.metrics import Metrics
+from ancp.subscriber import Subscriber, TLV, TlvType, access_loop_enc
+import argparse
+import struct
+import time
+
+
+# legacy encoder (PyANCP 0.1.7) -----------------------------------------------
+
+def legacy_mktlvs(tlvs):
+    blen = 0
+    for t in tlvs:
+        blen += 4 + t.off
+    b = bytearray(blen)
+    off = 0
+    for t in tlvs:
+        if isinstance(t.val, tuple):
+            struct.pack_into("!HH", b, off, t.type, t.len)
+            off += 4
+            for i in t.val:
+                struct.pack_into("!I", b, off, i)
+                off += 4
+        elif isinstance(t.val, list):
+            struct.pack_into("!HH", b, off, t.type, t.off)
+            off += 4
+            for s in t.val:
+                if isinstance(s.val, int):
+                    struct.pack_into("!HHI", b, off, s.type, s.len, s.val)
+                else:
+                    fmt = "!HH%ds" % s.len
+                    struct.pack_into(fmt, b, off, s.type, s.len, bytes(s.val, encoding='utf-8'))
+                off += 4 + s.off
+        else:
+            if isinstance(t.val, int):
+                struct.pack_into("!HHI", b, off, t.type, t.len, t.val)
+            else:
+                fmt = "!HH%ds" % t.len
+                struct.pack_into(fmt, b, off, t.type, t.len, bytes(t.val, encoding='utf-8'))
+            off += 4 + t.off
+    return b
+
+
+def legacy_tlvs(subscriber):
+    s = subscriber
+    tlvs = [TLV(TlvType.ACI, s.aci)]
+    if s.ari is not None:
+        tlvs.append(TLV(TlvType.ARI, s.ari))
+    if s.aaci_bin is not None:
+        tlvs.append(TLV(TlvType.AACI_BIN, s.aaci_bin))
+    if s.aaci_ascii is not None:
+        tlvs.append(TLV(TlvType.AACI_ASCII, s.aaci_ascii))
+    line = [TLV(TlvType.TYPE, s.dsl_type)]
+    line.append(access_loop_enc(s.data_link, s.encap1, s.encap2))
+    line.append(TLV(TlvType.STATE, s.state))
+    for t, v in ((TlvType.UP, s.up), (TlvType.DOWN, s.down),
+                 (TlvType.MIN_UP, s.min_up), (TlvType.MIN_DOWN, s.min_down),
+                 (TlvType.ATT_UP, s.att_up), (TlvType.ATT_DOWN, s.att_down),
+                 (TlvType.MAX_UP, s.max_up), (TlvType.MAX_DOWN, s.max_down)):
+        if v is not None:
+            line.append(TLV(t, v))
+    tlvs.append(TLV(TlvType.LINE, line))
+    return (len(tlvs), legacy_mktlvs(tlvs))
+
+
+class LegacyEncoder(object):
+    version = 50
+    transaction_id = 1
+
+    def _mkgeneral(self, message_type, result, result_code, body):
+        b = bytearray(4 + 12)
+        partition_id = 0
+        off = 0
+        struct.pack_into("!HH", b, off, 0x880c, len(b) - 4 + len(body))
+        off += 4
+        struct.pack_into("!BBH", b, off, self.version, message_type, (result << 12) | result_code)
+        off += 4
+        struct.pack_into("!I", b, off, (partition_id << 24) | self.transaction_id)
+        self.transaction_id += 1
+        off += 4
+        struct.pack_into("!HH", b, off, 0x8001, len(b) - 4 + len(body))
+        off += 4
+        return b + body
+
+    def port_updwn(self, message_type, tech_type, encoded):
+        msg = bytearray()
+        for num_tlvs, tlvs in encoded:
+            b = bytearray(28)
+            off = 20
+            struct.pack_into("!xBBx", b, off, message_type, tech_type)
+            off += 4
+            struct.pack_into("!HH", b, off, num_tlvs, len(tlvs))
+            off += 4
+            msg += self._mkgeneral(message_type, 1, 0, b + tlvs)
+        return msg
+
+
+# benchmark -------------------------------------------------------------------
+
+class NullProtocol(Protocol):
+    def _sendmsg(self, buffers):
+        self._tx_buffer += b"".join(buffers)
+
+
+def report(name, count, elapsed):
+    print("%-24s %10d frames %8.3fs %12.0f frames/s" % (name, count, elapsed, count / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANCP Codec Benchmark")
+    parser.add_argument("-n", "--subscribers", type=int, default=1000000)
+    parser.add_argument("--metrics", action="store_true", help="enable metrics")
+    args = parser.parse_args()
+
+    subs = [Subscriber(aci="0.0.0.0 eth %d" % i, up=1024, down=16000, aaci_bin=(i, 7))
+            for i in range(args.subscribers)]
+
+    # before: legacy TLV and header encoding
+    legacy = LegacyEncoder()
+    start = time.perf_counter()
+    msg = legacy.port_updwn(MessageType.PORT_UP, 5, (legacy_tlvs(s) for s in subs))
+    legacy_elapsed = time.perf_counter() - start
+    report("port-up (legacy)", len(subs), legacy_elapsed)
+
+    # after: precompiled struct codec
+    protocol = NullProtocol()
+    protocol.state = AdjacencyState.ESTAB
+    protocol.chunk_size = 65536
+    if args.metrics:
+        protocol.metrics = Metrics()
+    start = time.perf_counter()
+    protocol._send_port_updwn(MessageType.PORT_UP, 5, subs)
+    codec_elapsed = time.perf_counter() - start
+    report("port-up (codec)", len(subs), codec_elapsed)
+    assert protocol.data_to_send() == msg
+    print("speedup: %.2fx" % (legacy_elapsed / codec_elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""ANCP Decode Benchmark
+
+Compares receive throughput (frames/second) of the legacy decoder, which
+copies every message into a new bytearray, with the zero-copy memoryview
+decoder (header only and full TLV walk).
+
+    python benchmarks/bench_decode.py -n 1000000
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from ancp.protocol import Protocol, MessageType, AdjacencyState
+from ancp.subscriber import Subscriber
+from ancp import codec
+import argparse
+import struct
+import time
+
+
+class BufferProtocol(Protocol):
+    def _sendmsg(self, buffers):
+        self._tx_buffer += b"".join(buffers)
+
+
+def legacy_decode(data):
+    # receive loop of PyANCP 0.1.7 (copy per message, if/elif dispatch)
+    buf = bytearray(data)
+    count = 0
+    off = 0
+    while len(buf) - off >= 4:
+        (id, length) = struct.unpack_from("!HH", buf, off)
+        if id != 0x880C:
+            raise ValueError("incorrect ident 0x%x" % id)
+        if len(buf) - off - 4 < length:
+            break
+        b = buf[off + 4:off + 4 + length]
+        off += 4 + length
+        (ver, mtype, var) = struct.unpack_from("!BBH", b, 0)
+        if mtype == MessageType.ADJACENCY:
+            pass
+        elif mtype == MessageType.PORT_UP:
+            count += 1
+        elif mtype == MessageType.PORT_DOWN:
+            count += 1
+    del buf[:off]
+    return count
+
+
+def codec_decode(data, walk=False):
+    view = memoryview(data)
+    size = len(view)
+    count = 0
+    off = 0
+    while size - off >= 4:
+        (id, length) = codec.HEADER.unpack_from(view, off)
+        if id != codec.IDENT:
+            raise ValueError("incorrect ident 0x%x" % id)
+        if size - off - 4 < length:
+            break
+        msg = codec.decode(view[off + 4:off + 4 + length])
+        if walk:
+            for tlv in msg.tlvs:
+                for sub in tlv.tlvs:
+                    pass
+        off += 4 + length
+        count += 1
+    return count
+
+
+def report(name, count, elapsed):
+    print("%-24s %10d frames %8.3fs %12.0f frames/s" % (name, count, elapsed, count / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANCP Decode Benchmark")
+    parser.add_argument("-n", "--subscribers", type=int, default=1000000)
+    args = parser.parse_args()
+
+    subs = [Subscriber(aci="0.0.0.0 eth %d" % i, up=1024, down=16000, aaci_bin=(i, 7))
+            for i in range(args.subscribers)]
+    protocol = BufferProtocol()
+    protocol.state = AdjacencyState.ESTAB
+    protocol.port_up(subs)
+    data = protocol.data_to_send()
+
+    start = time.perf_counter()
+    count = legacy_decode(data)
+    legacy_elapsed = time.perf_counter() - start
+    report("decode (legacy)", count, legacy_elapsed)
+
+    start = time.perf_counter()
+    count = codec_decode(data)
+    header_elapsed = time.perf_counter() - start
+    report("decode (header)", count, header_elapsed)
+
+    start = time.perf_counter()
+    count = codec_decode(data, walk=True)
+    walk_elapsed = time.perf_counter() - start
+    report("decode (TLV walk)", count, walk_elapsed)
+    print("speedup: %.2fx" % (legacy_elapsed / header_elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""ANCP Parallel Encoding Benchmark
+
+Compares port-up encoding throughput (frames/second) of the serial
+encoder with `ancp.parallel.ParallelEncoder` for an increasing number of
+worker processes (default: 1, 2, 4, ... up to the number of CPUs). TLVs
+are not cached, so each run encodes all subscribers from scratch.
+
+    python benchmarks/bench_parallel.py -n 1000000 -w 1 2 4 8
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from ancp.parallel import ParallelEncoder
+from ancp.protocol import Protocol, AdjacencyState
+from ancp.subscriber import Subscriber
+import argparse
+import os
+import time
+
+
+class NullProtocol(Protocol):
+    """discard encoded messages"""
+    def __init__(self):
+        super(NullProtocol, self).__init__()
+        self.state = AdjacencyState.ESTAB
+        self.bytes = 0
+
+    def _sendmsg(self, buffers):
+        for b in buffers:
+            self.bytes += len(b)
+
+
+def run(subs, encoder=None):
+    for s in subs:
+        s._tlvs = None
+    protocol = NullProtocol()
+    protocol.encoder = encoder
+    start = time.perf_counter()
+    protocol.port_up(subs)
+    return time.perf_counter() - start, protocol.bytes
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    workers = [1]
+    while workers[-1] * 2 <= cpus:
+        workers.append(workers[-1] * 2)
+    if workers[-1] != cpus:
+        workers.append(cpus)
+    parser = argparse.ArgumentParser(description="ANCP Parallel Encoding Benchmark")
+    parser.add_argument("-n", "--subscribers", type=int, default=1000000)
+    parser.add_argument("-w", "--workers", type=int, nargs="+", default=workers)
+    parser.add_argument("-b", "--batch", type=int, default=2048)
+    args = parser.parse_args()
+
+    subs = [Subscriber(aci="0.0.0.0 eth %d" % i, up=1024, down=16000, aaci_bin=i % 4096)
+            for i in range(args.subscribers)]
+    print("%d CPUs, %d subscribers" % (cpus, len(subs)))
+    serial, total = run(subs)
+    print("%-12s %8.3fs %12.0f frames/s %8.1f MB/s" % (
+          "serial", serial, len(subs) / serial, total / serial / 1e6))
+    for count in args.workers:
+        encoder = ParallelEncoder(workers=count, batch=args.batch)
+        run(subs[:count * args.batch], encoder)     # start workers
+        elapsed, total = run(subs, encoder)
+        encoder.close()
+        print("%-12s %8.3fs %12.0f frames/s %8.1f MB/s %6.2fx" % (
+              "%d workers" % count, elapsed, len(subs) / elapsed, total / elapsed / 1e6, serial / elapsed))
+
+
+if __name__ == "__main__":
+    main()
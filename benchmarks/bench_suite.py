@@ -0,0 +1,189 @@
+"""ANCP Benchmark Suite (pytest-benchmark)
+
+The suite is not collected by the unit tests and must be passed explicitly:
+
+    pytest benchmarks/bench_suite.py
+
+Store results as JSON baseline and compare later runs against it (fails
+if the mean of a benchmark is more than 20% slower than the baseline):
+
+    pytest benchmarks/bench_suite.py --benchmark-storage=benchmarks/baselines --benchmark-save=baseline
+    pytest benchmarks/bench_suite.py --benchmark-storage=benchmarks/baselines \\
+        --benchmark-compare --benchmark-compare-fail=mean:20%
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.client import Client
+from ancp.protocol import (Protocol, MessageType, MessageCode, AdjacencyState,
+                           ResultFields, ResultCodes)
+from ancp.server import Server, NasSession
+from ancp.state import StateStore
+from ancp.template import FrameTemplate
+from ancp.subscriber import Subscriber, TLV, TlvType, mktlvs
+import pytest
+
+
+# subscriber line attributes for different TLV mixes
+MIXES = {
+    "aci": dict(),
+    "aaci_bin": dict(aaci_bin=(1000, 7)),
+    "aaci_ascii": dict(ari="0000.0000.0001", aaci_ascii="port 1/1/1:7"),
+    "rates": dict(up=1024, down=16000, min_up=512, min_down=8000,
+                  att_up=2048, att_down=32000, max_up=4096, max_down=64000),
+}
+
+# number of subscribers and rounds
+SIZES = [(1000, 50), (100000, 3), (1000000, 1)]
+
+
+def subscribers(count, **kwargs):
+    return [Subscriber(aci="0.0.0.0 eth %d" % i, **kwargs) for i in range(count)]
+
+
+class NullProtocol(Protocol):
+    """established protocol without transmit buffer"""
+    def __init__(self):
+        super(NullProtocol, self).__init__()
+        self.state = AdjacencyState.ESTAB
+        self.sent = 0
+
+    def _sendmsg(self, buffers):
+        self.sent += sum(map(len, buffers))
+
+
+# encoding --------------------------------------------------------------------
+
+@pytest.mark.parametrize("mix", sorted(MIXES))
+def test_subscriber_tlvs(benchmark, mix):
+    subscriber = Subscriber(aci="0.0.0.0 eth 1", **MIXES[mix])
+    # encode without cache
+    num_tlvs, tlvs = benchmark(subscriber._mktlvs)
+    assert (num_tlvs, tlvs) == subscriber.tlvs
+
+
+@pytest.mark.parametrize("mix", sorted(MIXES))
+def test_subscriber_tlvs_cached(benchmark, mix):
+    subscriber = Subscriber(aci="0.0.0.0 eth 1", **MIXES[mix])
+    benchmark(lambda: subscriber.tlvs)
+
+
+@pytest.mark.parametrize("mix", sorted(MIXES))
+def test_mktlvs(benchmark, mix):
+    kwargs = MIXES[mix]
+    tlvs = [TLV(TlvType.ACI, "0.0.0.0 eth 1")]
+    if "ari" in kwargs:
+        tlvs.append(TLV(TlvType.ARI, kwargs["ari"]))
+        tlvs.append(TLV(TlvType.AACI_ASCII, kwargs["aaci_ascii"]))
+    if "aaci_bin" in kwargs:
+        tlvs.append(TLV(TlvType.AACI_BIN, kwargs["aaci_bin"]))
+    line = [TLV(TlvType.TYPE, 5), TLV(TlvType.STATE, 1)]
+    for t, name in ((TlvType.UP, "up"), (TlvType.DOWN, "down"),
+                    (TlvType.MIN_UP, "min_up"), (TlvType.MIN_DOWN, "min_down"),
+                    (TlvType.ATT_UP, "att_up"), (TlvType.ATT_DOWN, "att_down"),
+                    (TlvType.MAX_UP, "max_up"), (TlvType.MAX_DOWN, "max_down")):
+        if name in kwargs:
+            line.append(TLV(t, kwargs[name]))
+    tlvs.append(TLV(TlvType.LINE, line))
+    benchmark(mktlvs, tlvs)
+
+
+def test_mkadjac(benchmark):
+    p = Protocol()
+    b = benchmark(p._mkadjac, MessageType.ADJACENCY, p.timer * 10, 0, MessageCode.SYN)
+    assert len(b) == 44
+
+
+def test_mkgeneral(benchmark):
+    p = Protocol()
+    body = bytes(28)
+    b = benchmark(p._mkgeneral, MessageType.PORT_UP, ResultFields.Nack, ResultCodes.NoResult, body)
+    assert len(b) == 16 + len(body)
+
+
+@pytest.mark.parametrize("count,rounds", SIZES, ids=["1k", "100k", "1M"])
+def test_port_up(benchmark, count, rounds):
+    p = NullProtocol()
+
+    def setup():
+        # new subscribers without cached TLVs for each round
+        return (subscribers(count, up=1024, down=16000),), {}
+
+    benchmark.pedantic(p.port_up, setup=setup, rounds=rounds, iterations=1)
+    benchmark.extra_info["frames_per_second"] = count / benchmark.stats.stats.mean
+
+
+@pytest.mark.parametrize("template", [False, True], ids=["subscribers", "template"])
+def test_port_flap(benchmark, template):
+    count = 100000
+    p = NullProtocol()
+    subs = subscribers(count, up=1024, down=16000)
+    source = FrameTemplate(subs) if template else subs
+    # encode TLVs once
+    p.port_up(subs)
+
+    def flap():
+        p.port_down(source)
+        p.port_up(source)
+
+    benchmark.pedantic(flap, rounds=5, iterations=1)
+    benchmark.extra_info["frames_per_second"] = 2 * count / benchmark.stats.stats.mean
+
+
+def test_state_diff(benchmark):
+    count = 1000000
+    subs = subscribers(count, up=1024, down=16000)
+    store = StateStore(NullProtocol())
+    store.apply(store.diff(subs))
+    # 1% changed and 0.1% removed ports
+    for s in subs[::100]:
+        s.up = 2048
+    desired = subs[:-1000]
+    diff = benchmark.pedantic(store.diff, args=(desired,), rounds=3, iterations=1)
+    assert len(diff.up) == count // 100 - 10
+    assert len(diff.down) == 1000
+
+
+# loopback --------------------------------------------------------------------
+
+def loopback(server, subs):
+    client = Client(address="127.0.0.1", port=server.port)
+    assert client.connect()
+    client.ack_all(window=len(subs))
+    client.port_up(subs)
+    # all port up messages are acknowledged by the server
+    assert client.wait_transactions(timeout=60)
+    client.disconnect()
+
+
+def test_loopback(benchmark):
+    count = 100000
+    subs = subscribers(count, up=1024, down=16000)
+    server = Server(port=0)
+    server.start()
+    try:
+        benchmark.pedantic(loopback, args=(server, subs), rounds=3, iterations=1)
+        counters = server.counters()
+        assert counters["port_up"] == 3 * count
+        assert counters["errors"] == 0
+    finally:
+        server.stop()
+    benchmark.extra_info["frames_per_second"] = count / benchmark.stats.stats.mean
+
+
+def test_server_decode(benchmark):
+    count = 100000
+    p = Protocol()
+    p.state = AdjacencyState.ESTAB
+    p.port_up(subscribers(count, up=1024, down=16000))
+    data = p.data_to_send()
+
+    def decode():
+        session = NasSession(("127.0.0.1", 0))
+        session.receive_data(data)
+        return session
+
+    session = benchmark.pedantic(decode, rounds=3, iterations=1)
+    assert session.port_up_count == count
+    assert session.ports_up == count
+    benchmark.extra_info["frames_per_second"] = count / benchmark.stats.stats.mean
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""ANCP Transmit Benchmark
+
+Compares the transmit path joining all frames into a single buffer
+(sendall) with scatter-gather IO (sendmsg) over a local socket pair.
+
+    python benchmarks/bench_transmit.py -n 1000000
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from __future__ import print_function
+from ancp.client import Client
+from ancp.subscriber import Subscriber
+from threading import Thread
+import argparse
+import socket
+import time
+
+
+def drain(sock, result):
+    total = 0
+    while True:
+        b = sock.recv(1 << 20)
+        if not b:
+            break
+        total += len(b)
+    result.append(total)
+
+
+def run(subs, scatter_gather):
+    client = Client(address="127.0.0.1")
+    client.socket.close()
+    client.socket, peer = socket.socketpair()
+    client.chunk_size = client.socket.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+    client.scatter_gather = scatter_gather
+    client.established.set()
+    result = []
+    reader = Thread(target=drain, args=(peer, result))
+    reader.start()
+
+    # count user space copies of frame bytes
+    copied = [0]
+    sendall = client._sendall
+
+    def counting_sendall(b):
+        copied[0] += len(b)
+        sendall(b)
+
+    client._sendall = counting_sendall
+    start = time.perf_counter()
+    client.port_up(subs)
+    client.socket.shutdown(socket.SHUT_WR)
+    reader.join()
+    elapsed = time.perf_counter() - start
+    client.socket.close()
+    peer.close()
+    return elapsed, result[0], copied[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANCP Transmit Benchmark")
+    parser.add_argument("-n", "--subscribers", type=int, default=1000000)
+    args = parser.parse_args()
+
+    subs = [Subscriber(aci="0.0.0.0 eth %d" % i, up=1024, down=16000) for i in range(args.subscribers)]
+    for s in subs:
+        s.tlvs  # encode TLVs once (cached)
+
+    for name, scatter_gather in (("sendall", False), ("sendmsg", True)):
+        elapsed, total, copied = run(subs, scatter_gather)
+        print("%-8s %10d frames %8.3fs %12.0f frames/s %8.1f MB/s %6.1f bytes copied/frame" % (
+              name, len(subs), elapsed, len(subs) / elapsed, total / elapsed / 1e6, float(copied) / len(subs)))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,21 @@ SPDX-License-Identifier: MIT
 """
 from ancp.client import Client
 from ancp.subscriber import Subscriber
+from ancp.loader import load, load_table
+import argparse
 import time
 import logging
 import sys
 
+parser = argparse.ArgumentParser(description="ANCP Client Example")
+parser.add_argument("-a", "--address", default="172.30.138.10", help="ANCP server address")
+parser.add_argument("-p", "--port", type=int, default=6068, help="ANCP port")
+parser.add_argument("-s", "--subscribers", metavar="FILE",
+                    help="load subscribers from CSV or JSON Lines file")
+parser.add_argument("--format", choices=("csv", "jsonl"), help="subscriber file format (default: from extension)")
+parser.add_argument("--table", action="store_true", help="load subscribers into a subscriber table")
+args = parser.parse_args()
+
 # setup logging to stdout
 log = logging.getLogger()
 log.setLevel(logging.DEBUG)
@@ -19,19 +30,32 @@ handler.setFormatter(logging.Formatter('%(asctime)-15s [%(levelname)-8s] %(messa
 log.addHandler(handler)
 
 # setup ancp session
-client = Client(address="172.30.138.10")
+client = Client(address=args.address, port=args.port)
 if client.connect():
-    # create ancp subscribers
-    S1 = Subscriber(aci="0.0.0.0 eth 1", up=1024, down=16000, aaci_bin=128, aaci_ascii="128")
-    S2 = Subscriber(aci="0.0.0.0 eth 2", up=2048, down=32000, aaci_bin=(128, 7), aaci_ascii="128")
+    if args.subscribers and args.table:
+        subscribers = load_table(args.subscribers, args.format)
+    elif args.subscribers:
+        subscribers = None
+    else:
+        # create ancp subscribers
+        S1 = Subscriber(aci="0.0.0.0 eth 1", up=1024, down=16000, aaci_bin=128, aaci_ascii="128")
+        S2 = Subscriber(aci="0.0.0.0 eth 2", up=2048, down=32000, aaci_bin=(128, 7), aaci_ascii="128")
+        subscribers = [S1, S2]
 
     # send port-up for ancp subscribers
-    client.port_up([S1, S2])
+    if subscribers is None:
+        # stream subscribers from file
+        client.port_up(load(args.subscribers, args.format))
+    else:
+        client.port_up(subscribers)
     # keep session active
     try:
         while client.established.is_set():
             time.sleep(1)
     except KeyboardInterrupt:
         # send port-down for ancp subscribers
-        client.port_down([S1, S2])
+        if subscribers is None:
+            client.port_down(load(args.subscribers, args.format))
+        else:
+            client.port_down(subscribers)
         client.disconnect()
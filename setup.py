@@ -22,4 +22,5 @@ setup(name='PyANCP',
       zip_safe=True,
       include_package_data=True,
       install_requires=['future'],
+      extras_require={'numpy': ['numpy']},
       )
@@ -0,0 +1,15 @@
+"""Shared Test Fixtures
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.server import Server
+import pytest
+
+
+@pytest.fixture
+def server():
+    server = Server(port=0)
+    server.start()
+    yield server
+    server.stop()
@@ -0,0 +1,30 @@
+"""Shared Test Helpers
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.protocol import Protocol, AdjacencyState
+from ancp.subscriber import Subscriber
+import time
+
+
+class TxProtocol(Protocol):
+    """established protocol without socket (see data_to_send)"""
+    def __init__(self):
+        super(TxProtocol, self).__init__()
+        self.state = AdjacencyState.ESTAB
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def subscribers(count, **kwargs):
+    kwargs.setdefault("up", 1024)
+    kwargs.setdefault("down", 16000)
+    return [Subscriber(aci="0.0.0.0 eth %d" % i, **kwargs) for i in range(count)]
@@ -0,0 +1,64 @@
+"""ANCP asyncio Client Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.aio import AsyncClient
+from ancp.client import *
+from ancp.subscriber import Subscriber
+import asyncio
+import struct
+
+
+async def _read_message(reader):
+    b = await reader.readexactly(4)
+    (id, length) = struct.unpack("!HH", b)
+    assert id == 0x880C
+    return await reader.readexactly(length)
+
+
+async def _session():
+    # NAS side messages are created with M flag set
+    nas = Client(address="127.0.0.1")
+    nas.socket.close()
+    received = []
+
+    async def handle(reader, writer):
+        b = await _read_message(reader)
+        assert b[3] & 0x7f == MessageCode.SYN
+        writer.write(nas._mkadjac(MessageType.ADJACENCY, nas.timer * 10, 1, MessageCode.SYNACK))
+        while True:
+            try:
+                b = await _read_message(reader)
+            except asyncio.IncompleteReadError:
+                break
+            received.append(b)
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    client = AsyncClient(address="127.0.0.1", port=port)
+    assert await client.connect() is True
+    assert client.state == AdjacencyState.ESTAB
+
+    S1 = Subscriber(aci="0.0.0.0/0.0.0.0 eth 1/1:7", up=1024, down=16000)
+    S2 = Subscriber(aci="0.0.0.0/0.0.0.0 eth 2/2:7", up=1024, down=16000)
+    await client.port_up([S1, S2])
+    await client.port_down(S1)
+    await client.disconnect()
+    assert client.established.is_set() is False
+
+    await asyncio.sleep(0.1)
+    server.close()
+    await server.wait_closed()
+    return received
+
+
+def test_async_session():
+    received = asyncio.run(_session())
+    codes = [(b[1], b[3] & 0x7f) for b in received]
+    assert codes == [(MessageType.ADJACENCY, MessageCode.ACK),
+                     (MessageType.PORT_UP, 0),
+                     (MessageType.PORT_UP, 0),
+                     (MessageType.PORT_DOWN, 0),
+                     (MessageType.ADJACENCY, MessageCode.RSTACK)]
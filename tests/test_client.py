@@ -6,6 +6,7 @@ SPDX-License-Identifier: MIT
 from ancp.client import *
 from ancp.subscriber import Subscriber
 from mock import MagicMock
+import struct
 import pytest
 import time
 import logging
@@ -27,19 +28,19 @@ def ancp_client():
     # socket rx/tx mock
     client._rx_bytes = bytearray()
     client._tx_bytes = bytearray()
+    client._rx_off = 0
 
-    def _rx(b):
-        off = 0
-        length = 0
-        while True:
-            if off <= len(b):
-                length = yield b[off-length:off]
-                off += length
-            else:
-                time.sleep(1.0)
-    rx = _rx(client._rx_bytes)
-    next(rx)
-    client._recvall = rx.send
+    def recv_into(view):
+        # return max. 7 bytes per call to test partial messages
+        b = client._rx_bytes[client._rx_off:client._rx_off + min(len(view), 7)]
+        if not b:
+            time.sleep(0.1)
+            raise socket.timeout()
+        view[:len(b)] = b
+        client._rx_off += len(b)
+        return len(b)
+
+    client.socket.recv_into = recv_into
 
     def tx(msg):
         client._tx_bytes += msg
@@ -104,3 +105,19 @@ def test_disconnect(ancp_client):
     assert code == MessageCode.RSTACK
     assert ancp_client.established.is_set() == False
     assert ancp_client.state != AdjacencyState.ESTAB
+
+
+def test_sendmsgall():
+    sock = MagicMock()
+    sent = []
+
+    def sendmsg(buffers):
+        # send max. 5 bytes per call
+        b = b"".join(bytes(b) for b in buffers)[:5]
+        sent.append(b)
+        return len(b)
+
+    sock.sendmsg = sendmsg
+    sendmsgall(sock, [b"abc", b"defghijkl", b"", b"mn", bytearray(b"opqrstuvwxyz")])
+    assert b"".join(sent) == b"abcdefghijklmnopqrstuvwxyz"
+    assert all(len(b) == 5 for b in sent[:-1])
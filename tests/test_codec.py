@@ -0,0 +1,79 @@
+"""ANCP Codec Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.codec import *
+from ancp.protocol import MessageType, MessageCode, Capabilities, ResultFields
+import struct
+
+
+def test_mkadjac():
+    b = mkadjac(50, MessageType.ADJACENCY, 250, 0, MessageCode.SYN,
+                b"\x01\x02\x03\x04\x05\x06", b"\x00" * 6, 0, 0, 16777217, 0,
+                [Capabilities.TOPO, Capabilities.OAM])
+    assert len(b) == 48
+    assert struct.unpack_from("!HHBBBB", b) == (IDENT, 44, 50, MessageType.ADJACENCY, 250, MessageCode.SYN)
+    assert struct.unpack_from("!BH", b, 37) == (2, 8)
+    # capabilities are encoded as TLVs with length 0
+    assert struct.unpack_from("!HHHH", b, 40) == (Capabilities.TOPO, 0, Capabilities.OAM, 0)
+
+
+def test_mkgeneral():
+    b = mkgeneral(50, MessageType.PORT_MANAGEMENT, ResultFields.Nack, 0, 7, b"abcd")
+    assert struct.unpack_from("!HHBBHIHH", b) == (IDENT, 16, 50, MessageType.PORT_MANAGEMENT, 0x1000, 7, 0x8001, 16)
+    assert b[16:] == b"abcd"
+
+
+def test_mkport():
+    tlvs = mktlv(0x0001, "eth 1")
+    b = mkport(50, MessageType.PORT_UP, ResultFields.Nack, 0, 1, 5, 1, tlvs)
+    assert len(b) == 44
+    length = struct.unpack_from("!H", b, 2)[0]
+    assert length == len(b) + len(tlvs) - 4
+    assert struct.unpack_from("!BBxHH", b, 37) == (MessageType.PORT_UP, 5, 1, len(tlvs))
+
+
+def test_mktlv():
+    assert mktlv(0x0081, 1024) == struct.pack("!HHI", 0x0081, 4, 1024)
+    assert mktlv(0x0006, (128, 7)) == struct.pack("!HHII", 0x0006, 8, 128, 7)
+    assert mktlv(0x0001, "eth 1") == struct.pack("!HH8s", 0x0001, 5, b"eth 1")
+    assert mktlv(0x0001, "eth1") == struct.pack("!HH4s", 0x0001, 4, b"eth1")
+
+
+def test_decode_adjacency():
+    b = mkadjac(50, MessageType.ADJACENCY, 250, 1, MessageCode.SYNACK,
+                b"\x01\x02\x03\x04\x05\x06", b"\x0a\x00\x00\x00\x00\x01", 0, 0, 16777217, 7,
+                [Capabilities.TOPO, Capabilities.OAM])
+    msg = decode(memoryview(b)[4:])
+    assert isinstance(msg, AdjacencyMessage)
+    assert (msg.version, msg.message_type, msg.timer, msg.m, msg.code) == (
+        50, MessageType.ADJACENCY, 250, 1, MessageCode.SYNACK)
+    assert msg.sender_name == (1, 2, 3, 4, 5, 6)
+    assert msg.receiver_name == (10, 0, 0, 0, 0, 1)
+    assert (msg.sender_instance, msg.receiver_instance) == (16777217, 7)
+    assert msg.capabilities == [Capabilities.TOPO, Capabilities.OAM]
+
+
+def test_decode_port():
+    tlvs = mktlv(0x0001, "eth 1") + mktlv(0x0081, 1024)
+    b = bytearray(mkport(50, MessageType.PORT_UP, ResultFields.Nack, 0, 0x01000007, 5, 2, tlvs)) + tlvs
+    view = memoryview(b)[4:]
+    msg = decode(view)
+    assert isinstance(msg, PortMessage)
+    assert (msg.message_type, msg.result, msg.result_code) == (MessageType.PORT_UP, ResultFields.Nack, 0)
+    assert (msg.partition_id, msg.transaction_id) == (1, 7)
+    assert (msg.tech_type, msg.num_tlvs, msg.tlv_length) == (5, 2, len(tlvs))
+    (aci, up) = list(msg.tlvs)
+    assert (aci.type, aci.length, aci.text) == (0x0001, 5, "eth 1")
+    assert (up.type, up.int) == (0x0081, 1024)
+    # TLV values reference the received buffer without copy
+    assert aci.value.obj is b
+
+
+def test_decode_general():
+    b = mkgeneral(50, 0x99, ResultFields.AckAll, 0, 3, mktlv(0x0081, 1))
+    msg = decode(memoryview(b)[4:])
+    assert type(msg) is Message
+    assert (msg.message_type, msg.transaction_id, msg.length) == (0x99, 3, 20)
+    assert [(t.type, t.int) for t in msg.tlvs] == [(0x0081, 1)]
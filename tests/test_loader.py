@@ -0,0 +1,82 @@
+"""ANCP Subscriber Loader Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.loader import *
+from ancp.protocol import Protocol, AdjacencyState
+from ancp.subscriber import Subscriber, LineState, DslType
+import types
+import pytest
+
+
+CSV = """aci,up,down,aaci_bin,state,dsl_type,ari
+0.0.0.0 eth 1,1024,16000,,,,
+"0.0.0.0 eth 2, slot 1",2048,32000,128:7,IDLE,VDSL2,remote-id
+0.0.0.0 eth 3,,,5,2,,
+"""
+
+JSONL = """{"aci": "0.0.0.0 eth 1", "up": 1024, "down": 16000}
+
+{"aci": "0.0.0.0 eth 2, slot 1", "up": 2048, "down": 32000, "aaci_bin": [128, 7], "state": "IDLE", \
+"dsl_type": 5, "ari": "remote-id"}
+{"aci": "0.0.0.0 eth 3", "aaci_bin": 5, "state": 2}
+"""
+
+EXPECTED = [
+    Subscriber(aci="0.0.0.0 eth 1", up=1024, down=16000),
+    Subscriber(aci="0.0.0.0 eth 2, slot 1", up=2048, down=32000, aaci_bin=(128, 7),
+               state=LineState.IDLE, dsl_type=DslType.VDSL2, ari="remote-id"),
+    Subscriber(aci="0.0.0.0 eth 3", aaci_bin=5, state=LineState.IDLE),
+]
+
+
+@pytest.mark.parametrize("name,content", [("subs.csv", CSV), ("subs.jsonl", JSONL)])
+def test_load(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content)
+    subscribers = load(str(path))
+    assert isinstance(subscribers, types.GeneratorType)
+    subscribers = list(subscribers)
+    assert [s.tlvs for s in subscribers] == [s.tlvs for s in EXPECTED]
+
+    table = load_table(str(path))
+    assert len(table) == 3
+    assert [s.tlvs for s in table] == [s.tlvs for s in EXPECTED]
+
+
+def test_load_port_up(tmp_path):
+    path = tmp_path / "subs.csv"
+    path.write_text(CSV)
+    protocol = Protocol()
+    protocol.state = AdjacencyState.ESTAB
+    protocol.port_up(load(str(path)))
+    expected = Protocol()
+    expected.state = AdjacencyState.ESTAB
+    expected.port_up(EXPECTED)
+    assert protocol.data_to_send() == expected.data_to_send()
+
+
+def test_load_invalid(tmp_path):
+    path = tmp_path / "subs.csv"
+    path.write_text("aci,aaci_bin\n0.0.0.0 eth 1,1:x\n")
+    with pytest.raises(ValueError, match="subs.csv:2: invalid value for aaci_bin"):
+        list(load(str(path)))
+    path.write_text("aci,speed\n0.0.0.0 eth 1,1\n")
+    with pytest.raises(ValueError, match="unknown attribute speed"):
+        list(load(str(path)))
+    path = tmp_path / "subs.jsonl"
+    path.write_text('{"aci": "0.0.0.0 eth 1", "aaci_bin": "abc"}\n')
+    with pytest.raises(ValueError, match="subs.jsonl:1: invalid value for aaci_bin"):
+        list(load(str(path)))
+    path.write_text('{"aci": "0.0.0.0 eth 1", "up": [1024]}\n')
+    with pytest.raises(ValueError, match="subs.jsonl:1: invalid value for up"):
+        list(load(str(path)))
+    path.write_text('{"aci": "0.0.0.0 eth 2", "down": {}}\n')
+    with pytest.raises(ValueError, match="subs.jsonl:1: invalid value for down"):
+        list(load(str(path)))
+    path.write_text('{"up": 1}\n')
+    with pytest.raises(ValueError, match="missing aci"):
+        list(load(str(path)))
+    path.write_text("")
+    assert list(load(str(path))) == []
@@ -0,0 +1,68 @@
+"""ANCP Load Generator Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.loadgen import *
+from tests.helpers import wait_for
+import time
+import pytest
+
+
+def test_loadgen(server):
+    loadgen = LoadGenerator("127.0.0.1", sessions=4, subscribers=50, processes=2,
+                            port=server.port, line={"up": 1024, "down": 16000})
+    assert loadgen.processes == 2
+    try:
+        assert loadgen.connect(timeout=30)
+        report = loadgen.report()
+        assert report["established"] == 4
+        assert report["subscribers"] == 200
+        assert report["port_up"] == 200
+        assert wait_for(lambda: server.counters()["ports_up"] == 200)
+
+        loadgen.start(rate=400)
+        time.sleep(0.5)
+        loadgen.set_rate(800)
+        assert wait_for(lambda: loadgen.report()["rate"] == 800)
+        time.sleep(0.5)
+        loadgen.stop()
+        report = loadgen.report()
+        assert report["rate"] == 0
+        assert report["events"] > 200
+        assert report["port_up"] + report["port_down"] == 200 + report["events"]
+        assert [w["sessions"] for w in report["workers"]] == [2, 2]
+        assert wait_for(lambda: server.counters()["port_up"] + server.counters()["port_down"] == 200 + report["events"])
+        # ACIs are unique over all sessions
+        assert sum(len(s.ports) for s in server.sessions.values()) == 200
+    finally:
+        loadgen.close()
+
+
+def test_loadgen_no_sessions():
+    with pytest.raises(ValueError):
+        LoadGenerator("127.0.0.1", sessions=0)
+    with pytest.raises(ValueError):
+        LoadGenerator("127.0.0.1", sessions=[])
+
+
+def test_loadgen_worker_failed(server):
+    loadgen = LoadGenerator("127.0.0.1", sessions=4, subscribers=10, processes=2, port=server.port)
+    try:
+        assert loadgen.connect(timeout=30)
+        # worker killed (e.g. by the OOM killer)
+        process = loadgen._workers[1][0]
+        process.kill()
+        process.join()
+        loadgen.start(rate=100)
+        time.sleep(0.2)
+        loadgen.stop()
+        report = loadgen.report()
+        assert report["failed"] == 1
+        assert [w["failed"] for w in report["workers"]] == [False, True]
+        assert report["workers"][0]["rate"] == 0
+        assert report["workers"][0]["events"] > 0
+        processes = [p for p, _ in loadgen._workers]
+    finally:
+        loadgen.close()
+    assert not any(p.is_alive() for p in processes)
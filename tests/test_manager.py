@@ -0,0 +1,136 @@
+"""ANCP Session Manager Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.manager import SessionManager
+from ancp.protocol import *
+from ancp.subscriber import Subscriber
+import socketserver
+import socket
+import threading
+import struct
+import time
+import pytest
+
+
+class NasHandler(socketserver.BaseRequestHandler):
+    """minimal NAS which answers SYN with SYNACK and records messages"""
+    def handle(self):
+        nas = Protocol(sender_name=(10, 0, 0, 0, 0, 1))
+        buf = bytearray()
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                break
+            buf += data
+            while len(buf) >= 4:
+                length = struct.unpack_from("!H", buf, 2)[0]
+                if len(buf) < length + 4:
+                    break
+                b = bytes(buf[4:length + 4])
+                del buf[:length + 4]
+                self.server.messages.append((self.client_address, b))
+                if b[1] == MessageType.ADJACENCY and b[3] & 0x7f == MessageCode.SYN:
+                    self.request.sendall(nas._mkadjac(MessageType.ADJACENCY, nas.timer * 10, 1, MessageCode.SYNACK))
+
+
+@pytest.fixture
+def nas():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), NasHandler)
+    server.daemon_threads = True
+    server.messages = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_manager_sessions(nas):
+    manager = SessionManager("127.0.0.1", port=nas.server_address[1], rate=1000)
+    for i in range(1, 21):
+        manager.add("127.0.0.%d" % i)
+    with pytest.raises(ValueError):
+        manager.add("127.0.0.1")
+    assert len(manager) == 20
+    assert manager["127.0.0.5"].sender_name == (127, 0, 0, 5, 0, 0)
+
+    assert manager.connect(timeout=5) is True
+    report = manager.report()
+    assert len(report) == 20
+    assert all(t is not None and t >= 0 for t in report.values())
+
+    manager.port_up("127.0.0.7", [Subscriber(aci="0.0.0.0 eth 1"), Subscriber(aci="0.0.0.0 eth 2")])
+    manager.port_down("127.0.0.7", Subscriber(aci="0.0.0.0 eth 1"))
+    manager.disconnect()
+    assert not manager["127.0.0.7"].is_established()
+
+    ports = [(addr, b[1]) for addr, b in nas.messages if b[1] in (MessageType.PORT_UP, MessageType.PORT_DOWN)]
+    assert [p for a, p in ports] == [MessageType.PORT_UP, MessageType.PORT_UP, MessageType.PORT_DOWN]
+    assert all(a[0] == "127.0.0.7" for a, p in ports)
+
+
+def test_manager_rate(nas):
+    manager = SessionManager("127.0.0.1", port=nas.server_address[1], rate=20)
+    for i in range(1, 6):
+        manager.add("127.0.0.%d" % i)
+    assert manager.connect(timeout=5) is True
+    starts = sorted(s.connect_time for s in manager.sessions.values())
+    assert starts[-1] - starts[0] >= 4 * (1.0 / 20) * 0.9
+    manager.disconnect()
+
+
+def test_manager_connect_failed(nas):
+    manager = SessionManager("127.0.0.1", port=nas.server_address[1], rate=1000)
+    manager.add("127.0.0.1")
+    manager.add("127.0.0.2")
+    # nothing is listening on the port of the second session
+    closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    closed.bind(("127.0.0.1", 0))
+    manager.sessions["127.0.0.2"].port = closed.getsockname()[1]
+    closed.close()
+    start = time.time()
+    assert manager.connect() is False
+    assert time.time() - start < 5
+    assert manager["127.0.0.1"].is_established()
+    assert not manager["127.0.0.2"].is_established()
+    manager.disconnect()
+
+
+def test_manager_bind_failed(nas):
+    manager = SessionManager("127.0.0.1", port=nas.server_address[1], rate=1000)
+    manager.add("127.0.0.1")
+    # address not available on this host
+    manager.add("192.0.2.1")
+    assert manager.connect() is False
+    assert manager["127.0.0.1"].is_established()
+    assert manager["192.0.2.1"].socket is None
+    # selector thread is still running
+    assert manager._thread.is_alive()
+    manager.disconnect()
+
+
+def test_manager_port_up_bounded(nas):
+    manager = SessionManager("127.0.0.1", port=nas.server_address[1], rate=1000, high_water=65536)
+    session = manager.add("127.0.0.1")
+    assert manager.connect(timeout=5) is True
+    buffered = []
+    flush = manager._flush
+
+    def record(s):
+        buffered.append(len(s._tx_buffer))
+        flush(s)
+    manager._flush = record
+    subscribers = (Subscriber(aci="0.0.0.0 eth %d" % i, up=1024, down=16000) for i in range(20000))
+    manager.port_up("127.0.0.1", subscribers)
+    manager._flush = flush
+    # encoded in chunks without exceeding the high water mark by more than one chunk
+    assert len(buffered) > 1
+    assert max(buffered) <= manager.high_water + session.chunk_size + 1024
+    deadline = time.time() + 5
+    while sum(1 for a, b in nas.messages if b[1] == MessageType.PORT_UP) < 20000 and time.time() < deadline:
+        time.sleep(0.01)
+    assert sum(1 for a, b in nas.messages if b[1] == MessageType.PORT_UP) == 20000
+    manager.disconnect()
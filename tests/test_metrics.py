@@ -0,0 +1,93 @@
+"""ANCP Metrics Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.metrics import *
+from ancp.protocol import Protocol, MessageType, MessageCode
+from ancp.subscriber import Subscriber
+from contextlib import closing
+import threading
+import urllib.request
+
+
+def nas_adjac(code):
+    nas = Protocol(sender_name=(10, 0, 0, 0, 0, 1))
+    return bytes(nas._mkadjac(MessageType.ADJACENCY, nas.timer * 10, 1, code))
+
+
+def established():
+    p = Protocol()
+    p.metrics = Metrics()
+    p.initiate()
+    p.receive_data(nas_adjac(MessageCode.SYNACK))
+    return p
+
+
+def test_histogram():
+    h = Histogram(buckets=(0.001, 0.01))
+    for v in (0.0005, 0.001, 0.005, 1.0):
+        h.observe(v)
+    snapshot = h.snapshot()
+    assert list(snapshot["buckets"].values()) == [2, 3, 4]
+    assert snapshot["count"] == 4
+    assert abs(snapshot["sum"] - 1.0065) < 1e-9
+
+
+def test_metrics_snapshot():
+    p = established()
+    p.port_up([Subscriber(aci="0.0.0.0 eth %d" % i) for i in range(3)])
+    p.handle_timer(p.next_deadline())
+    snapshot = p.metrics.snapshot()
+    # SYN, ACK and keep-alive SYN
+    assert snapshot["tx_frames"] == {"adjacency": 3, "port_up": 3}
+    assert snapshot["tx_bytes"]["adjacency"] == 3 * 44
+    assert sum(snapshot["tx_bytes"].values()) == len(p.data_to_send())
+    assert snapshot["rx_frames"] == {"adjacency": 1}
+    assert snapshot["rx_bytes"] == {"adjacency": 44}
+    # keep-alive SYN restarts adjacency synchronization
+    assert snapshot["transitions"] == {"idle_synsent": 1, "synsent_estab": 1, "estab_synsent": 1}
+    assert snapshot["keepalives"] == 1
+    assert snapshot["encode_time"]["count"] == 1
+
+
+def test_metrics_prometheus():
+    p = established()
+    text = p.metrics.prometheus(labels={"session": "an1"})
+    assert "# TYPE ancp_tx_frames_total counter\n" in text
+    assert 'ancp_tx_frames_total{session="an1",type="adjacency"} 2\n' in text
+    assert 'ancp_state_transitions_total{session="an1",old="synsent",new="estab"} 1\n' in text
+    assert 'ancp_send_seconds_bucket{session="an1",le="+Inf"} 0\n' in text
+
+
+def test_metrics_http_server():
+    p = established()
+    server = start_http_server({"an1": p.metrics}, port=0)
+    try:
+        url = "http://127.0.0.1:%d/metrics" % server.server_address[1]
+        with closing(urllib.request.urlopen(url, timeout=5)) as response:
+            text = response.read().decode("utf-8")
+        assert 'ancp_keepalives_total{session="an1"} 0\n' in text
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_metrics_threads():
+    metrics = Metrics()
+
+    def update():
+        for _ in range(20000):
+            metrics.sent(MessageType.PORT_UP, 1, 100)
+            metrics.keepalive()
+            metrics.send_latency.observe(0.001)
+    threads = [threading.Thread(target=update) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    snapshot = metrics.snapshot()
+    assert snapshot["tx_frames"]["port_up"] == 80000
+    assert snapshot["tx_bytes"]["port_up"] == 8000000
+    assert snapshot["keepalives"] == 80000
+    assert snapshot["send_latency"]["count"] == 80000
@@ -0,0 +1,158 @@
+"""ANCP OAM Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.oam import *
+from ancp.aio import AsyncClient
+from ancp.client import Client
+from ancp.protocol import Protocol, AdjacencyState, Capabilities, ResultFields, ResultCodes
+from ancp.subscriber import TlvType
+from tests.helpers import wait_for
+from threading import Event
+import asyncio
+import time
+
+
+def connect(server, oam=None, timer=25.0):
+    client = Client(address="127.0.0.1", port=server.port, timer=timer)
+    if oam is not None:
+        client.enable_oam(oam)
+    assert client.connect()
+    assert wait_for(lambda: len(server.established()) == 1)
+    return client, server.established()[0]
+
+
+def connectivity_test(request):
+    aci = [tlv.text for tlv in request.tlvs if tlv.type == TlvType.ACI][0]
+    return [(OamTlvType.LOOPBACK_TEST_RESPONSE, "OK " + aci)]
+
+
+def test_oam(server):
+    oam = OamDispatcher(workers=16)
+    oam.register(Function.CONFIGURE_CONNECTIVITY_TEST, connectivity_test)
+    client, session = connect(server, oam)
+    assert client.negotiated == [Capabilities.TOPO, Capabilities.OAM]
+    acis = ["0.0.0.0 eth %d" % i for i in range(5000)]
+    tids = server.port_management(session, acis)
+    assert len(set(tids)) == 5000
+    assert wait_for(lambda: len(session.responses) == 5000, timeout=30)
+    for tid, aci in zip(tids, acis):
+        response = session.responses[tid]
+        assert response.result == ResultFields.Success
+        assert response.function == Function.CONFIGURE_CONNECTIVITY_TEST
+        tlvs = list(response.tlvs)
+        assert tlvs[0].type == TlvType.ACI and tlvs[0].text == aci
+        assert tlvs[1].type == OamTlvType.LOOPBACK_TEST_RESPONSE
+        assert tlvs[1].text == "OK " + aci
+    assert oam.requests == oam.responses == 5000
+    assert oam.rejected == 0
+    client.disconnect()
+    oam.close()
+
+
+def test_oam_not_negotiated(server):
+    client, session = connect(server)
+    assert client.negotiated == [Capabilities.TOPO]
+    server.port_management(session, ["0.0.0.0 eth 1"])
+    time.sleep(0.2)
+    assert not session.responses
+    client.disconnect()
+
+
+def test_oam_failure(server):
+    def timeout(request):
+        raise PortManagementError(ResultCodes.LoopbackTestTimeout)
+
+    oam = OamDispatcher(workers=2)
+    oam.register(Function.CONFIGURE_CONNECTIVITY_TEST, timeout)
+    client, session = connect(server, oam)
+    # failures are answered for Nack and AckAll
+    tids = server.port_management(session, ["0.0.0.0 eth 1"], result=ResultFields.Nack)
+    tids += server.port_management(session, ["0.0.0.0 eth 2"])
+    # not registered function
+    tids += server.port_management(session, ["0.0.0.0 eth 3"], function=9)
+    assert wait_for(lambda: len(session.responses) == 3)
+    assert [session.responses[t].result for t in tids] == [ResultFields.Failure] * 3
+    assert [session.responses[t].result_code for t in tids] == [
+        ResultCodes.LoopbackTestTimeout, ResultCodes.LoopbackTestTimeout, ResultCodes.RequestNotImplemented]
+
+    # success is not answered for Nack
+    oam.register(Function.CONFIGURE_CONNECTIVITY_TEST, connectivity_test)
+    server.port_management(session, ["0.0.0.0 eth 4"], result=ResultFields.Nack)
+    time.sleep(0.2)
+    assert len(session.responses) == 3
+    client.disconnect()
+    oam.close()
+
+
+def test_oam_handler_exception(server):
+    def crash(request):
+        raise KeyError("crash")
+
+    oam = OamDispatcher(workers=1)
+    oam.register(Function.CONFIGURE_CONNECTIVITY_TEST, crash)
+    client, session = connect(server, oam)
+    tid = server.port_management(session, ["0.0.0.0 eth 1"])[0]
+    assert wait_for(lambda: tid in session.responses)
+    assert session.responses[tid].result == ResultFields.Failure
+    # RFC 6320 result code 0x006 (invalid request message)
+    assert session.responses[tid].result_code == ResultCodes.InvalidRequest == 0x006
+    client.disconnect()
+    oam.close()
+
+
+def test_oam_slow_handler(server):
+    release = Event()
+
+    def slow(request):
+        release.wait(5)
+        return None
+
+    oam = OamDispatcher(workers=2, queue_size=2)
+    oam.register(Function.CONFIGURE_CONNECTIVITY_TEST, slow)
+    client, session = connect(server, oam, timer=0.2)
+    tids = server.port_management(session, ["0.0.0.0 eth %d" % i for i in range(10)])
+    # requests exceeding workers and queue are rejected immediately
+    assert wait_for(lambda: len(session.responses) >= 6)
+    time.sleep(0.1)
+    rejected = oam.rejected
+    assert 6 <= rejected <= 8
+    assert len(session.responses) == rejected
+    assert all(r.result_code == ResultCodes.OutOfResources for r in session.responses.values())
+    # keep-alives are not blocked by handlers
+    time.sleep(0.6)
+    assert client.state == AdjacencyState.ESTAB
+    assert session.state == AdjacencyState.ESTAB
+    release.set()
+    assert wait_for(lambda: len(session.responses) == 10)
+    assert sum(session.responses[t].result == ResultFields.Success for t in tids) == 10 - rejected
+    client.disconnect()
+    oam.close()
+
+
+def test_oam_async(server):
+    oam = OamDispatcher(workers=4)
+    oam.register(Function.CONFIGURE_CONNECTIVITY_TEST, connectivity_test)
+    # protocol sessions without thread-safe send path do not support OAM
+    assert not hasattr(Protocol, "enable_oam")
+
+    async def run():
+        client = AsyncClient(address="127.0.0.1", port=server.port)
+        client.enable_oam(oam)
+        assert await client.connect()
+        assert wait_for(lambda: len(server.established()) == 1)
+        session = server.established()[0]
+        acis = ["0.0.0.0 eth %d" % i for i in range(100)]
+        tids = await asyncio.get_running_loop().run_in_executor(None, server.port_management, session, acis)
+        # responses of worker threads are sent from the event loop
+        for _ in range(500):
+            if len(session.responses) == 100:
+                break
+            await asyncio.sleep(0.01)
+        assert [session.responses[tid].result for tid in tids] == [ResultFields.Success] * 100
+        await client.disconnect()
+
+    asyncio.run(run())
+    assert oam.responses == 100
+    oam.close()
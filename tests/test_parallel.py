@@ -0,0 +1,63 @@
+"""ANCP Parallel Encoder Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.parallel import *
+from ancp.subscriber import Subscriber
+from tests.helpers import TxProtocol
+import pytest
+
+
+def subscribers(count=1000):
+    return [Subscriber(aci="0.0.0.0 eth %d" % i, up=1024, down=16000, aaci_bin=i) for i in range(count)]
+
+
+@pytest.fixture(scope="module", params=["threads", "processes"])
+def encoder(request):
+    encoder = ParallelEncoder(workers=2, batch=64, threads=request.param == "threads")
+    yield encoder
+    encoder.close()
+
+
+def test_parallel(encoder):
+    subs = subscribers()
+    expected = TxProtocol()
+    expected.port_up(subs)
+    expected.port_down(subs[:10])
+    protocol = TxProtocol()
+    protocol.encoder = encoder
+    # generators are consumed in batches
+    protocol.port_up(s for s in subs)
+    protocol.port_down(subs[:10])
+    assert protocol.transaction_id == expected.transaction_id == 1011
+    assert protocol.data_to_send() == expected.data_to_send()
+
+
+def test_parallel_ack_all(encoder):
+    subs = subscribers(300)
+    expected = TxProtocol()
+    expected.ack_all(window=100)
+    protocol = TxProtocol()
+    protocol.encoder = encoder
+    protocol.ack_all(window=100)
+    chunks = list(protocol._port_updown(0x50, subs))
+    assert b"".join(bytes(c[0]) for c in chunks) == b"".join(
+        b"".join(bytes(b) for b in c) for c in expected._port_updown(0x50, subs))
+    # transaction identifiers are assigned in send order
+    assert list(protocol.transactions) == list(range(1, 301))
+    assert protocol.transactions[300].aci == "0.0.0.0 eth 299"
+    assert all(t.result is None for t in protocol.transactions.values())
+
+
+def test_parallel_invalid(encoder):
+    protocol = TxProtocol()
+    protocol.encoder = encoder
+    with pytest.raises(ValueError):
+        protocol.port_up(iter([1, 2]))
+    buf, offsets, acis = encode(subscribers(2) + [None], 0x50, 5, 50, 0)
+    assert offsets[0] == 0
+    assert acis == ["0.0.0.0 eth 0", "0.0.0.0 eth 1"]
+    patch(buf, offsets, 7)
+    assert buf[8:12] == b"\x00\x00\x00\x07"
+    assert buf[offsets[1] + 8:offsets[1] + 12] == b"\x00\x00\x00\x08"
@@ -0,0 +1,111 @@
+"""ANCP Packet Capture Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.pcap import *
+from ancp.client import Client
+from ancp.protocol import MessageType, ResultFields
+from ancp.template import FrameTemplate
+from tests.helpers import TxProtocol, wait_for, subscribers
+import time
+import pytest
+
+
+def test_pcap_writer(tmpdir):
+    path = str(tmpdir.join("test.pcap"))
+    writer = PcapWriter(path)
+    src = ("10.0.0.1", 40000)
+    dst = ("10.0.0.2", 6068)
+    assert writer.write(b"\x01\x02", src, dst, timestamp=100.5)
+    assert writer.write(b"\x03", dst, src, timestamp=101.0)
+    assert writer.write(b"x" * 70000, src, dst, timestamp=102.0)
+    writer.close()
+    assert writer.written == 3
+    packets = list(read(path))
+    assert len(packets) == 4
+    assert packets[0][0] == 100.5
+    assert packets[0][1] == LINKTYPE_RAW
+    assert tcp_payload(*packets[0][1:]) == (src, dst, b"\x01\x02")
+    assert tcp_payload(*packets[1][1:]) == (dst, src, b"\x03")
+    assert sum(len(tcp_payload(*p[1:])[2]) for p in packets[2:]) == 70000
+    # TCP sequence numbers continue per direction
+    assert struct.unpack_from("!I", packets[2][2], 24)[0] == 3
+
+
+@pytest.mark.parametrize("name", ["test.pcap", "test.pcapng"])
+def test_capture_replay(server, tmpdir, name):
+    path = str(tmpdir.join(name))
+    client = Client(address="127.0.0.1", port=server.port)
+    writer = client.start_capture(path)
+    assert writer.pcapng == name.endswith(".pcapng")
+    assert client.connect()
+    subs = subscribers(100)
+    client.port_up(subs)
+    client.port_down(FrameTemplate(subs[:10]))
+    assert wait_for(lambda: server.counters()["port_down"] == 10)
+    client.disconnect()
+    client.stop_capture()
+    assert writer.dropped == 0
+
+    # adjacency messages in both directions
+    packets = [tcp_payload(*p[1:]) for p in read(path)]
+    assert any(dst[1] == server.port for src, dst, payload in packets)
+    assert any(src[1] == server.port for src, dst, payload in packets)
+    events = list(port_events(path, server.port))
+    messages = [m for _, batch in events for m in batch]
+    assert len(messages) == 110
+    assert sum(m[5] == MessageType.PORT_DOWN for m in messages) == 10
+
+    # replay as fast as possible
+    client = Client(address="127.0.0.1", port=server.port)
+    assert client.connect()
+    result = replay(path, client, speed=None)
+    assert result["messages"] == 110
+    assert wait_for(lambda: server.counters()["port_down"] == 20)
+    assert server.counters()["port_up"] == 200
+    session = server.established()[0]
+    assert session.ports_up == 90
+
+    # replay at original timing
+    start = time.time()
+    result = replay(path, client, speed=1.0)
+    assert result["messages"] == 110
+    assert time.time() - start >= events[-1][0] - events[0][0] - 0.01
+    assert wait_for(lambda: server.counters()["port_down"] == 30)
+
+    # replayed messages are tracked with AckAll
+    completed = []
+    client.ack_all(window=20, callback=completed.append)
+    result = replay(path, client, speed=None)
+    assert client.wait_transactions(5)
+    assert len(completed) == 110
+    assert all(t.result == ResultFields.Success for t in completed)
+    assert completed[0].aci == "0.0.0.0 eth 0"
+    client.disconnect()
+    with pytest.raises(RuntimeError):
+        replay(path, client, speed=None)
+
+
+def test_read_invalid(tmpdir):
+    path = tmpdir.join("test.txt")
+    path.write("no capture")
+    with pytest.raises(ValueError):
+        list(read(str(path)))
+
+
+def test_replay_partition_id(tmpdir):
+    path = str(tmpdir.join("test.pcap"))
+    writer = PcapWriter(path)
+    num_tlvs, tlvs = subscribers(1)[0].tlvs
+    msg = bytearray(codec.mkport(3, MessageType.PORT_UP, 0, 0, 0x12345678, 5, num_tlvs, tlvs) + tlvs)
+    writer.write(bytes(msg), ("10.0.0.1", 1000), ("10.0.0.2", 6068))
+    writer.close()
+    protocol = TxProtocol()
+    protocol.transaction_id = 7
+    protocol.port = 6068
+    replay(path, protocol, speed=None)
+    sent = protocol.data_to_send()
+    assert sent[8] == 0x12
+    assert struct.unpack_from("!I", sent, 8)[0] & 0xffffff == 7
+    assert sent[12:] == bytes(msg)[12:]
@@ -0,0 +1,215 @@
+"""ANCP Protocol Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.protocol import *
+from ancp.subscriber import Subscriber
+from ancp.table import SubscriberTable
+from ancp import codec
+import struct
+import pytest
+
+
+def nas_adjac(code):
+    # NAS side messages are created with M flag set
+    nas = Protocol(sender_name=(10, 0, 0, 0, 0, 1))
+    return bytes(nas._mkadjac(MessageType.ADJACENCY, nas.timer * 10, 1, code))
+
+
+def test_protocol_establish():
+    p = Protocol()
+    assert p.next_deadline() is None
+    p.initiate()
+    b = p.data_to_send()
+    assert struct.unpack_from("!HHBBBB", b) == (0x880C, 40, VERSION_RFC, MessageType.ADJACENCY, 250, MessageCode.SYN)
+    assert p.data_to_send() == b''
+    assert p.state == AdjacencyState.SYNSENT
+
+    # SYN is retransmitted after timeout
+    deadline = p.next_deadline()
+    p.handle_timer(deadline - 0.1)
+    assert p.data_to_send() == b''
+    p.handle_timer(deadline)
+    assert struct.unpack_from("!B", p.data_to_send(), 7)[0] == MessageCode.SYN
+
+    messages = p.receive_data(nas_adjac(MessageCode.SYNACK))
+    assert len(messages) == 1
+    assert messages[0].message_type == MessageType.ADJACENCY
+    assert messages[0].code == MessageCode.SYNACK
+    assert p.is_established()
+    assert p.receiver_name == (10, 0, 0, 0, 0, 1)
+    assert struct.unpack_from("!B", p.data_to_send(), 7)[0] == MessageCode.ACK
+    assert p.next_deadline() == pytest.approx(deadline - p.timeout + p.timer, abs=1)
+
+
+def test_protocol_partial_messages():
+    p = Protocol()
+    p.initiate()
+    b = nas_adjac(MessageCode.SYNACK) + nas_adjac(MessageCode.ACK)
+    assert p.receive_data(b[:3]) == []
+    assert p.receive_data(b[3:50]) != []
+    assert p.is_established()
+    assert len(p.receive_data(b[50:])) == 1
+
+
+def test_protocol_port_up():
+    p = Protocol()
+    with pytest.raises(RuntimeError):
+        p.port_up(Subscriber(aci="0.0.0.0 eth 1"))
+    p.initiate()
+    p.receive_data(nas_adjac(MessageCode.SYNACK))
+    p.data_to_send()
+    p.port_up([Subscriber(aci="0.0.0.0 eth 1"), Subscriber(aci="0.0.0.0 eth 2")])
+    b = p.data_to_send()
+    length, code = struct.unpack_from("!HxB", b, 2)
+    assert code == MessageType.PORT_UP
+    assert len(b) == 2 * (length + 4)
+    assert p.transaction_id == 3
+
+
+def nas_response(message_type, transaction_id, result=ResultFields.Success):
+    return bytes(codec.mkport(VERSION_RFC, message_type, result, 0, transaction_id, 5, 0, b""))
+
+
+def test_protocol_ack_all():
+    completed = []
+    p = Protocol()
+    p.initiate()
+    p.receive_data(nas_adjac(MessageCode.SYNACK))
+    p.data_to_send()
+    p.ack_all(window=2, callback=completed.append, timeout=5.0)
+    p.port_up([Subscriber(aci="0.0.0.0 eth %d" % i) for i in range(3)])
+    b = p.data_to_send()
+    result, tid = struct.unpack_from("!HI", b, 6)
+    assert (result >> 12, tid) == (ResultFields.AckAll, 1)
+    assert p.in_flight == 3
+    assert p.next_deadline() == p.transactions[1].sent + 5.0
+
+    # response is correlated by transaction identifier
+    p.receive_data(nas_response(MessageType.PORT_UP, 2))
+    assert p.in_flight == 2
+    assert completed[0].transaction_id == 2
+    assert completed[0].aci == "0.0.0.0 eth 1"
+    assert completed[0].result == ResultFields.Success
+    assert completed[0].latency >= 0
+
+    # unanswered transactions are expired
+    p.handle_timer(p.transactions[3].sent + 5.0)
+    assert p.in_flight == 0
+    assert [t.transaction_id for t in completed] == [2, 1, 3]
+    assert completed[1].result is None
+
+
+def test_protocol_ack_all_table():
+    p = Protocol()
+    p.initiate()
+    p.receive_data(nas_adjac(MessageCode.SYNACK))
+    p.data_to_send()
+    p.ack_all(window=2)
+    table = SubscriberTable(use_numpy=False)
+    table.extend([Subscriber(aci="0.0.0.0 eth %d" % i) for i in range(5)])
+    # table is encoded in chunks of the open window (min. one message)
+    chunks = list(p._port_updown(MessageType.PORT_DOWN, table))
+    assert len(chunks) == 4
+    assert list(p.transactions) == [1, 2, 3, 4, 5]
+    assert p.transactions[5].aci == "0.0.0.0 eth 4"
+
+
+def test_protocol_incorrect_ident():
+    p = Protocol()
+    with pytest.raises(ValueError):
+        p.receive_data(b"\x88\x0d\x00\x00")
+
+
+def test_protocol_closed():
+    p = Protocol()
+    p.initiate()
+    p.receive_data(b'')
+    assert p.closed
+
+
+class ChunkProtocol(Protocol):
+    def __init__(self):
+        super(ChunkProtocol, self).__init__()
+        self.state = AdjacencyState.ESTAB
+        self.chunks = []
+
+    def _sendmsg(self, buffers):
+        assert len(buffers) <= IOV_MAX
+        self.chunks.append(b"".join(buffers))
+
+
+def test_protocol_port_up_generator():
+    p = ChunkProtocol()
+    p.chunk_size = 4096
+    p.port_up(Subscriber(aci="0.0.0.0 eth %d" % i, up=1024, down=16000) for i in range(1000))
+    assert len(p.chunks) > 1
+    frame = len(Subscriber(aci="0.0.0.0 eth 1000", up=1024, down=16000).tlvs[1]) + 44
+    assert all(len(c) < p.chunk_size + frame for c in p.chunks)
+    b = b"".join(p.chunks)
+    off = 0
+    for i in range(1000):
+        length, code, tid = struct.unpack_from("!HxBxxI", b, off + 2)
+        assert (code, tid) == (MessageType.PORT_UP, i + 1)
+        off += length + 4
+    assert off == len(b)
+
+    with pytest.raises(ValueError):
+        p.port_down(s for s in [])
+    with pytest.raises(ValueError):
+        p.port_down(iter(["no subscriber"]))
+
+
+class ChunkSocket(object):
+    """socket mock returning data in chunks"""
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def recv_into(self, view):
+        if not self.chunks:
+            return 0
+        b = self.chunks.pop(0)
+        if len(b) > len(view):
+            self.chunks.insert(0, b[len(view):])
+            b = b[:len(view)]
+        view[:len(b)] = b
+        return len(b)
+
+
+def test_receive_buffer():
+    b = nas_adjac(MessageCode.SYNACK) * 3
+    # second message is split over two reads
+    sock = ChunkSocket([b[:60], b[60:]])
+    rx = ReceiveBuffer(size=64)
+    assert rx.recv_into(sock) == 60
+    messages = [bytes(m) for m in rx.messages()]
+    assert messages == [b[4:44]]
+    assert len(rx) == 16
+    # partial message is moved to start of buffer
+    assert rx.recv_into(sock) == 48
+    messages = [bytes(m) for m in rx.messages()]
+    assert messages == [b[48:88]]
+    assert rx.recv_into(sock) == 24
+    messages = [bytes(m) for m in rx.messages()]
+    assert messages == [b[92:132]]
+    assert len(rx) == 0
+    assert rx.recv_into(sock) == 0
+
+
+def test_receive_buffer_large_message():
+    b = nas_adjac(MessageCode.SYNACK)
+    sock = ChunkSocket([b])
+    # buffer is replaced by a larger buffer if message does not fit
+    rx = ReceiveBuffer(size=16)
+    assert rx.recv_into(sock) == 16
+    assert list(rx.messages()) == []
+    assert rx.recv_into(sock) == 28
+    assert [bytes(m) for m in rx.messages()] == [b[4:]]
+
+
+def test_receive_buffer_incorrect_ident():
+    rx = ReceiveBuffer()
+    rx.recv_into(ChunkSocket([b"\x88\x0d\x00\x00"]))
+    with pytest.raises(ValueError):
+        list(rx.messages())
@@ -0,0 +1,82 @@
+"""ANCP Traffic Profile Scheduler Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.scheduler import *
+from ancp.subscriber import LineState
+from tests.helpers import subscribers
+import pytest
+
+
+class RecordingClient(object):
+    def __init__(self):
+        self.up = []
+        self.down = []
+
+    def port_up(self, subscribers):
+        self.up.extend(subscribers)
+
+    def port_down(self, subscribers):
+        self.down.extend(subscribers)
+
+
+def test_profiles():
+    assert ConstantRate(1000).expected(2.0) == 2000
+    ramp = LinearRamp(0, 1000, 10)
+    assert ramp.expected(10) == pytest.approx(5000)
+    assert ramp.expected(20) == pytest.approx(5000)
+    assert ramp.tokens(0, 1) == pytest.approx(50)
+    poisson = PoissonChurn(10000, seed=1)
+    assert poisson.tokens(0, 1.0) == pytest.approx(10000, rel=0.05)
+    assert Flapping(100, period=2.0).rate == 50
+
+
+def test_scheduler_constant_rate():
+    client = RecordingClient()
+    scheduler = Scheduler(client, subscribers(1000), ConstantRate(50000), interval=0.001)
+    report = scheduler.run(duration=0.5)
+    assert report["target_rate"] == pytest.approx(50000)
+    assert report["achieved_rate"] == pytest.approx(50000, rel=0.05)
+    assert len(client.up) + len(client.down) == report["events"]
+    # all subscribers are up at start, first event is port-down
+    assert client.down[0].aci == "0.0.0.0 eth 0"
+
+
+def test_scheduler_flapping():
+    client = RecordingClient()
+    subs = subscribers(10)
+    scheduler = Scheduler(client, subs[:4], Flapping(4, period=0.1, duration=0.25))
+    scheduler.start()
+    scheduler.join(timeout=5)
+    report = scheduler.report()
+    assert report["events"] == pytest.approx(10, abs=2)
+    assert set(s.aci for s in client.down) <= set(s.aci for s in subs[:4])
+    assert all(s.state == LineState.SHOWTIME for s in subs[4:])
+    assert sum(s.state == LineState.IDLE for s in subs[:4]) == len(client.down) - len(client.up)
+
+
+def test_scheduler_more_events_than_subscribers():
+    events = []
+
+    class OrderedClient(object):
+        def port_up(self, subscribers):
+            events.extend((True, s.aci, s.state) for s in subscribers)
+
+        def port_down(self, subscribers):
+            events.extend((False, s.aci, s.state) for s in subscribers)
+
+    subs = subscribers(3)
+    scheduler = Scheduler(OrderedClient(), subs, Flapping(1000, period=0.1))
+    scheduler._send(7)
+    assert len(events) == 7
+    # last event of each subscriber matches its final state
+    last = dict((aci, (up, state)) for up, aci, state in events)
+    for i, s in enumerate(subs):
+        assert last[s.aci] == (scheduler._up[i], s.state)
+    assert [up for up, aci, _ in events if aci == "0.0.0.0 eth 0"] == [False, True, False]
+
+
+def test_profile_abstract():
+    with pytest.raises(TypeError):
+        Profile()
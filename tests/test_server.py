@@ -0,0 +1,228 @@
+"""ANCP Server Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.server import *
+from ancp.aio import AsyncClient
+from ancp.client import Client
+from ancp.subscriber import Subscriber
+from ancp.table import SubscriberTable
+from ancp.template import FrameTemplate
+from tests.helpers import wait_for, subscribers
+import asyncio
+import socket
+import time
+
+
+def test_server_session(server):
+    client = Client(address="127.0.0.1", port=server.port)
+    assert client.connect()
+    assert wait_for(lambda: len(server.established()) == 1)
+    session = server.established()[0]
+    assert session.receiver_name == client.sender_name
+
+    subs = subscribers(100)
+    client.port_up(subs)
+    client.port_down(subs[:10])
+    assert wait_for(lambda: server.counters()["port_down"] == 10)
+    counters = server.counters()
+    assert counters["port_up"] == 100
+    assert counters["ports_up"] == 90
+    assert session.ports["0.0.0.0 eth 0"] is False
+    assert session.ports["0.0.0.0 eth 99"] is True
+    assert session.tech_types == {5}
+
+    # keep-alive is answered without leaving ESTAB
+    client._send_syn()
+    time.sleep(0.1)
+    assert client.state == AdjacencyState.ESTAB
+    assert session.state == AdjacencyState.ESTAB
+
+    client.disconnect()
+    assert wait_for(lambda: session.state == AdjacencyState.IDLE)
+    # closed sessions are removed, their counters are kept
+    assert wait_for(lambda: server.counters()["sessions"] == 0)
+    counters = server.counters()
+    assert counters["accepted"] == 1
+    assert counters["port_up"] == 100
+    assert counters["port_down"] == 10
+    assert counters["ports_up"] == 0
+    assert counters["errors"] == 0
+
+
+def test_server_ack_all(server):
+    completed = []
+    client = Client(address="127.0.0.1", port=server.port)
+    assert client.connect()
+    client.ack_all(window=16, callback=completed.append)
+    table = SubscriberTable()
+    table.extend(subscribers(200))
+    client.port_up(table)
+    assert client.wait_transactions(timeout=5)
+    assert len(completed) == 200
+    assert all(t.result == ResultFields.Success for t in completed)
+    client.disconnect()
+
+
+def test_server_ack_all_tlvs():
+    an = Protocol()
+    an.state = AdjacencyState.ESTAB
+    an.ack_all()
+    an.port_up(subscribers(2))
+    nas = NasSession(("127.0.0.1", 1))
+    nas.receive_data(an.data_to_send())
+    responses = an.receive_data(nas.data_to_send())
+    assert [r.result for r in responses] == [ResultFields.Success] * 2
+    assert [(next(r.tlvs).type, next(r.tlvs).text) for r in responses] == [
+        (TlvType.ACI, "0.0.0.0 eth 0"), (TlvType.ACI, "0.0.0.0 eth 1")]
+    assert [r.num_tlvs for r in responses] == [2, 2]
+    assert not an.transactions
+
+
+def test_server_many_sessions(server):
+    async def run():
+        clients = [AsyncClient(address="127.0.0.1", port=server.port) for _ in range(50)]
+        assert all(await asyncio.gather(*[c.connect() for c in clients]))
+        for client in clients:
+            await client.port_up(subscribers(10))
+        await asyncio.sleep(0.1)
+        await asyncio.gather(*[c.disconnect() for c in clients])
+
+    asyncio.run(run())
+    assert wait_for(lambda: server.counters()["port_up"] == 500)
+    assert server.counters()["accepted"] == 50
+    assert wait_for(lambda: server.counters()["sessions"] == 0)
+
+
+def test_server_reconnect(server):
+    client = Client(address="127.0.0.1", port=server.port)
+    client.auto_reconnect(backoff=0.05)
+    assert client.connect()
+    subs = subscribers(100)
+    client.port_up(subs)
+    client.port_down(subs[:10])
+    table = SubscriberTable()
+    table.extend(Subscriber(aci="0.0.0.0 eth %d" % i) for i in range(100, 150))
+    client.port_up(table[10:])
+    # changes after sending are not replayed
+    table.update(20, aci="0.0.0.0 eth changed", up=2048)
+    subs[50].aci = "0.0.0.0 eth changed"
+    assert len(client.store) == 130
+    assert wait_for(lambda: server.counters()["port_down"] == 10)
+
+    # connection lost (e.g. NAS failover)
+    client.socket.shutdown(socket.SHUT_RDWR)
+    assert client.resynced.wait(5)
+    assert client.reconnects == 1
+    assert client.resync_time is not None
+    assert wait_for(lambda: server.counters()["accepted"] == 2)
+    assert wait_for(lambda: server.counters()["sessions"] == 1)
+    session = list(server.sessions.values())[0]
+    assert wait_for(lambda: session.ports_up == 130)
+    assert "0.0.0.0 eth 0" not in session.ports
+    assert "0.0.0.0 eth 149" in session.ports
+    assert "0.0.0.0 eth 120" in session.ports and "0.0.0.0 eth 50" in session.ports
+    assert "0.0.0.0 eth changed" not in session.ports
+
+    client.disconnect()
+    time.sleep(0.1)
+    assert client.reconnects == 1
+
+
+def test_server_reconnect_streaming(server):
+    client = Client(address="127.0.0.1", port=server.port)
+    client.auto_reconnect(backoff=0.05)
+    assert client.connect()
+    recorded = []
+
+    def generate(count):
+        for s in subscribers(count):
+            # subscribers are recorded while encoded and not collected first
+            recorded.append(len(client.store))
+            yield s
+
+    client.port_up(generate(100))
+    assert recorded == list(range(100))
+    template = FrameTemplate([Subscriber(aci="0.0.0.0 eth %d" % i) for i in range(100, 120)])
+    client.port_up(template)
+    client.port_down(s for s in subscribers(10))
+    assert len(client.store) == 110
+
+    client.socket.shutdown(socket.SHUT_RDWR)
+    assert client.resynced.wait(5)
+    assert wait_for(lambda: server.counters()["sessions"] == 1)
+    session = list(server.sessions.values())[0]
+    assert wait_for(lambda: session.ports_up == 110)
+    assert "0.0.0.0 eth 119" in session.ports
+    assert "0.0.0.0 eth 0" not in session.ports
+    client.disconnect()
+
+
+def test_server_disconnect_backoff(server):
+    client = Client(address="127.0.0.1", port=server.port)
+    client.auto_reconnect(backoff=10.0, jitter=0)
+    assert client.connect()
+    client.socket.shutdown(socket.SHUT_RDWR)
+    assert wait_for(lambda: client.socket.fileno() == -1)
+    # no RSTACK is sent on the closed socket while waiting for reconnect
+    client.disconnect()
+    assert not client._thread.is_alive()
+    assert client.reconnects == 0
+
+
+def test_server_rstack_reconnect(server):
+    client = Client(address="127.0.0.1", port=server.port)
+    client.auto_reconnect(backoff=0.05)
+    assert client.connect()
+    client.port_up(subscribers(10))
+    assert wait_for(lambda: len(server.established()) == 1)
+    session = server.established()[0]
+
+    def reset():
+        session._send_rstack()
+        session.transport.write(session.data_to_send())
+
+    # NAS initiated reset
+    server._loop.call_soon_threadsafe(reset)
+    assert client.resynced.wait(5)
+    assert client.reconnects == 1
+    assert client._thread.is_alive()
+    assert wait_for(lambda: server.counters()["accepted"] == 2)
+    assert wait_for(lambda: server.counters()["sessions"] == 1)
+    session = list(server.sessions.values())[0]
+    assert wait_for(lambda: session.ports_up == 10)
+    client.disconnect()
+    assert not client._thread.is_alive()
+
+
+def test_server_rstack(server):
+    client = Client(address="127.0.0.1", port=server.port)
+    assert client.connect()
+    assert wait_for(lambda: len(server.established()) == 1)
+    session = server.established()[0]
+
+    def reset():
+        session._send_rstack()
+        session.transport.write(session.data_to_send())
+
+    server._loop.call_soon_threadsafe(reset)
+    # connection is closed without reconnect
+    assert wait_for(lambda: not client._thread.is_alive())
+    assert not client.is_established()
+    assert client.socket.fileno() == -1
+    assert wait_for(lambda: server.counters()["sessions"] == 0)
+    client.disconnect()
+
+
+def test_server_stop_connected():
+    server = Server(port=0)
+    server.start()
+    client = Client(address="127.0.0.1", port=server.port)
+    assert client.connect()
+    start = time.time()
+    server.stop()
+    assert time.time() - start < 2
+    # connections are closed by the server
+    assert wait_for(lambda: not client._thread.is_alive())
+    client.disconnect()
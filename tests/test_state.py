@@ -0,0 +1,144 @@
+"""ANCP State Store Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.state import *
+from ancp.subscriber import Subscriber, LineState
+from ancp.table import SubscriberTable, numpy
+from ancp.template import FrameTemplate
+from tests.helpers import subscribers
+import pytest
+
+
+class RecordingClient(object):
+    def __init__(self):
+        self.up = []
+        self.down = []
+
+    def port_up(self, subscribers):
+        self.up.extend(s.aci for s in subscribers)
+
+    def port_down(self, subscribers):
+        self.down.extend(s.aci for s in subscribers)
+
+
+def test_state_store():
+    client = RecordingClient()
+    store = StateStore(client)
+    subs = subscribers(10)
+    diff = store.sync(subs)
+    assert len(diff.up) == 10 and diff.down == []
+    assert len(store) == 10
+    assert "0.0.0.0 eth 0" in store
+
+    # nothing changed
+    client.up = []
+    assert not store.sync(subs)
+    assert client.up == []
+
+    # changed rate and state, removed and new port
+    subs[1].down = 8000
+    subs[2].state = LineState.IDLE
+    desired = subs[1:] + [Subscriber(aci="0.0.0.0 eth 10")]
+    diff = store.diff(desired)
+    assert len(diff.up) == 3 and len(diff.down) == 1
+    # diff is not recorded until sent or applied
+    assert len(store.diff(desired).up) == 3
+    store.sync(desired)
+    assert client.up == ["0.0.0.0 eth 1", "0.0.0.0 eth 2", "0.0.0.0 eth 10"]
+    assert client.down == ["0.0.0.0 eth 0"]
+    assert len(store) == 10
+    assert not store.diff(desired)
+
+    # changed attributes of an unchanged subscriber object
+    desired[0].up = 2048
+    assert [s.aci for s in store.diff(desired).up] == ["0.0.0.0 eth 1"]
+
+    store.clear()
+    assert len(store.diff(desired).up) == 10
+
+
+@pytest.mark.parametrize("use_numpy", [False, pytest.param(True, marks=pytest.mark.skipif(
+    numpy is None, reason="numpy not installed"))])
+def test_state_store_table(use_numpy):
+    client = RecordingClient()
+    store = StateStore(client)
+    table = SubscriberTable.from_subscribers(subscribers(10), use_numpy=use_numpy)
+    assert len(store.sync(table).up) == 10
+    assert not store.diff(table)
+
+    table.update(3, up=2048)
+    table.update(5, ari="remote-id")
+    desired = table.take(range(1, 10))
+    diff = store.sync(desired)
+    assert isinstance(diff.up, SubscriberTable)
+    assert list(diff.up.aci) == ["0.0.0.0 eth 3", "0.0.0.0 eth 5"]
+    assert diff.up[0].up == 2048
+    assert client.down == ["0.0.0.0 eth 0"]
+    assert not store.diff(desired)
+
+
+def test_state_store_record():
+    store = StateStore(RecordingClient())
+    subs = subscribers(4)
+    table = SubscriberTable.from_subscribers(subscribers(8)[4:])
+    store.record(subs)
+    store.record(subs[0], up=False)
+    store.record(table[1:])
+    store.record(table[3:], up=False)
+    assert len(store) == 5
+    active = store.active()
+    assert [s.aci for s in active[0]] == ["0.0.0.0 eth 1", "0.0.0.0 eth 2", "0.0.0.0 eth 3"]
+    assert list(active[1].aci) == ["0.0.0.0 eth 5", "0.0.0.0 eth 6"]
+    # recorded state is not sent again
+    assert len(store.diff(subs[1:]).up) == 0
+
+
+@pytest.mark.parametrize("use_numpy", [False, pytest.param(True, marks=pytest.mark.skipif(
+    numpy is None, reason="numpy not installed"))])
+def test_state_store_snapshot(use_numpy):
+    store = StateStore(RecordingClient())
+    subs = subscribers(4)
+    table = SubscriberTable.from_subscribers(subscribers(8)[4:], use_numpy=use_numpy)
+    store.record(subs)
+    store.record(table[1:])
+    # changes after port up do not change the announced state
+    table.update(2, up=2048, ari="remote-id")
+    table.update(3, aci="0.0.0.0 eth 10")
+    subs[1].down = 8000
+    active = store.active()
+    assert [s.down for s in active[0]] == [16000] * 4
+    assert list(active[1].aci) == ["0.0.0.0 eth 5", "0.0.0.0 eth 6", "0.0.0.0 eth 7"]
+    assert active[1][1].up == 1024 and active[1][1].ari is None
+    assert store._subscriber("0.0.0.0 eth 1").down == 16000
+    # changed subscribers are sent again
+    assert [s.aci for s in store.diff(subs).up] == ["0.0.0.0 eth 1"]
+    diff = store.diff(table)
+    assert list(diff.up.aci) == ["0.0.0.0 eth 4", "0.0.0.0 eth 6", "0.0.0.0 eth 10"]
+    store.apply(diff)
+    table.update(0, up=4096)
+    assert store._subscriber("0.0.0.0 eth 4").up == 1024
+
+
+def test_state_store_template():
+    store = StateStore(RecordingClient())
+    subs = subscribers(4)
+    store.record(FrameTemplate(subs))
+    assert len(store) == 4
+    # recorded frames are equal to the encoded subscribers
+    assert not store.diff(subs)
+    assert store.active()[0][2].tlvs == subs[2].tlvs
+    store.record(FrameTemplate(subs[:2]), up=False)
+    assert len(store) == 2
+
+
+def test_state_store_record_invalid():
+    store = StateStore(RecordingClient())
+    subs = subscribers(3)
+    # invalid entries are skipped by the encoder and not recorded
+    store.record([subs[0], "invalid", None, subs[1]])
+    assert len(store) == 2
+    store.record(["invalid", subs[0]], up=False)
+    assert list(store._ports) == ["0.0.0.0 eth 1"]
+    assert len(store.diff(subs[1:]).up) == 1
@@ -5,6 +5,7 @@ SPDX-License-Identifier: MIT
 """
 from ancp.subscriber import *
 import pytest
+import struct
 
 
 def test_access_loop_enc():
@@ -63,3 +64,17 @@ def test_subscriber_aaci_bin_exception():
         S1 = Subscriber(aci="0.0.0.0 eth 0", aaci_bin=[128, 7])
     with pytest.raises(ValueError):
         S1 = Subscriber(aci="0.0.0.0 eth 0", aaci_bin=(128, "7"))
+
+
+def test_subscriber_tlvs_cache():
+    S1 = Subscriber(aci="0.0.0.0 eth 0", up=1024, down=2048)
+    tlvs = S1.tlvs
+    assert S1.tlvs is tlvs
+    S1.up = 768
+    assert S1.tlvs is not tlvs
+    assert struct.unpack_from("!HHI", S1.tlvs[1], 48)[2] == 768
+    tlvs = S1.tlvs
+    S1.aaci_bin = (128, 7)
+    assert S1.tlvs[0] == tlvs[0] + 1
+    S1.up = None
+    assert len(S1.tlvs[1]) == len(tlvs[1]) + 12 - 8
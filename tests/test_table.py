@@ -0,0 +1,64 @@
+"""ANCP Subscriber Table Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.protocol import MessageType, TechTypes
+from ancp.subscriber import *
+from ancp.table import SubscriberTable, numpy
+from tests.helpers import TxProtocol
+import pytest
+
+
+def subscribers():
+    return [
+        Subscriber(aci="0.0.0.0 eth 1", up=1024, down=16000),
+        Subscriber(aci="0.0.0.0 eth 12", ari="A.B.C", aaci_bin=(128, 7), aaci_ascii="128", up=None),
+        Subscriber(aci="0.0.0.0 eth 123", aaci_bin=5, state=LineState.IDLE, down=None,
+                   min_up=128, min_down=256, att_up=2040, att_down=4090, max_up=2048, max_down=4096,
+                   dsl_type=DslType.VDSL2, encap1=Encap1.UNTAGGED_ETHERNET, encap2=Encap2.EOAAL5_LLC_FCS),
+        Subscriber(aci="0.0.0.0 eth 1234", ari="remote-id"),
+    ]
+
+
+@pytest.mark.parametrize("use_numpy", [False, pytest.param(True, marks=pytest.mark.skipif(
+    numpy is None, reason="numpy not installed"))])
+def test_table_encode(use_numpy):
+    subs = subscribers() * 3
+    table = SubscriberTable.from_subscribers(subs, use_numpy=use_numpy)
+    assert table.numpy == use_numpy
+    assert len(table) == 12
+
+    expected = TxProtocol()
+    expected.port_up(subs)
+    protocol = TxProtocol()
+    protocol.port_up(table)
+    assert protocol.data_to_send() == expected.data_to_send()
+    assert protocol.transaction_id == expected.transaction_id
+
+    # slices
+    expected.port_down(subs[5:9])
+    protocol.port_down(table[5:9])
+    assert protocol.data_to_send() == expected.data_to_send()
+    assert protocol.transaction_id == expected.transaction_id
+    with pytest.raises(ValueError):
+        protocol.port_down(table[9:5])
+
+
+@pytest.mark.parametrize("use_numpy", [False, pytest.param(True, marks=pytest.mark.skipif(
+    numpy is None, reason="numpy not installed"))])
+def test_table_update(use_numpy):
+    table = SubscriberTable(capacity=1, use_numpy=use_numpy)
+    table.append("0.0.0.0 eth 1", up=1024, down=16000)
+    table.append("0.0.0.0 eth 2", aaci_bin=(1, 2))
+    table.update(0, state=LineState.IDLE, up=None, ari="A.B.C")
+    table.update(1, aci="0.0.0.0 eth 22", aaci_bin=None)
+    S1, S2 = table[0], table[-1]
+    assert (S1.aci, S1.state, S1.up, S1.down, S1.ari) == ("0.0.0.0 eth 1", LineState.IDLE, None, 16000, "A.B.C")
+    assert (S2.aci, S2.aaci_bin) == ("0.0.0.0 eth 22", None)
+    assert table.encode(MessageType.PORT_UP, TechTypes.DSL, 50, 1)[1] == \
+        SubscriberTable.from_subscribers([S1, S2], use_numpy=use_numpy).encode(MessageType.PORT_UP, TechTypes.DSL, 50, 1)[1]
+    with pytest.raises(ValueError):
+        table.update(0, aaci_bin="1")
+    with pytest.raises(IndexError):
+        table[2]
@@ -0,0 +1,64 @@
+"""ANCP Frame Template Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.template import *
+from ancp.subscriber import Subscriber, LineState
+from ancp.table import SubscriberTable, numpy
+from tests.helpers import TxProtocol
+import pytest
+
+
+def subscribers():
+    return [
+        Subscriber(aci="0.0.0.0 eth 1", up=1024, down=16000),
+        Subscriber(aci="0.0.0.0 eth 12", ari="A.B.C", aaci_bin=(128, 7), aaci_ascii="128", up=None),
+        Subscriber(aci="0.0.0.0 eth 123", aaci_bin=5, down=None, min_up=128, max_down=4096),
+    ] * 50
+
+
+USE_NUMPY = [False, pytest.param(True, marks=pytest.mark.skipif(numpy is None, reason="numpy not installed"))]
+
+
+@pytest.mark.parametrize("use_numpy", USE_NUMPY)
+@pytest.mark.parametrize("from_table", [False, True])
+def test_template(use_numpy, from_table):
+    subs = subscribers()
+    source = SubscriberTable.from_subscribers(subs, use_numpy=use_numpy) if from_table else subs
+    template = FrameTemplate(source, use_numpy=use_numpy)
+    assert len(template) == 150
+    assert template.aci[1] == "0.0.0.0 eth 12"
+
+    expected = TxProtocol()
+    protocol = TxProtocol()
+    protocol.chunk_size = 1024
+    for _ in range(2):
+        # flap
+        expected.port_up(subs)
+        protocol.port_up(template)
+        for s in subs:
+            s.state = LineState.IDLE
+        expected.port_down(subs)
+        template.set_state(LineState.IDLE)
+        protocol.port_down(template)
+        for s in subs:
+            s.state = LineState.SHOWTIME
+        template.set_state(LineState.SHOWTIME)
+    assert protocol.transaction_id == expected.transaction_id
+    assert protocol.data_to_send() == expected.data_to_send()
+
+
+@pytest.mark.parametrize("use_numpy", USE_NUMPY)
+def test_template_ack_all(use_numpy):
+    subs = subscribers()
+    template = FrameTemplate(subs, use_numpy=use_numpy)
+    expected = TxProtocol()
+    expected.ack_all(window=16)
+    expected.port_up(subs)
+    protocol = TxProtocol()
+    protocol.ack_all(window=16)
+    protocol.port_up(template)
+    assert protocol.data_to_send() == expected.data_to_send()
+    assert len(protocol.transactions) == 150
+    assert protocol.transactions[2].aci == "0.0.0.0 eth 12"
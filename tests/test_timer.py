@@ -0,0 +1,150 @@
+"""ANCP Timer Wheel Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.timer import *
+from ancp.protocol import monotonic
+from ancp.client import Client
+from ancp.metrics import Metrics
+from ancp.protocol import AdjacencyState
+from ancp.server import Server
+from ancp.subscriber import Subscriber
+from tests.helpers import wait_for
+from threading import Thread
+import time
+
+
+def test_timer_wheel():
+    wheel = TimerWheel(resolution=0.01, slots=16, levels=3)
+    now = wheel._tick * wheel.resolution
+    fired = []
+    for delay in (0.05, 0.02, 0.5, 3.0, 100.0):
+        wheel.schedule(now + delay, fired.append, delay)
+    assert len(wheel) == 5
+    assert wheel.advance(now + 0.01) == 0
+    assert wheel.advance(now + 0.065) == 2
+    assert fired == [0.02, 0.05]
+    # timers of higher levels are cascaded
+    assert wheel.advance(now + 2.999) == 1
+    assert wheel.advance(now + 3.01) == 1
+    assert fired == [0.02, 0.05, 0.5, 3.0]
+    # timer beyond the last level
+    assert wheel.advance(now + 99.99) == 0
+    assert wheel.advance(now + 100.01) == 1
+    assert len(wheel) == 0
+    assert wheel.next_expiry() is None
+
+
+def test_timer_wheel_cascade_boundary():
+    wheel = TimerWheel(resolution=1.0, slots=4, levels=3)
+    fired = []
+    # due exactly at the tick level 1 is cascaded into level 0
+    level1 = (wheel._tick // 4 + 2) * 4
+    level2 = (wheel._tick // 16 + 2) * 16
+    wheel.schedule(float(level1), fired.append, level1)
+    wheel.schedule(float(level2), fired.append, level2)
+    assert wheel._counts[1] == 1 and wheel._counts[2] == 1
+    assert wheel.advance(level1 - 1) == 0
+    assert wheel.advance(level1) == 1
+    assert wheel.advance(level2 - 1) == 0
+    assert wheel.advance(level2) == 1
+    assert fired == [level1, level2]
+
+
+def test_timer_wheel_cancel():
+    wheel = TimerWheel()
+    now = monotonic()
+    fired = []
+    t1 = wheel.schedule(now + 1.0, fired.append, 1)
+    t2 = wheel.schedule(now + 300.0, fired.append, 2)
+    assert t1.active and t2.active
+    t1.cancel()
+    t2.cancel()
+    assert not t1.active
+    assert len(wheel) == 0
+    assert wheel.advance(now + 400.0) == 0
+    assert fired == []
+
+
+def test_timer_wheel_next_expiry():
+    wheel = TimerWheel(resolution=0.01, slots=16, levels=3)
+    now = wheel._tick * wheel.resolution
+    wheel.schedule(now + 0.055, lambda: None)
+    # expiry is rounded up to the next tick
+    assert abs(wheel.next_expiry() - (now + 0.06)) < 1e-6
+    wheel = TimerWheel(resolution=0.01, slots=16, levels=3)
+    now = wheel._tick * wheel.resolution
+    wheel.schedule(now + 10.0, lambda: None)
+    # wake up for cascade at the latest after one rotation of level 0
+    assert wheel.next_expiry() <= now + 0.16 + 1e-6
+
+
+def test_timer_wheel_thread():
+    wheel = TimerWheel()
+    wheel.start()
+    try:
+        fired = []
+        start = monotonic()
+        wheel.schedule(start + 0.2, lambda: fired.append(monotonic()))
+        wheel.schedule(start + 0.05, lambda: fired.append(monotonic()))
+        time.sleep(0.4)
+        assert len(fired) == 2
+        assert fired[0] >= start + 0.05
+        assert fired[1] >= start + 0.2
+    finally:
+        wheel.stop()
+
+
+def test_client_keepalive():
+    server = Server(port=0, timer=0.2)
+    server.start()
+    try:
+        client = Client(address="127.0.0.1", port=server.port, timer=0.2)
+        assert client.connect()
+        time.sleep(0.1)
+        received = server.counters()["rx_messages"]
+        # keep-alive SYN messages are sent from the shared timer wheel
+        time.sleep(0.5)
+        assert server.counters()["rx_messages"] >= received + 2
+        assert client._timer.active
+        assert client._timer._wheel is shared_wheel()
+        client.disconnect()
+        assert client._timer is None
+    finally:
+        server.stop()
+
+
+def test_client_keepalive_blocked_peer():
+    server = Server(port=0, timer=0.2)
+    server.start()
+    try:
+        blocked = Client(address="127.0.0.1", port=server.port, timer=0.2)
+        client = Client(address="127.0.0.1", port=server.port, timer=0.2)
+        client.metrics = Metrics()
+        assert blocked.connect() and client.connect()
+        session = [s for s in server.established() if s.receiver_name == blocked.sender_name][0]
+        # NAS stops reading, so port up blocks in send holding the transmit lock
+        server._loop.call_soon_threadsafe(session.transport.pause_reading)
+        subs = [Subscriber(aci="0.0.0.0 eth %d" % i, up=1024, down=16000) for i in range(100000)]
+        thread = Thread(target=blocked.port_up, args=(subs,))
+        thread.daemon = True
+        thread.start()
+        time.sleep(0.2)
+        assert thread.is_alive()
+        # keep-alives of other clients are not blocked by the shared timer wheel
+        keepalives = client.metrics.keepalives
+        time.sleep(0.6)
+        assert client.metrics.keepalives >= keepalives + 2
+        assert client.state == AdjacencyState.ESTAB
+        # deferred keep-alives are sent in order with the port up messages
+        server._loop.call_soon_threadsafe(session.transport.resume_reading)
+        thread.join(10)
+        assert not thread.is_alive()
+        assert wait_for(lambda: session.port_up_count == 100000, timeout=10)
+        assert wait_for(lambda: not blocked._deferred)
+        assert server.counters()["errors"] == 0
+        blocked.disconnect()
+        client.disconnect()
+    finally:
+        server.stop()
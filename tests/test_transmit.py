@@ -0,0 +1,157 @@
+"""ANCP Transmit Queue Tests
+
+Copyright (C) 2017-2024, Christian Giese (GIC-de)
+SPDX-License-Identifier: MIT
+"""
+from ancp.transmit import *
+from ancp import codec
+from ancp.client import Client
+from ancp.metrics import Metrics
+from ancp.protocol import AdjacencyState, MessageType, MessageCode
+from tests.helpers import TxProtocol, wait_for, subscribers
+from threading import Thread
+import socket
+import time
+import pytest
+
+
+def receive(sock, nbytes):
+    data = bytearray()
+    while len(data) < nbytes:
+        b = sock.recv(65536)
+        if not b:
+            break
+        data += b
+    return bytes(data)
+
+
+@pytest.fixture
+def pair():
+    a, b = socket.socketpair()
+    for s in (a, b):
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    yield a, b
+    a.close()
+    b.close()
+
+
+def test_priority(pair):
+    a, b = pair
+    tx = TransmitQueue(a, max_write=8000)
+    for _ in range(1000):
+        tx.put(b"B" * 1000)
+    # writer is blocked as the peer does not receive
+    assert wait_for(lambda: tx.writes > 0 or tx.pending < 1000000)
+    tx.put(b"C" * 10, priority=True)
+    data = receive(b, 1000010)
+    assert tx.flush(timeout=5)
+    assert len(data) == 1000010
+    index = data.index(b"C")
+    # sent before queued bulk data at a message boundary
+    assert index % 1000 == 0
+    assert index < 500000
+    assert data.count(b"C") == 10
+    # small messages are coalesced
+    assert tx.frames == 1001
+    assert tx.writes < 200
+    tx.close()
+
+
+def test_high_water(pair):
+    a, b = pair
+    tx = TransmitQueue(a, high_water=10000, max_write=1000)
+    done = []
+
+    def producer():
+        for _ in range(100):
+            tx.put(b"B" * 1000)
+        done.append(True)
+
+    thread = Thread(target=producer)
+    thread.start()
+    time.sleep(0.2)
+    # producer waits for the peer
+    assert not done
+    assert tx.pending <= 10000
+    # adjacency messages are not blocked by high water
+    tx.put(b"C", priority=True)
+    assert len(receive(b, 100001)) == 100001
+    thread.join(5)
+    assert done
+    tx.close()
+
+
+def test_error(pair):
+    a, b = pair
+    tx = TransmitQueue(a)
+    b.close()
+    with pytest.raises(socket.error):
+        for _ in range(100):
+            tx.put(b"B" * 100000)
+            time.sleep(0.01)
+    assert tx.error is not None
+    tx.close()
+
+
+
+def test_error_callback(pair):
+    a, b = pair
+
+    def on_write(data, seconds):
+        raise ValueError("callback failed")
+
+    tx = TransmitQueue(a, on_write=on_write)
+    tx.put(b"A" * 100)
+    assert tx.flush(timeout=5.0)
+    assert isinstance(tx.error, ValueError)
+    with pytest.raises(ValueError):
+        tx.put(b"B" * 100)
+    tx.close()
+
+
+def test_client_transmit_queue(server):
+    client = Client(address="127.0.0.1", port=server.port, timer=0.2)
+    client.metrics = Metrics()
+    client.transmit_queue(high_water=65536, max_write=16384)
+    assert client.connect()
+    assert client.tx_queue is not None
+    subs = subscribers(2000)
+    client.port_up(subs)
+    client.port_down(subs[:100])
+    assert wait_for(lambda: server.counters()["port_down"] == 100)
+    assert server.counters()["port_up"] == 2000
+    # keep-alives
+    time.sleep(0.5)
+    assert client.state == AdjacencyState.ESTAB
+    assert client.metrics.keepalives > 0
+    assert client.metrics.send_latency.count == client.tx_queue.writes
+    client.disconnect()
+    assert client.tx_queue is None
+    assert server.counters()["errors"] == 0
+
+
+def test_priority_large_bulk(pair):
+    a, b = pair
+    tx = TransmitQueue(a, max_write=8000)
+    protocol = TxProtocol()
+    protocol.port_up(subscribers(20000))
+    bulk = protocol.data_to_send()
+    # single bulk buffer (e.g. port up chunk) much larger than max_write
+    tx.put(bulk)
+    assert wait_for(lambda: tx.pending < len(bulk))
+    keepalive = codec.mkadjac(3, MessageType.ADJACENCY, 250, 0, MessageCode.SYN, b"\0" * 6, b"\0" * 6,
+                              0, 0, 0, 0, [])
+    tx.put(keepalive, priority=True)
+    data = receive(b, len(bulk) + len(keepalive))
+    assert tx.flush(timeout=5)
+    assert len(data) == len(bulk) + len(keepalive)
+    # keep-alive is sent at a message boundary after the write in progress
+    off = 0
+    while data[off + 5] != MessageType.ADJACENCY:
+        off += 4 + codec.HEADER.unpack_from(data, off)[1]
+    assert off < 32000
+    assert data[off:off + len(keepalive)] == keepalive
+    assert data[:off] + data[off + len(keepalive):] == bulk
+    assert tx.writes > len(bulk) // 8000
+    tx.close()